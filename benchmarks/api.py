@@ -0,0 +1,381 @@
+"""Upload, archive, list and auth benchmarks of the files API on local stand-ins.
+
+Runs the application in process through httpx's ASGI transport with SQLite
+(aiosqlite) in place of Postgres and an in-memory cache backend in place of
+Redis, so neither service is needed. Reports upload MB/s by file size,
+archive MB/s per compression type, /files/list latency by files per user and
+the cost of each authentication tier as JSON:
+
+    python benchmarks/api.py --upload-sizes 4 256 4096 --list-sizes 100 1000 10000 --output release.json
+    python benchmarks/api.py --compare before.json after.json
+
+Absolute numbers are not comparable with Postgres, compare runs of this script
+on the same machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+OWN_SCRATCH = 'BENCH_SCRATCH' not in os.environ
+if OWN_SCRATCH:
+    os.environ['BENCH_SCRATCH'] = tempfile.mkdtemp(prefix='files_api_bench_')
+SCRATCH = os.environ['BENCH_SCRATCH']
+os.makedirs(os.path.join(SCRATCH, 'files'), exist_ok=True)
+os.environ.update({
+    'BASE_DIR': SCRATCH,
+    'FILES_BASE_DIR': os.path.join(SCRATCH, 'files'),
+    'BLOBS_DIR': os.path.join(SCRATCH, 'files', '.blobs'),
+    'UPLOADS_DIR': os.path.join(SCRATCH, 'files', '.uploads'),
+    'ARCHIVE_CACHE_DIR': os.path.join(SCRATCH, 'files', '.archives'),
+    'JOBS_DIR': os.path.join(SCRATCH, 'files', '.jobs'),
+    'LOG_FILE': os.path.join(SCRATCH, 'bench.log'),
+})
+for name, value in {
+    'SECRET_KEY': 'benchmark', 'ALGORITHM': 'HS256', 'TOKEN_EXPIRE': '60', 'TITLE': 'benchmark',
+    'APP_NAME': 'benchmark', 'APP_HOST': '127.0.0.1', 'APP_PORT': '8080', 'STATIC_URL': 'http://127.0.0.1/files',
+    'DATABASE_DSN': 'postgresql+asyncpg://benchmark@127.0.0.1/benchmark', 'REDIS_URL': 'redis://127.0.0.1:6379',
+    'LOCAL_REDIS_URL': 'redis://127.0.0.1:6379', 'REDIS_HOST': '127.0.0.1', 'REDIS_PORT': '6379',
+    'ARCHIVE_CACHE_ENABLED': 'false', 'RATE_LIMIT_ENABLED': 'false', 'LOG_LEVEL': 'WARNING',
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi_cache import caches  # noqa: E402
+from fastapi_cache.backends.redis import CACHE_KEY  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.dialects.postgresql import UUID  # noqa: E402
+from sqlalchemy.dialects.postgresql.base import PGCompiler  # noqa: E402
+from sqlalchemy.dialects.sqlite.base import SQLiteCompiler  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+from sqlalchemy.ext.compiler import compiles  # noqa: E402
+from sqlalchemy.sql.functions import Function  # noqa: E402
+
+from auth_load import register, summarize  # noqa: E402
+from src.core.settings import settings  # noqa: E402
+from src.db.database import create_sessionmaker, get_session  # noqa: E402
+from src.main import app  # noqa: E402
+from src.models.models import Base, File, User  # noqa: E402
+from src.services.auth import get_user_cache_key, user_cache  # noqa: E402
+from src.utils.executor import compression_executor  # noqa: E402
+from src.utils.files import bump_list_version  # noqa: E402
+
+
+SQLiteCompiler.returning_clause = PGCompiler.returning_clause
+
+
+@compiles(UUID, 'sqlite')
+def compile_uuid(element, compiler, **kw):
+    return 'CHAR(32)'
+
+
+@compiles(Function, 'sqlite')
+def compile_function(element, compiler, **kw):
+    if element.name.lower() == 'greatest':
+        return 'max{}'.format(compiler.process(element.clause_expr, **kw))
+    return compiler.visit_function(element, **kw)
+
+
+class MemoryCacheBackend:
+    """Stand-in for RedisCacheBackend keeping keys in a dict."""
+
+    def __init__(self):
+        self._data: dict = {}
+
+    def _load(self, key):
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] < time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    async def add(self, key, value, **kwargs) -> bool:
+        if self._load(key) is not None:
+            return False
+        return await self.set(key, value, **kwargs)
+
+    async def get(self, key, default=None, encoding='utf-8', **kwargs):
+        item = self._load(key)
+        if item is None:
+            return default
+        value = item[0]
+        return value.decode(encoding) if encoding else value
+
+    async def set(self, key, value, expire: int = 0, **kwargs) -> bool:
+        if isinstance(value, str):
+            value = value.encode()
+        elif not isinstance(value, bytes):
+            value = str(value).encode()
+        self._data[key] = (value, time.monotonic() + expire if expire else None)
+        return True
+
+    async def exists(self, *keys) -> bool:
+        return any(self._load(key) is not None for key in keys)
+
+    async def delete(self, key) -> bool:
+        return self._data.pop(key, None) is not None
+
+    async def expire(self, key, ttl: int) -> bool:
+        item = self._load(key)
+        if item is not None:
+            self._data[key] = (item[0], time.monotonic() + ttl)
+        return item is not None
+
+    async def flush(self) -> None:
+        self._data.clear()
+
+    async def close(self) -> None:
+        pass
+
+
+async def setup():
+    engine = create_async_engine('sqlite+aiosqlite:///{}'.format(os.path.join(SCRATCH, 'bench.db')),
+                                 connect_args={'timeout': 60})
+
+    @event.listens_for(engine.sync_engine, 'connect')
+    def set_pragmas(connection, _):
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    sessions = create_sessionmaker(engine)
+
+    async def get_bench_session():
+        async with sessions() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_bench_session
+    caches.set(CACHE_KEY, MemoryCacheBackend())
+    compression_executor.start()
+    return engine, sessions
+
+
+async def timed_request(send) -> tuple[float, int, int]:
+    started = time.perf_counter()
+    response = await send()
+    return time.perf_counter() - started, response.status_code, len(response.content)
+
+
+async def bench_upload(client: httpx.AsyncClient, sizes: list[int], count: int, concurrency: int) -> list[dict]:
+    results = []
+    semaphore = asyncio.Semaphore(concurrency)
+    for size in sizes:
+        payloads = [os.urandom(size * 1024) for _ in range(min(count, 8))]
+
+        async def upload(index: int):
+            async with semaphore:
+                files = {'file': ('file_{}.bin'.format(index), payloads[index % len(payloads)])}
+                return await timed_request(lambda: client.post('/files/upload', params={
+                    'path': '/bench/upload/{}k'.format(size)}, files=files))
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(upload(index) for index in range(count)))
+        elapsed = time.perf_counter() - started
+        results.append(dict(summarize([(latency, status_code) for latency, status_code, _ in timings]),
+                            size_kib=size, files=count, concurrency=concurrency,
+                            mb_per_second=round(size * count / 1024 / elapsed, 2)))
+        print(json.dumps(results[-1]), file=sys.stderr)
+    return results
+
+
+def make_corpus(size: int) -> list[tuple[str, bytes]]:
+    files, written, index = [], 0, 0
+    words = ('INFO', 'WARNING', 'ERROR', 'user', 'path', 'status', 'took', 'upload', 'download')
+    while written < size:
+        if index % 4 == 3:
+            data = os.urandom(256 * 1024)
+            name = 'blob_{}.bin'.format(index)
+        else:
+            data = '\n'.join(' '.join(random.choices(words, k=12)) for _ in range(4096)).encode()
+            name = 'app_{}.log'.format(index)
+        files.append((name, data))
+        written += len(data)
+        index += 1
+    return files
+
+
+async def bench_archive(client: httpx.AsyncClient, size: int, repeat: int) -> list[dict]:
+    corpus = make_corpus(size * 1024 * 1024)
+    for index, (name, data) in enumerate(corpus):
+        await client.post('/files/upload', params={'path': '/bench/archive/{}'.format(index % 4)},
+                          files={'file': (name, data)})
+    original = sum(len(data) for _, data in corpus)
+    results = []
+    for compression_type in settings.compression_types:
+        timings = [await timed_request(lambda: client.get('/files/download', params={
+            'path': '/bench/archive', 'compression_type': compression_type})) for _ in range(repeat)]
+        seconds = min(latency for latency, _, _ in timings)
+        results.append({
+            'type': compression_type,
+            'statuses': sorted({status_code for _, status_code, _ in timings}),
+            'original': original,
+            'compressed': timings[-1][2],
+            'seconds': round(seconds, 4),
+            'mb_per_second': round(original / seconds / 1024 / 1024, 2),
+        })
+        print(json.dumps(results[-1]), file=sys.stderr)
+    return results
+
+
+async def seed_files(sessions, user_id: uuid.UUID, count: int) -> None:
+    created_at = datetime.utcnow()
+    table = File.__table__
+    async with sessions() as db:
+        for start in range(0, count, 5000):
+            await db.execute(table.insert(), [{
+                'id': uuid.uuid1(), 'user_id': user_id, 'name': 'file_{}.txt'.format(index),
+                'path': '/bench/list/{}/{}/file_{}.txt'.format(user_id, index // 1000, index), 'size': index,
+                'is_downloadable': True, 'created_at': created_at - timedelta(seconds=index),
+            } for index in range(start, min(start + 5000, count))])
+        await db.commit()
+
+
+async def bench_list(client: httpx.AsyncClient, sessions, sizes: list[int], requests: int) -> list[dict]:
+    results = []
+    for count in sizes:
+        username = 'bench_list_{}'.format(uuid.uuid4().hex[:8])
+        headers = {'Authorization': 'Bearer ' + await register(client, username, username)}
+        async with sessions() as db:
+            user_id = (await db.execute(User.__table__.select().where(User.username == username))).first().id
+        await seed_files(sessions, user_id, count)
+        redis_cache = caches.get(CACHE_KEY)
+        report = {'files': count}
+        for phase, params in (('first_page', {}), ('by_size', {'sort': '-size'}),
+                              ('path_prefix', {'path_prefix': '/bench/list/{}/0/'.format(user_id)})):
+            uncached, cached = [], []
+            for _ in range(requests):
+                await bump_list_version(redis_cache=redis_cache, user_id=user_id)
+                uncached.append((await timed_request(lambda: client.get('/files/list', params=params,
+                                                                        headers=headers)))[:2])
+                cached.append((await timed_request(lambda: client.get('/files/list', params=params,
+                                                                      headers=headers)))[:2])
+            report[phase] = {'uncached': summarize(uncached), 'cached': summarize(cached)}
+        results.append(report)
+        print(json.dumps(report), file=sys.stderr)
+    return results
+
+
+async def bench_auth(client: httpx.AsyncClient, requests: int) -> dict:
+    username = 'bench_auth_{}'.format(uuid.uuid4().hex[:8])
+    token = await register(client, username, username)
+    headers = {'Authorization': 'Bearer ' + token}
+    redis_cache = caches.get(CACHE_KEY)
+    cache_key = get_user_cache_key(username)
+
+    async def drop_local():
+        user_cache.delete(cache_key)
+
+    async def drop_all():
+        user_cache.delete(cache_key)
+        await redis_cache.delete(cache_key)
+
+    async def keep():
+        pass
+
+    phases = (
+        ('invalid_token', keep, lambda: client.get('/user/status', headers={'Authorization': 'Bearer invalid'})),
+        ('local_cache', keep, lambda: client.get('/user/status', headers=headers)),
+        ('redis_cache', drop_local, lambda: client.get('/user/status', headers=headers)),
+        ('database', drop_all, lambda: client.get('/user/status', headers=headers)),
+        ('login', keep, lambda: client.post('/auth/auth', json={'username': username, 'password': username})),
+    )
+    report = {}
+    for phase, prepare, send in phases:
+        results = []
+        for _ in range(requests if phase != 'login' else max(1, requests // 10)):
+            await prepare()
+            results.append((await timed_request(send))[:2])
+        report[phase] = summarize(results)
+        print(json.dumps({phase: report[phase]}), file=sys.stderr)
+    return report
+
+
+async def run(args: argparse.Namespace) -> dict:
+    engine, sessions = await setup()
+    try:
+        async with httpx.AsyncClient(app=app, base_url='http://127.0.0.1:8080/api/v1', timeout=600) as client:
+            username = 'bench_{}'.format(uuid.uuid4().hex[:8])
+            client.headers['Authorization'] = 'Bearer ' + await register(client, username, username)
+            report = {
+                'label': args.label,
+                'created_at': datetime.utcnow().isoformat(),
+                'python': sys.version.split()[0],
+                'cpus': os.cpu_count(),
+                'upload': await bench_upload(client, args.upload_sizes, args.upload_files, args.concurrency),
+                'archive': await bench_archive(client, args.archive_size, args.repeat),
+            }
+            del client.headers['Authorization']
+            report['list'] = await bench_list(client, sessions, args.list_sizes, args.requests)
+            report['auth'] = await bench_auth(client, args.requests)
+    finally:
+        compression_executor.shutdown()
+        await engine.dispose()
+        if OWN_SCRATCH:
+            shutil.rmtree(SCRATCH, ignore_errors=True)
+    return report
+
+
+def compare(before_path: str, after_path: str) -> dict:
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    def ratio(old: float, new: float) -> float:
+        return round(new / old, 2) if old else 0.0
+
+    return {
+        'upload_mb_per_second': {
+            str(new['size_kib']): ratio(old['mb_per_second'], new['mb_per_second'])
+            for old, new in zip(before['upload'], after['upload']) if old['size_kib'] == new['size_kib']
+        },
+        'archive_mb_per_second': {
+            new['type']: ratio(old['mb_per_second'], new['mb_per_second'])
+            for old, new in zip(before['archive'], after['archive']) if old['type'] == new['type']
+        },
+        'list_p50_ms': {
+            str(new['files']): ratio(old['first_page']['uncached']['p50_ms'], new['first_page']['uncached']['p50_ms'])
+            for old, new in zip(before['list'], after['list']) if old['files'] == new['files']
+        },
+        'auth_p50_ms': {
+            phase: ratio(before['auth'][phase]['p50_ms'], after['auth'][phase]['p50_ms'])
+            for phase in after['auth'] if phase in before['auth']
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--label', default='current')
+    parser.add_argument('--upload-sizes', type=int, nargs='*', default=[4, 256, 4096], help='KiB per uploaded file')
+    parser.add_argument('--upload-files', type=int, default=50, help='files uploaded per size')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent uploads')
+    parser.add_argument('--archive-size', type=int, default=32, help='MiB of the archived directory')
+    parser.add_argument('--list-sizes', type=int, nargs='*', default=[100, 1000, 10000], help='files per user')
+    parser.add_argument('--requests', type=int, default=50, help='requests per list and auth phase')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args()
+    if args.compare:
+        print(json.dumps(compare(*args.compare), indent=2))
+        return
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
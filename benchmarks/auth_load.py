@@ -0,0 +1,91 @@
+"""Latency of /files/list while /auth/token is under load.
+
+Run against an application started with RATE_LIMIT_ENABLED=false, otherwise
+the login load is answered with 429:
+
+    python benchmarks/auth_load.py --url http://127.0.0.1:8080/api/v1 --logins 32 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def register(client: httpx.AsyncClient, username: str, password: str) -> str:
+    await client.post('/register/', json={'username': username, 'password': password})
+    response = await client.post('/auth/auth', json={'username': username, 'password': password})
+    response.raise_for_status()
+    return response.json()['access_token']
+
+
+async def login_loop(client: httpx.AsyncClient, username: str, password: str, deadline: float, results: list) -> None:
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        response = await client.post('/auth/token', data={'username': username, 'password': password})
+        results.append((time.monotonic() - started, response.status_code))
+
+
+async def list_loop(client: httpx.AsyncClient, token: str, deadline: float, results: list) -> None:
+    headers = {'Authorization': 'Bearer ' + token}
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        response = await client.get('/files/list', headers=headers)
+        results.append((time.monotonic() - started, response.status_code))
+
+
+def summarize(results: list) -> dict:
+    latencies = [latency * 1000 for latency, _ in results]
+    statuses = {}
+    for _, status_code in results:
+        statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+    return {
+        'requests': len(results),
+        'statuses': statuses,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+    }
+
+
+async def run(url: str, logins: int, listers: int, duration: float) -> dict:
+    username = 'bench_{}'.format(uuid.uuid4().hex[:8])
+    password = username
+    limits = httpx.Limits(max_connections=logins + listers + 1)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        token = await register(client, username, password)
+        report = {}
+        for phase, login_workers in (('idle', 0), ('login_load', logins)):
+            deadline = time.monotonic() + duration
+            login_results, list_results = [], []
+            await asyncio.gather(
+                *(login_loop(client, username, password, deadline, login_results) for _ in range(login_workers)),
+                *(list_loop(client, token, deadline, list_results) for _ in range(listers)),
+            )
+            report[phase] = {'files_list': summarize(list_results), 'auth_token': summarize(login_results)}
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080/api/v1')
+    parser.add_argument('--logins', type=int, default=32, help='concurrent /auth/token clients')
+    parser.add_argument('--listers', type=int, default=4, help='concurrent /files/list clients')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per phase')
+    args = parser.parse_args()
+    report = asyncio.run(run(args.url, args.logins, args.listers, args.duration))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
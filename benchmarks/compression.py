@@ -0,0 +1,127 @@
+"""Throughput and ratio of every archive type in COMPRESSION_TYPE.
+
+Generates representative corpora in a scratch directory (text logs, already
+compressed/random data, and a copy of this repository's sources), archives
+each corpus with every compression type and level, and reports MB/s of input
+and compressed/original ratio as JSON:
+
+    python benchmarks/compression.py --size 64 --levels 1 6 9 --repeat 3
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.files import COMPRESSION_LEVELS, COMPRESSION_TYPE  # noqa: E402
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILE_SIZE = 1024 * 1024
+
+
+class CountingWriter(io.RawIOBase):
+    def __init__(self):
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        return len(data)
+
+
+def make_logs(path: str, size: int) -> None:
+    levels = ('INFO', 'INFO', 'INFO', 'WARNING', 'ERROR')
+    for index in range(max(1, size // FILE_SIZE)):
+        with open(os.path.join(path, 'app_{}.log'.format(index)), 'w') as file:
+            written = 0
+            while written < FILE_SIZE:
+                line = '2026-10-18 12:{:02d}:{:02d} {} user={} path=/files/{}.txt status={} took={}ms\n'.format(
+                    random.randrange(60), random.randrange(60), random.choice(levels), random.randrange(1000),
+                    random.randrange(100000), random.choice((200, 200, 201, 404)), random.randrange(500))
+                written += file.write(line)
+
+
+def make_random(path: str, size: int) -> None:
+    for index in range(max(1, size // FILE_SIZE)):
+        with open(os.path.join(path, 'blob_{}.bin'.format(index)), 'wb') as file:
+            file.write(os.urandom(FILE_SIZE))
+
+
+def make_sources(path: str, size: int) -> None:
+    sources = [os.path.join(root, name) for root, _, names in os.walk(os.path.join(ROOT, 'src'))
+               for name in names if name.endswith('.py')]
+    copied, index = 0, 0
+    while copied < size:
+        source = sources[index % len(sources)]
+        shutil.copyfile(source, os.path.join(path, '{}_{}'.format(index, os.path.basename(source))))
+        copied += os.path.getsize(source)
+        index += 1
+
+
+CORPORA = {
+    'logs': make_logs,
+    'random': make_random,
+    'sources': make_sources,
+}
+
+
+def get_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def measure(full_path: str, compression_type: str, level, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        writer = CountingWriter()
+        started = time.perf_counter()
+        COMPRESSION_TYPE[compression_type](writer, full_path, level)
+        timings.append(time.perf_counter() - started)
+    return {'seconds': min(timings), 'compressed': writer.size}
+
+
+def run(size: int, levels: list[int], types: list[str], repeat: int) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for corpus, make in CORPORA.items():
+            full_path = os.path.join(scratch, corpus)
+            os.makedirs(full_path)
+            make(full_path, size * 1024 * 1024)
+            original = get_size(full_path)
+            for compression_type in types:
+                lowest, highest = COMPRESSION_LEVELS[compression_type]
+                for level in [None, *(level for level in levels if lowest <= level <= highest)]:
+                    result = measure(full_path, compression_type, level, repeat)
+                    results.append({
+                        'corpus': corpus,
+                        'type': compression_type,
+                        'level': level,
+                        'original': original,
+                        'compressed': result['compressed'],
+                        'ratio': round(result['compressed'] / original, 4),
+                        'mb_per_second': round(original / result['seconds'] / 1024 / 1024, 1),
+                    })
+                    print(json.dumps(results[-1]), file=sys.stderr)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=64, help='MiB per corpus')
+    parser.add_argument('--levels', type=int, nargs='*', default=[1, 6, 9])
+    parser.add_argument('--types', nargs='*', default=list(COMPRESSION_TYPE), choices=list(COMPRESSION_TYPE))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.size, args.levels, args.types, args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
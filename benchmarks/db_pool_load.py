@@ -0,0 +1,84 @@
+"""Requests per second of DB-bound routes under concurrency, with pool usage.
+
+Start the application with one engine profile, run the script, then restart
+with the other profile and run it again:
+
+    DB_ECHO=true DB_POOL_SIZE=5 DB_MAX_OVERFLOW=10 DB_STATEMENT_CACHE_SIZE=0 uvicorn src.main:app --port 8080
+    python benchmarks/db_pool_load.py --label before --output before.json
+
+    uvicorn src.main:app --port 8080
+    python benchmarks/db_pool_load.py --label after --output after.json
+
+    python benchmarks/db_pool_load.py --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+from auth_load import register, summarize
+
+
+ROUTES = ('/ping/', '/files/list')
+
+
+async def route_loop(client: httpx.AsyncClient, route: str, headers: dict, deadline: float, results: list) -> None:
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        response = await client.get(route, headers=headers)
+        results.append((time.monotonic() - started, response.status_code))
+
+
+async def run(url: str, clients: int, duration: float) -> dict:
+    username = 'bench_{}'.format(uuid.uuid4().hex[:8])
+    limits = httpx.Limits(max_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        headers = {'Authorization': 'Bearer ' + await register(client, username, username)}
+        report = {}
+        for route in ROUTES:
+            results = []
+            deadline = time.monotonic() + duration
+            await asyncio.gather(*(route_loop(client, route, headers, deadline, results) for _ in range(clients)))
+            report[route] = dict(summarize(results), rps=round(len(results) / duration, 1))
+        report['pool'] = (await client.get('/ping/db')).json()
+    return report
+
+
+def compare(before_path: str, after_path: str) -> dict:
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    return {
+        route: {
+            'rps_before': before['routes'][route]['rps'],
+            'rps_after': after['routes'][route]['rps'],
+            'speedup': round(after['routes'][route]['rps'] / max(before['routes'][route]['rps'], 0.1), 2),
+        }
+        for route in ROUTES
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080/api/v1')
+    parser.add_argument('--clients', type=int, default=64, help='concurrent clients per route')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per route')
+    parser.add_argument('--label', default='run')
+    parser.add_argument('--output', help='also write the report to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two saved reports')
+    args = parser.parse_args()
+    if args.compare:
+        print(json.dumps(compare(*args.compare), indent=2))
+        return
+    routes = asyncio.run(run(args.url, args.clients, args.duration))
+    report = {'label': args.label, 'clients': args.clients, 'pool': routes.pop('pool'), 'routes': routes}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,30 @@
 from fastapi import APIRouter, Depends
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi_cache.backends.redis import RedisCacheBackend
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.db.database import get_session
 from src.schemes import user
 from src.services.auth import get_token
+from src.utils.cache import redis_cache
 
 
 router = APIRouter()
 
 
 @router.post('/token', response_model=user.TokenUI)
-async def get_access_token(*, db: AsyncSession = Depends(get_session), form: OAuth2PasswordRequestForm = Depends()):
-    access_token = await get_token(db=db, username=form.username, password=form.password)
+async def get_access_token(*, db: AsyncSession = Depends(get_session), form: OAuth2PasswordRequestForm = Depends(),
+                           redis_cache: RedisCacheBackend = Depends(redis_cache)):
+    access_token = await get_token(db=db, redis_cache=redis_cache, username=form.username, password=form.password)
     logger.info('Send token for %s', form.username)
     return access_token
 
 
 @router.post('/auth', response_model=user.Token)
-async def get_token_for_user(*, db: AsyncSession = Depends(get_session), obj: user.UserAuth):
+async def get_token_for_user(*, db: AsyncSession = Depends(get_session), obj: user.UserAuth,
+                             redis_cache: RedisCacheBackend = Depends(redis_cache)):
     username, password = obj.username, obj.password
-    access_token = await get_token(db=db, username=username, password=password)
+    access_token = await get_token(db=db, redis_cache=redis_cache, username=username, password=password)
     logger.info('Send token for %s', username)
     return access_token
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from . import auth, files, ping, register
+from . import auth, directories, files, jobs, ping, register, user
 
 
 router = APIRouter()
@@ -12,4 +12,10 @@ router.include_router(register.router, prefix='/register', tags=['register'])
 
 router.include_router(files.router, prefix='/files', tags=['files'])
 
+router.include_router(directories.router, prefix='/directories', tags=['directories'])
+
+router.include_router(jobs.router, prefix='/jobs', tags=['jobs'])
+
+router.include_router(user.router, prefix='/user', tags=['user'])
+
 router.include_router(ping.router, prefix='/ping', tags=['ping'])
\ No newline at end of file
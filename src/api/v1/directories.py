@@ -0,0 +1,43 @@
+from typing import Any, Optional
+
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.logger import logger
+from src.db.database import get_session
+from src.schemes import directory, user
+from src.services.auth import get_current_user
+from src.utils.files import (get_children_etag, get_directory_by_ref, get_directory_children, get_directory_listing,
+                             get_listing_etag)
+from src.utils.response import etag_matches
+
+
+router = APIRouter()
+
+
+@router.get('/stats', response_model=directory.DirectoryListing,
+            description='Size, file count and last modification of a directory and of its subdirectories.')
+async def get_directory_stats(*, path: str = '/', db: AsyncSession = Depends(get_session),
+                              current_user: user.CurrentUser = Depends(get_current_user)) -> Any:
+    listing = await get_directory_listing(db=db, path=path, user=current_user)
+    logger.info('Stats of directory %s for %s', path, current_user.id)
+    return listing
+
+
+@router.get('/{directory_id}/children', response_model=directory.DirectoryChildren,
+            description='Immediate subdirectories and files of a directory, or of root, page by page.')
+async def get_children(*, directory_id: str, request: Request, response: Response,
+                       limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                       db: AsyncSession = Depends(get_session),
+                       current_user: user.CurrentUser = Depends(get_current_user)) -> Any:
+    directory_obj = await get_directory_by_ref(db=db, directory_ref=directory_id, user=current_user)
+    etag = get_children_etag(directory=directory_obj, user_id=current_user.id, limit=limit, cursor=cursor)
+    if etag and etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    listing = await get_directory_children(db=db, directory=directory_obj, user=current_user, limit=limit, cursor=cursor)
+    etag = etag or get_listing_etag(listing)
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    response.headers['ETag'] = etag
+    logger.info('Children of directory %s for %s', directory_id, current_user.id)
+    return listing
@@ -1,64 +1,171 @@
-from typing import Any, Optional
+from datetime import datetime
+from typing import Any, List, Optional, Union
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
-from fastapi.responses import StreamingResponse, RedirectResponse
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import RedirectResponse
 from fastapi_cache.backends.redis import RedisCacheBackend
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.core.settings import settings
 from src.db.database import get_session
-from src.schemes import file, user
+from src.schemes import file, upload, user
 from src.services.auth import get_current_user
 from src.services.base import file_crud
-from src.utils.cache import get_cache, set_cache, get_cache_or_data, redis_cache
-from src.utils.files import get_file_data, is_downloadable, get_updated_io_obj_with_media_type
+from src.utils.bulk import commit_entries, extract_archive, extract_upload, forget_bulk_entries, save_uploads
+from src.utils.cache import delete_cache, get_cache_or_data, redis_cache
+from src.utils.files import (bump_list_version, check_path, get_archive_response, get_file_data, get_files_page,
+                             get_file_info_key, is_downloadable, search_files, WalkOptions)
+from src.utils.response import get_file_response
+from src.utils.upload import (assemble_upload, create_upload_session, get_upload_session, get_upload_status,
+                              release_upload, remove_session, write_chunk)
+from src.utils.usage import QuotaCheckedRoute, check_content_length, check_quota
 
 
 router = APIRouter()
+upload_router = APIRouter(route_class=QuotaCheckedRoute, dependencies=[Depends(check_content_length)])
 
 
 @router.get('/list', response_model=file.FilesList, description='Files list of current user.')
 async def get_list(*, db: AsyncSession = Depends(get_session), current_user: user.CurrentUser = Depends(get_current_user),
-                   redis_cache: RedisCacheBackend = Depends(redis_cache)) -> Any:
-    redis_key = 'list_for_{str()}'.format(current_user.id)
-    cache_data = await get_cache(redis_cache, redis_key)
-    if not cache_data:
-        files = await file_crud.get_list_by_user(db=db, user=current_user)
-        files_list = [file.File.from_orm(file).dict() for file in files]
-        cache_data = {'current_user_id': current_user.id, 'files': files_list}
-        await set_cache(redis_cache, cache_data, redis_key)
+                   redis_cache: RedisCacheBackend = Depends(redis_cache), limit: int = Query(100, ge=1, le=1000),
+                   cursor: Optional[str] = None, sort: str = Query('-created_at', regex=file.SORT_PATTERN),
+                   path_prefix: Optional[str] = None, min_size: Optional[int] = Query(None, ge=0),
+                   max_size: Optional[int] = Query(None, ge=0), created_from: Optional[datetime] = None,
+                   created_to: Optional[datetime] = None) -> Any:
+    query = file.FilesQuery(limit=limit, cursor=cursor, sort=sort, path_prefix=path_prefix, min_size=min_size,
+                            max_size=max_size, created_from=created_from, created_to=created_to)
+    cache_data = await get_files_page(db=db, redis_cache=redis_cache, user=current_user, query=query)
     logger.info('List of files of %s', current_user.id)
     return cache_data
 
 
-@router.post('/upload', response_model=file.FileDB, status_code=status.HTTP_201_CREATED, description='Upload file.')
+@router.get('/search', response_model=file.FilesSearch, description='Search files of current user by path.')
+async def search(*, pattern: str = Query(..., min_length=1), mode: str = Query('prefix', regex=file.SEARCH_MODE_PATTERN),
+                 limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None, db: AsyncSession = Depends(get_session),
+                 current_user: user.CurrentUser = Depends(get_current_user)) -> Any:
+    result = await search_files(db=db, user=current_user, mode=mode, pattern=pattern, limit=limit, cursor=cursor)
+    logger.info('Search %s %s of %s', mode, pattern, current_user.id)
+    return result
+
+
+@upload_router.post('/upload', response_model=Union[file.FileDB, file.BulkResult], status_code=status.HTTP_201_CREATED,
+                    description='Upload file, or unpack tar or zip archive into path with extract.')
 async def upload_file(*, path: str, db: AsyncSession = Depends(get_session), current_user: user.CurrentUser = Depends(get_current_user),
-                      file: UploadFile = File(...)) -> Any:
-    if not path.startswith('/'):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Path must starts with / .')
+                      file: UploadFile = File(...), extract: bool = False,
+                      redis_cache: RedisCacheBackend = Depends(redis_cache)) -> Any:
+    path = check_path(path)
+    if extract:
+        entries = await extract_upload(upload=file, base=path)
+        results = await commit_entries(db=db, user=current_user, entries=entries)
+        await forget_bulk_entries(redis_cache=redis_cache, user_id=current_user.id, entries=results)
+        logger.info('Upload archive %s with %s files to %s from %s', file.filename, len(results), path, current_user.id)
+        return {'entries': results}
     if path.split('/')[-1] == file.filename:
         full_path = path
     else:
-        full_path = path + '/' + file.filename
-    result = await file_crud.create_or_put_file(db=db, user=current_user, file_obj=file, file_path=full_path)
+        full_path = check_path(path.rstrip('/') + '/' + file.filename)
+        if full_path == path:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='File name is not allowed.')
+    result = await file_crud.create_or_put_file(db=db, user=current_user, file=file, file_path=full_path)
+    await bump_list_version(redis_cache=redis_cache, user_id=current_user.id)
+    await delete_cache(redis_cache, get_file_info_key(full_path))
     logger.info('Upload file %s from %s', full_path, current_user.id)
     return result
 
 
-@router.get('/download', status_code=status.HTTP_200_OK, description='Download file.')
+@upload_router.post('/bulk', response_model=file.BulkResult, status_code=status.HTTP_201_CREATED, description='Upload many files.')
+async def bulk_upload(*, path: str, db: AsyncSession = Depends(get_session), current_user: user.CurrentUser = Depends(get_current_user),
+                      files: List[UploadFile] = File(...), redis_cache: RedisCacheBackend = Depends(redis_cache)) -> Any:
+    path = check_path(path)
+    entries = await save_uploads(files=files, base=path)
+    results = await commit_entries(db=db, user=current_user, entries=entries)
+    await forget_bulk_entries(redis_cache=redis_cache, user_id=current_user.id, entries=results)
+    logger.info('Bulk upload of %s files to %s from %s', len(results), path, current_user.id)
+    return {'entries': results}
+
+
+@upload_router.post('/bulk/archive', response_model=file.BulkResult, status_code=status.HTTP_201_CREATED,
+                    description='Upload tar or zip archive and unpack it.')
+async def bulk_upload_archive(*, path: str, archive_type: str = Query(..., regex='^(tar|zip)$'), request: Request,
+                              db: AsyncSession = Depends(get_session), current_user: user.CurrentUser = Depends(get_current_user),
+                              redis_cache: RedisCacheBackend = Depends(redis_cache)) -> Any:
+    path = check_path(path)
+    entries = await extract_archive(stream=request.stream(), base=path, archive_type=archive_type)
+    results = await commit_entries(db=db, user=current_user, entries=entries)
+    await forget_bulk_entries(redis_cache=redis_cache, user_id=current_user.id, entries=results)
+    logger.info('Bulk archive upload of %s files to %s from %s', len(results), path, current_user.id)
+    return {'entries': results}
+
+
+@router.post('/uploads', response_model=upload.UploadSession, status_code=status.HTTP_201_CREATED,
+             description='Start chunked upload.')
+async def start_upload(*, obj: upload.UploadSessionCreate, db: AsyncSession = Depends(get_session),
+                       current_user: user.CurrentUser = Depends(get_current_user)) -> Any:
+    await check_quota(db=db, user_id=current_user.id, incoming=obj.size, path=obj.path)
+    session = await create_upload_session(user_id=current_user.id, obj=obj)
+    logger.info('Start upload %s of %s from %s', session['id'], obj.path, current_user.id)
+    return await get_upload_status(session=session)
+
+
+@router.get('/uploads/{upload_id}', response_model=upload.UploadSession, description='Chunked upload status.')
+async def get_upload(*, upload_id: UUID, current_user: user.CurrentUser = Depends(get_current_user)) -> Any:
+    session = await get_upload_session(session_id=upload_id, user_id=current_user.id)
+    return await get_upload_status(session=session)
+
+
+@router.put('/uploads/{upload_id}/chunks/{index}', status_code=status.HTTP_204_NO_CONTENT, description='Upload chunk.')
+async def upload_chunk(*, upload_id: UUID, index: int, request: Request,
+                       current_user: user.CurrentUser = Depends(get_current_user)) -> None:
+    session = await get_upload_session(session_id=upload_id, user_id=current_user.id)
+    await write_chunk(session=session, index=index, stream=request.stream())
+
+
+@router.post('/uploads/{upload_id}/commit', response_model=file.FileDB, status_code=status.HTTP_201_CREATED,
+             description='Commit chunked upload.')
+async def commit_upload(*, upload_id: UUID, db: AsyncSession = Depends(get_session),
+                        current_user: user.CurrentUser = Depends(get_current_user),
+                        redis_cache: RedisCacheBackend = Depends(redis_cache)) -> Any:
+    session = await get_upload_session(session_id=upload_id, user_id=current_user.id)
+    assembled_file = await assemble_upload(session=session)
+    try:
+        result = await file_crud.create_or_put_file(db=db, user=current_user, file=assembled_file,
+                                                    file_path=session['path'])
+    except BaseException:
+        await release_upload(session=session)
+        raise
+    await remove_session(session_id=upload_id)
+    await bump_list_version(redis_cache=redis_cache, user_id=current_user.id)
+    await delete_cache(redis_cache, get_file_info_key(session['path']))
+    logger.info('Commit upload %s of %s from %s', upload_id, session['path'], current_user.id)
+    return result
+
+
+@router.api_route('/download', methods=['GET', 'HEAD'], status_code=status.HTTP_200_OK, description='Download file.')
 async def download_file(*, db: AsyncSession = Depends(get_session), current_user: user.CurrentUser = Depends(get_current_user),
-                        path: str, compression_type: Optional[str], redis_cache: RedisCacheBackend = Depends(redis_cache)) -> Any:
+                        path: str, compression_type: Optional[str] = None, level: Optional[int] = None,
+                        include: List[str] = Query([]), exclude: List[str] = Query([]),
+                        max_depth: Optional[int] = Query(None, ge=0), request: Request,
+                        redis_cache: RedisCacheBackend = Depends(redis_cache)) -> Any:
     if not compression_type:
-        redis_key = 'file_info_for_{}'.format(path)
-        file_data = await get_cache_or_data(redis_key=redis_key, cache=redis_cache,db_func_obj=get_file_data,
-                                            data_schema=file.File, db_func_args=(db, path))
+        file_data = await get_cache_or_data(redis_key=get_file_info_key(path), redis_cache=redis_cache, db_obj=get_file_data,
+                                            data_schema=file.File, db_args=(db, path))
         is_downloadable(file_data=file_data)
-        file_url = settings.static_url + file_data.get('path')
-        return RedirectResponse(file_url)
+        if settings.download_mode == 'redirect':
+            file_url = settings.static_url + file_data.get('path')
+            return RedirectResponse(file_url)
+        if str(file_data.get('user_id')) != str(current_user.id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
+        logger.info('User %s download file %s', current_user.id, path)
+        return await get_file_response(file_data=file_data, request=request)
     if compression_type not in settings.compression_types:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Compression type is not supported.')
-    updated_io_obj, media_type = await get_updated_io_obj_with_media_type(db=db, redis_cache=redis_cache, path=path, compression_type=compression_type)
-    file_name = 'archive' + '.' + compression_type
+    response = await get_archive_response(db=db, redis_cache=redis_cache, path=path, compression_type=compression_type,
+                                          level=level, request=request,
+                                          options=WalkOptions(tuple(include), tuple(exclude), max_depth))
     logger.info('User %s download file %s', current_user.id, path)
-    return StreamingResponse(iter([updated_io_obj.getvalue()]), media_type=media_type, headers={"Content-Disposition": f'attachment;filename={file_name}'})
+    return response
+
+
+router.include_router(upload_router)
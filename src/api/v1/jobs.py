@@ -0,0 +1,86 @@
+import asyncio
+import os
+import uuid
+from typing import Any, List, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi_cache.backends.redis import RedisCacheBackend
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.logger import logger
+from src.core.settings import settings
+from src.db.database import get_session
+from src.schemes import job, user
+from src.services.auth import get_current_user
+from src.utils.cache import redis_cache
+from src.utils.files import check_compression_level, check_path, resolve_archive_path
+from src.utils.jobs import PRIORITY_PATTERN, job_queue, load_job, remove_job_files, save_job_input
+from src.utils.response import RangeFileResponse
+from src.utils.usage import QuotaCheckedRoute, check_content_length
+
+
+router = APIRouter()
+upload_router = APIRouter(route_class=QuotaCheckedRoute, dependencies=[Depends(check_content_length)])
+
+
+@router.post('/archive', response_model=job.Job, status_code=status.HTTP_202_ACCEPTED,
+             description='Queue an archive of a file or directory.')
+async def submit_archive(*, path: str, compression_type: str, level: Optional[int] = None,
+                         include: List[str] = Query([]), exclude: List[str] = Query([]),
+                         max_depth: Optional[int] = Query(None, ge=0),
+                         priority: str = Query('normal', regex=PRIORITY_PATTERN), db: AsyncSession = Depends(get_session),
+                         current_user: user.CurrentUser = Depends(get_current_user),
+                         redis_cache: RedisCacheBackend = Depends(redis_cache)) -> Any:
+    if compression_type not in settings.compression_types:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Compression type is not supported.')
+    check_compression_level(compression_type=compression_type, level=level)
+    path = await resolve_archive_path(db=db, redis_cache=redis_cache, path=path)
+    params = {'path': path, 'compression_type': compression_type, 'level': level, 'include': include,
+              'exclude': exclude, 'max_depth': max_depth}
+    queued = await job_queue.submit(user=current_user, kind='archive', params=params, priority=priority)
+    logger.info('Queue archive job %s of %s from %s', queued['id'], path, current_user.id)
+    return load_job(queued)
+
+
+@upload_router.post('/bulk/archive', response_model=job.Job, status_code=status.HTTP_202_ACCEPTED,
+                    description='Upload tar or zip archive and unpack it in the background.')
+async def submit_bulk_archive(*, path: str, archive_type: str = Query(..., regex='^(tar|zip)$'), request: Request,
+                              priority: str = Query('normal', regex=PRIORITY_PATTERN),
+                              current_user: user.CurrentUser = Depends(get_current_user)) -> Any:
+    path = check_path(path)
+    job_id = str(uuid.uuid4())
+    try:
+        size = await save_job_input(job_id=job_id, stream=request.stream())
+        queued = await job_queue.submit(user=current_user, kind='bulk_archive', params={'path': path,
+                                        'archive_type': archive_type}, priority=priority, job_id=job_id, total=size)
+    except BaseException:
+        await asyncio.to_thread(remove_job_files, job_id)
+        raise
+    logger.info('Queue bulk archive job %s to %s from %s', job_id, path, current_user.id)
+    return load_job(queued)
+
+
+@router.get('/{job_id}', response_model=job.Job, description='Job status and progress.')
+async def get_job(*, job_id: UUID, current_user: user.CurrentUser = Depends(get_current_user)) -> Any:
+    return load_job(await job_queue.get(job_id=str(job_id), user_id=current_user.id))
+
+
+@router.api_route('/{job_id}/result', methods=['GET', 'HEAD'], description='Download the result of a finished job.')
+async def get_job_result(*, job_id: UUID, request: Request,
+                         current_user: user.CurrentUser = Depends(get_current_user)) -> Any:
+    found = await job_queue.get(job_id=str(job_id), user_id=current_user.id)
+    if found['status'] != 'done':
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Job is {}.'.format(found['status']))
+    if not found.get('result_path'):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Job has no file result.')
+    try:
+        stat_result = await asyncio.to_thread(os.stat, found['result_path'])
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail='Job result expired.')
+    logger.info('User %s download result of job %s', current_user.id, job_id)
+    return RangeFileResponse(full_path=found['result_path'], stat_result=stat_result, etag='"{}"'.format(job_id),
+                             filename=found['filename'], request=request, media_type=found['media_type'])
+
+
+router.include_router(upload_router)
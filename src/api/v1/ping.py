@@ -1,13 +1,12 @@
 from datetime import datetime
 
-import redis.asyncio
-
 from fastapi import APIRouter, status
 
 from src.core.logger import logger
-from src.core.settings import settings
-from src.db.database import engine
+from src.db.database import engine, get_pool_stats
 from src.schemes import ping
+from src.services.auth import get_user_cache_stats
+from src.utils.cache import cache_invalidator, local_cache
 
 
 router = APIRouter()
@@ -19,10 +18,19 @@ async def send_ping():
     async with engine.begin() as conn:
         delta_db = datetime.utcnow()
     total_seconds = (delta_db - start_time_db).total_seconds()
-    redis_connection = redis.asyncio.Redis(host=settings.redis_host, port=settings.redis_port, decode_responses=True)
     start_time_redis = datetime.utcnow()
-    await redis_connection.ping()
+    await cache_invalidator.client.ping()
     delta_time_redis = datetime.utcnow()
     total_seconds_redis = (delta_time_redis - start_time_redis).total_seconds()
     logger.info('Send ping.')
     return {'db': total_seconds, 'redis': total_seconds_redis}
+
+
+@router.get('/cache', status_code=status.HTTP_200_OK, description='Hit and miss counters of the user cache.')
+async def send_cache_stats():
+    return {'local': local_cache.stats(), 'users': get_user_cache_stats()}
+
+
+@router.get('/db', status_code=status.HTTP_200_OK, description='Connection pool usage and checkout wait time.')
+async def send_pool_stats():
+    return get_pool_stats()
@@ -1,22 +1,27 @@
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi_cache.backends.redis import RedisCacheBackend
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.logger import logger
 from src.db.database import get_session
 from src.schemes import user as user_schema
+from src.services.auth import invalidate_user
 from src.services.base import user_crud
+from src.utils.cache import redis_cache
 
 
 router = APIRouter()
 
 
 @router.post('/', response_model=user_schema.UserRegisterResponse, status_code=status.HTTP_201_CREATED)
-async def create_user(*, db: AsyncSession = Depends(get_session), user: user_schema.UserRegister) -> Any:
+async def create_user(*, db: AsyncSession = Depends(get_session), user: user_schema.UserRegister,
+                      redis_cache: RedisCacheBackend = Depends(redis_cache)) -> Any:
     user_obj = await user_crud.get_user_by_username(db=db, obj=user)
     if user_obj:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='User with this username exists.')
     user = await user_crud.create(db=db, obj=user)
+    await invalidate_user(redis_cache=redis_cache, username=user.username)
     logger.info('Created user - %s', user.username)
     return user
@@ -0,0 +1,21 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db.database import get_session
+from src.schemes import user
+from src.services.auth import get_current_user
+from src.utils.usage import get_usage
+
+
+router = APIRouter()
+
+
+@router.get('/status', response_model=user.UserStatus, description='Disk usage and quota of current user.')
+async def get_status(*, db: AsyncSession = Depends(get_session),
+                     current_user: user.CurrentUser = Depends(get_current_user)) -> Any:
+    usage = await get_usage(db=db, user_id=current_user.id)
+    if usage is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
+    return usage
@@ -1,8 +1,89 @@
+import atexit
+import contextvars
 import logging
+import queue
+import random
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 
+import orjson
+from starlette.types import ASGIApp, Receive, Scope, Send
 
-def get_logger(logger_name: str, log_level: str = 'INFO') -> logging.Logger:
+from src.core.settings import settings
+
+
+request_path: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('request_path', default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'function': record.funcName,
+            'line': record.lineno,
+        }
+        path = getattr(record, 'request_path', None)
+        if path:
+            payload['path'] = path
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return orjson.dumps(payload).decode()
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self._rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        path = request_path.get()
+        record.request_path = path
+        if path is None or record.levelno > logging.INFO:
+            return True
+        for prefix, rate in self._rates:
+            if path.startswith(prefix):
+                return random.random() < rate
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogContextMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        token = request_path.set(scope['path'])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_path.reset(token)
+
+
+def get_handlers(log_level: str) -> list[logging.Handler]:
     logger_config = {
         'version': 1,
         'disable_existing_loggers': False,
@@ -10,25 +91,28 @@ def get_logger(logger_name: str, log_level: str = 'INFO') -> logging.Logger:
             'default': {
                 'format': '[%(filename)s:%(lineno)s - %(funcName)20s()] %(asctime)s %(message)s'
             },
+            'json': {
+                '()': JsonFormatter,
+            },
         },
         'handlers': {
             'console': {
                 'level': log_level,
-                'formatter': 'default',
+                'formatter': settings.log_format,
                 'class': 'logging.StreamHandler',
                 'stream': 'ext://sys.stderr',
             },
             'file': {
                 'level': log_level,
                 'class': 'logging.handlers.RotatingFileHandler',
-                'formatter': 'default',
-                'filename': 'log_file.log',
+                'formatter': settings.log_format,
+                'filename': settings.log_file,
                 'maxBytes': 500000,
                 'backupCount': 10
             }
         },
         'loggers': {
-            '': {
+            'log_pipeline': {
                 'handlers': ['file', 'console'],
                 'level': log_level,
                 'propagate': False
@@ -38,9 +122,32 @@ def get_logger(logger_name: str, log_level: str = 'INFO') -> logging.Logger:
 
     dictConfig(logger_config)
 
+    return logging.getLogger('log_pipeline').handlers
+
+
+def get_logger(logger_name: str, log_level: str = 'INFO') -> logging.Logger:
+    global queue_handler, queue_listener
+    if queue_listener is None:
+        queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+        queue_handler.addFilter(SamplingFilter(settings.log_sample_rates))
+        queue_listener = QueueListener(queue_handler.queue, *get_handlers(log_level), respect_handler_level=True)
+        queue_listener.start()
+        atexit.register(queue_listener.stop)
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(log_level)
+        for name, level in settings.log_levels.items():
+            logging.getLogger(name).setLevel(level)
     return logging.getLogger(logger_name)
 
 
-LOG_LEVEL = 'DEBUG'
+def get_log_stats() -> dict:
+    if queue_handler is None:
+        return {}
+    return {'queued': queue_handler.queue.qsize(), 'dropped': queue_handler.dropped}
+
+
+queue_handler: Optional[DroppingQueueHandler] = None
+queue_listener: Optional[QueueListener] = None
 
-logger = get_logger('root', LOG_LEVEL)
+logger = get_logger('root', settings.log_level)
@@ -0,0 +1,108 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by route.',
+                            ['method', 'route', 'status'], buckets=BUCKETS)
+REQUEST_BYTES = Counter('http_request_bytes', 'Request body bytes by route.', ['route'])
+RESPONSE_BYTES = Counter('http_response_bytes', 'Response body bytes by route.', ['route'])
+STAGE_LATENCY = Histogram('stage_duration_seconds', 'Time spent in a stage of request handling.', ['stage'],
+                          buckets=BUCKETS)
+ARCHIVE_LATENCY = Histogram('archive_duration_seconds', 'Time to stream an archive by compression type.', ['type'],
+                            buckets=BUCKETS)
+ARCHIVE_BYTES = Counter('archive_bytes', 'Compressed bytes streamed by compression type.', ['type'])
+RATE_LIMITED = Counter('http_rate_limited', 'Requests rejected with 429 by limit class and reason.',
+                       ['limit_class', 'reason'])
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - started)
+
+
+class GaugeCollector:
+    def __init__(self):
+        self._gauges: list[tuple[str, str, Callable[[], dict]]] = []
+
+    def add(self, name: str, documentation: str, func: Callable[[], dict]) -> None:
+        self._gauges.append((name, documentation, func))
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        for name, documentation, func in self._gauges:
+            family = GaugeMetricFamily(name, documentation, labels=['state'])
+            for state, value in func().items():
+                family.add_metric([state], value)
+            yield family
+
+
+gauges = GaugeCollector()
+REGISTRY.register(gauges)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes: dict = {}
+
+    def get_route(self, scope: Scope) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        if not self._routes:
+            self._routes = {getattr(route, 'endpoint', getattr(route, 'app', None)): route.path
+                            for route in scope['app'].routes}
+        return self._routes.get(endpoint, 'unmatched')
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        received, sent, status_code = 0, 0, 500
+
+        async def counting_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            received += len(message.get('body', b''))
+            return message
+
+        async def counting_send(message: Message) -> None:
+            nonlocal sent, status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            elif message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            else:
+                sent += message.get('count', 0)
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            route = self.get_route(scope)
+            REQUEST_LATENCY.labels(scope['method'], route, str(status_code)).observe(time.perf_counter() - started)
+            REQUEST_BYTES.labels(route).inc(received)
+            RESPONSE_BYTES.labels(route).inc(sent)
+
+
+def metrics_response() -> Response:
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        registry.register(gauges)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
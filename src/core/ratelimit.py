@@ -0,0 +1,307 @@
+import functools
+import ipaddress
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qs
+
+import orjson
+import redis.asyncio
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.core.logger import logger
+from src.core.metrics import RATE_LIMITED
+from src.core.settings import settings
+from src.services.auth import get_token_username
+
+
+ROUTE_CLASSES = (
+    ('archive', re.compile(r'^/api/v1/files/download$'), 'compression_type'),
+    ('archive', re.compile(r'^/api/v1/jobs/archive$'), None),
+    ('upload', re.compile(r'^/api/v1/(files/(upload|bulk|bulk/archive|uploads.*)|jobs/bulk/archive)$'), None),
+    ('auth', re.compile(r'^/api/v1/(auth/.*|register/?)$'), None),
+    (None, re.compile(r'^/api/v1/ping(/.*)?$'), None),
+    ('default', re.compile(r'^/api/'), None),
+)
+IP_CLASSES = {'auth'}
+
+ADMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local concurrency = tonumber(ARGV[4])
+local route_concurrency = tonumber(ARGV[5])
+if concurrency > 0 and tonumber(redis.call('GET', KEYS[2]) or '0') >= concurrency then
+    return {0, '1', 'concurrency'}
+end
+if route_concurrency > 0 and tonumber(redis.call('GET', KEYS[3]) or '0') >= route_concurrency then
+    return {0, '1', 'route_concurrency'}
+end
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1] or ARGV[3])
+local updated = tonumber(bucket[2] or ARGV[1])
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+if tokens < 1 then
+    return {0, tostring((1 - tokens) / rate), 'rate'}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'updated', ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+for index = 2, 3 do
+    redis.call('INCR', KEYS[index])
+    redis.call('EXPIRE', KEYS[index], ARGV[6])
+end
+return {1, '0', ''}
+"""
+
+RELEASE_SCRIPT = """
+for index = 1, 2 do
+    if redis.call('DECR', KEYS[index]) <= 0 then
+        redis.call('DEL', KEYS[index])
+    end
+end
+return 1
+"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    rate: float
+    burst: int
+    concurrency: int = 0
+    route_concurrency: int = 0
+
+    def __post_init__(self):
+        if self.rate <= 0 or self.burst < 1:
+            raise ValueError('Rate limit needs a positive rate and a burst of at least 1.')
+
+
+def get_limits() -> dict[str, RateLimit]:
+    return {limit_class: RateLimit(**limit) for limit_class, limit in settings.rate_limits.items()}
+
+
+def get_limit_class(scope: Scope) -> Optional[str]:
+    for limit_class, pattern, query_param in ROUTE_CLASSES:
+        if not pattern.match(scope['path']):
+            continue
+        if query_param and not parse_qs(scope.get('query_string', b'').decode('latin-1')).get(query_param):
+            continue
+        return limit_class
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def get_trusted_networks(proxies: tuple[str, ...]) -> tuple:
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in get_trusted_networks(tuple(settings.rate_limit_trusted_proxies)))
+
+
+def get_client_ip(scope: Scope) -> str:
+    client = scope.get('client')
+    address = client[0] if client else 'unknown'
+    if not is_trusted_proxy(address):
+        return address
+    header = settings.rate_limit_client_header.lower().encode('latin-1')
+    for name, value in scope['headers']:
+        if name == header:
+            hops = [hop.strip() for hop in value.decode('latin-1').split(',') if hop.strip()]
+            while hops and is_trusted_proxy(hops[-1]):
+                address = hops.pop()
+            return hops[-1] if hops else address
+    return address
+
+
+def get_client_key(scope: Scope, limit_class: str) -> str:
+    if limit_class not in IP_CLASSES:
+        for name, value in scope['headers']:
+            if name == b'authorization':
+                scheme, _, token = value.decode('latin-1').partition(' ')
+                username = get_token_username(token) if scheme.lower() == 'bearer' else None
+                if username is not None:
+                    return 'user:' + username
+                break
+    return 'ip:' + get_client_ip(scope)
+
+
+class MemoryLimiterStore:
+    def __init__(self):
+        self._buckets: OrderedDict = OrderedDict()
+        self._running: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _prune(self, now: float) -> None:
+        while self._buckets:
+            key, (_, updated, idle) = next(iter(self._buckets.items()))
+            if now - updated < idle:
+                break
+            del self._buckets[key]
+
+    async def admit(self, limit_class: str, client_key: str, limit: RateLimit) -> tuple[float, str]:
+        user_key, route_key = '{}:{}'.format(limit_class, client_key), limit_class
+        if limit.concurrency and self._running.get(user_key, 0) >= limit.concurrency:
+            return 1.0, 'concurrency'
+        if limit.route_concurrency and self._running.get(route_key, 0) >= limit.route_concurrency:
+            return 1.0, 'route_concurrency'
+        now = time.monotonic()
+        self._prune(now)
+        tokens, updated, _ = self._buckets.pop(user_key, (limit.burst, now, 0))
+        tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+        if tokens < 1:
+            self._buckets[user_key] = (tokens, now, limit.burst / limit.rate)
+            return (1 - tokens) / limit.rate, 'rate'
+        self._buckets[user_key] = (tokens - 1, now, limit.burst / limit.rate)
+        for key in (user_key, route_key):
+            self._running[key] = self._running.get(key, 0) + 1
+        return 0.0, ''
+
+    async def release(self, limit_class: str, client_key: str) -> None:
+        for key in ('{}:{}'.format(limit_class, client_key), limit_class):
+            running = self._running.get(key, 0) - 1
+            if running > 0:
+                self._running[key] = running
+            else:
+                self._running.pop(key, None)
+
+
+class RedisLimiterStore:
+    def __init__(self, redis_url: str, prefix: str, fallback: MemoryLimiterStore):
+        self._redis_url = redis_url
+        self._prefix = prefix
+        self._fallback = fallback
+        self._client: Optional[redis.asyncio.Redis] = None
+        self._admit = None
+        self._release = None
+        self._local: Counter = Counter()
+
+    @property
+    def client(self) -> redis.asyncio.Redis:
+        if self._client is None:
+            self._client = redis.asyncio.from_url(self._redis_url, decode_responses=True)
+            self._admit = self._client.register_script(ADMIT_SCRIPT)
+            self._release = self._client.register_script(RELEASE_SCRIPT)
+        return self._client
+
+    def get_keys(self, limit_class: str, client_key: str) -> list[str]:
+        return ['{}:bucket:{}:{}'.format(self._prefix, limit_class, client_key),
+                '{}:running:{}:{}'.format(self._prefix, limit_class, client_key),
+                '{}:running:{}'.format(self._prefix, limit_class)]
+
+    async def admit(self, limit_class: str, client_key: str, limit: RateLimit) -> tuple[float, str]:
+        client = self.client
+        try:
+            admitted, retry_after, reason = await self._admit(
+                keys=self.get_keys(limit_class, client_key),
+                args=[time.time(), limit.rate, limit.burst, limit.concurrency, limit.route_concurrency,
+                      settings.rate_limit_running_ttl],
+                client=client)
+        except redis.RedisError as exc:
+            logger.warning('Rate limiter falls back to the local store: %s', exc)
+            retry_after, reason = await self._fallback.admit(limit_class, client_key, limit)
+            if not retry_after:
+                self._local[limit_class, client_key] += 1
+            return retry_after, reason
+        return (0.0, '') if admitted else (float(retry_after), reason)
+
+    async def release(self, limit_class: str, client_key: str) -> None:
+        if self._local[limit_class, client_key] > 0:
+            self._local[limit_class, client_key] -= 1
+            if not self._local[limit_class, client_key]:
+                del self._local[limit_class, client_key]
+            await self._fallback.release(limit_class, client_key)
+            return
+        try:
+            await self._release(keys=self.get_keys(limit_class, client_key)[1:], client=self.client)
+        except redis.RedisError as exc:
+            logger.warning('Rate limiter slot of %s was not released: %s', client_key, exc)
+
+    async def close(self) -> None:
+        if self._client:
+            await self._client.close()
+            self._client = None
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, RateLimit], store):
+        self._limits = limits
+        self._store = store
+        self.running = 0
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        return {'running': self.running, 'rejected': self.rejected}
+
+    def get_limit(self, limit_class: str) -> Optional[RateLimit]:
+        return self._limits.get(limit_class)
+
+    async def admit(self, limit_class: str, client_key: str) -> tuple[float, str]:
+        retry_after, reason = await self._store.admit(limit_class, client_key, self._limits[limit_class])
+        if retry_after:
+            self.rejected += 1
+            RATE_LIMITED.labels(limit_class, reason).inc()
+        else:
+            self.running += 1
+        return retry_after, reason
+
+    async def release(self, limit_class: str, client_key: str) -> None:
+        self.running -= 1
+        await self._store.release(limit_class, client_key)
+
+    async def close(self) -> None:
+        if isinstance(self._store, RedisLimiterStore):
+            await self._store.close()
+
+
+def create_rate_limiter() -> RateLimiter:
+    store = MemoryLimiterStore()
+    if settings.rate_limit_backend == 'redis':
+        store = RedisLimiterStore(redis_url=settings.redis_url, prefix=settings.rate_limit_prefix, fallback=store)
+    return RateLimiter(limits=get_limits(), store=store)
+
+
+rate_limiter = create_rate_limiter()
+
+
+async def send_too_many_requests(send: Send, retry_after: float, reason: str) -> None:
+    body = orjson.dumps({'detail': 'Too many requests.', 'reason': reason})
+    await send({
+        'type': 'http.response.start',
+        'status': 429,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                    (b'retry-after', str(max(1, math.ceil(retry_after))).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        limit_class = get_limit_class(scope)
+        if limit_class is None or self.limiter.get_limit(limit_class) is None:
+            await self.app(scope, receive, send)
+            return
+        client_key = get_client_key(scope, limit_class)
+        retry_after, reason = await self.limiter.admit(limit_class, client_key)
+        if retry_after:
+            await send_too_many_requests(send, retry_after, reason)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await self.limiter.release(limit_class, client_key)
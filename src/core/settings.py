@@ -17,13 +17,98 @@ class Settings(BaseSettings):
     app_name: Final[str] = Field(..., env='APP_NAME')
     app_host: Final[str] = Field(..., env='APP_HOST')
     app_port: Final[int] = Field(..., env='APP_PORT')
+    log_level: str = Field('INFO', env='LOG_LEVEL')
+    log_levels: dict[str, str] = Field({}, env='LOG_LEVELS')
+    log_format: str = Field('json', env='LOG_FORMAT')
+    log_file: str = Field('log_file.log', env='LOG_FILE')
+    log_queue_size: int = Field(10000, env='LOG_QUEUE_SIZE')
+    log_sample_rates: dict[str, float] = Field({}, env='LOG_SAMPLE_RATES')
+    metrics_enabled: bool = Field(True, env='METRICS_ENABLED')
+    db_echo: bool = Field(False, env='DB_ECHO')
+    db_pool_size: int = Field(10, env='DB_POOL_SIZE')
+    db_max_overflow: int = Field(20, env='DB_MAX_OVERFLOW')
+    db_pool_timeout: float = Field(30, env='DB_POOL_TIMEOUT')
+    db_pool_recycle: int = Field(1800, env='DB_POOL_RECYCLE')
+    db_pool_pre_ping: bool = Field(True, env='DB_POOL_PRE_PING')
+    db_statement_cache_size: int = Field(500, env='DB_STATEMENT_CACHE_SIZE')
+    db_pgbouncer: bool = Field(False, env='DB_PGBOUNCER')
     redis_url: Final[str] = Field(..., env='REDIS_URL')
     redis_url_local: Final[str] = Field(..., env='LOCAL_REDIS_URL')
     redis_host: Final[str] = Field(..., env='REDIS_HOST')
     redis_port: Final[int] = Field(..., env='REDIS_PORT')
     static_url: Final[str] = Field(..., env='STATIC_URL')
     files_path: str = Field(os.path.join(BASE_DIR, 'files'), env='FILES_BASE_DIR')
-    compression_types: list = Field(['zip', '7z', 'tar'], env='COMPRESSION_TYPES')
+    compression_types: list = Field(['zip', '7z', 'tar', 'tar.zst', 'pgzip', 'store'], env='COMPRESSION_TYPES')
+    compression_threads: int = Field(4, env='COMPRESSION_THREADS')
+    pgzip_block_size: int = Field(1024 * 1024, env='PGZIP_BLOCK_SIZE')
+    download_mode: str = Field('redirect', env='DOWNLOAD_MODE')
+    download_max_ranges: int = Field(16, env='DOWNLOAD_MAX_RANGES')
+    accel_redirect_prefix: str = Field('/protected-files', env='ACCEL_REDIRECT_PREFIX')
+    archive_chunk_size: int = Field(64 * 1024, env='ARCHIVE_CHUNK_SIZE')
+    archive_queue_size: int = Field(16, env='ARCHIVE_QUEUE_SIZE')
+    compression_workers: int = Field(os.cpu_count() or 1, env='COMPRESSION_WORKERS')
+    compression_max_pending: int = Field(32, env='COMPRESSION_MAX_PENDING')
+    list_cache_expire: int = Field(60, env='LIST_CACHE_EXPIRE')
+    bcrypt_rounds: int = Field(12, env='BCRYPT_ROUNDS')
+    password_workers: int = Field(2, env='PASSWORD_WORKERS')
+    password_max_pending: int = Field(64, env='PASSWORD_MAX_PENDING')
+    cache_codec: str = Field('orjson', env='CACHE_CODEC')
+    cache_local_size: int = Field(10000, env='CACHE_LOCAL_SIZE')
+    cache_local_ttl: int = Field(10, env='CACHE_LOCAL_TTL')
+    cache_invalidation_channel: str = Field('cache_invalidation', env='CACHE_INVALIDATION_CHANNEL')
+    user_cache_size: int = Field(10000, env='USER_CACHE_SIZE')
+    user_cache_ttl: int = Field(30, env='USER_CACHE_TTL')
+    user_cache_redis_ttl: int = Field(300, env='USER_CACHE_REDIS_TTL')
+    blobs_path: str = Field(os.path.join(BASE_DIR, 'files', '.blobs'), env='BLOBS_DIR')
+    blob_gc_interval: int = Field(3600, env='BLOB_GC_INTERVAL')
+    blob_gc_batch: int = Field(1000, env='BLOB_GC_BATCH')
+    uploads_path: str = Field(os.path.join(BASE_DIR, 'files', '.uploads'), env='UPLOADS_DIR')
+    upload_chunk_size: int = Field(8 * 1024 * 1024, env='UPLOAD_CHUNK_SIZE')
+    upload_max_chunk_size: int = Field(64 * 1024 * 1024, env='UPLOAD_MAX_CHUNK_SIZE')
+    upload_max_size: int = Field(64 * 1024 * 1024 * 1024, env='UPLOAD_MAX_SIZE')
+    upload_session_ttl: int = Field(24 * 3600, env='UPLOAD_SESSION_TTL')
+    upload_sweep_interval: int = Field(3600, env='UPLOAD_SWEEP_INTERVAL')
+    upload_write_buffer: int = Field(1024 * 1024, env='UPLOAD_WRITE_BUFFER')
+    upload_fsync: str = Field('group', env='UPLOAD_FSYNC', regex='^(none|file|group)$')
+    upload_fsync_window: float = Field(0.005, env='UPLOAD_FSYNC_WINDOW')
+    user_quota: int = Field(10 * 1024 * 1024 * 1024, env='USER_QUOTA')
+    upload_quota_slack: int = Field(64 * 1024, env='UPLOAD_QUOTA_SLACK')
+    usage_reconcile_interval: int = Field(24 * 3600, env='USAGE_RECONCILE_INTERVAL')
+    usage_reconcile_batch: int = Field(1000, env='USAGE_RECONCILE_BATCH')
+    archive_cache_enabled: bool = Field(True, env='ARCHIVE_CACHE_ENABLED')
+    archive_cache_path: str = Field(os.path.join(BASE_DIR, 'files', '.archives'), env='ARCHIVE_CACHE_DIR')
+    archive_cache_size: int = Field(1024 * 1024 * 1024, env='ARCHIVE_CACHE_SIZE')
+    bulk_concurrency: int = Field(8, env='BULK_CONCURRENCY')
+    bulk_spool_size: int = Field(16 * 1024 * 1024, env='BULK_SPOOL_SIZE')
+    extract_max_entries: int = Field(10000, env='EXTRACT_MAX_ENTRIES')
+    extract_max_size: int = Field(4 * 1024 * 1024 * 1024, env='EXTRACT_MAX_SIZE')
+    extract_max_ratio: int = Field(200, env='EXTRACT_MAX_RATIO')
+    extract_buffer_size: int = Field(1024 * 1024, env='EXTRACT_BUFFER_SIZE')
+    compression_start_method: str = Field('spawn', env='COMPRESSION_START_METHOD')
+    rate_limit_enabled: bool = Field(True, env='RATE_LIMIT_ENABLED')
+    rate_limit_backend: str = Field('memory', env='RATE_LIMIT_BACKEND', regex='^(memory|redis)$')
+    rate_limit_prefix: str = Field('ratelimit', env='RATE_LIMIT_PREFIX')
+    rate_limit_running_ttl: int = Field(3600, env='RATE_LIMIT_RUNNING_TTL')
+    rate_limit_client_header: str = Field('x-forwarded-for', env='RATE_LIMIT_CLIENT_HEADER')
+    rate_limit_trusted_proxies: list[str] = Field([], env='RATE_LIMIT_TRUSTED_PROXIES')
+    rate_limits: dict[str, dict[str, float]] = Field({
+        'default': {'rate': 50, 'burst': 100, 'concurrency': 32},
+        'upload': {'rate': 10, 'burst': 40, 'concurrency': 8},
+        'archive': {'rate': 0.5, 'burst': 4, 'concurrency': 2, 'route_concurrency': 2 * (os.cpu_count() or 1)},
+        'auth': {'rate': 5, 'burst': 20, 'concurrency': 4},
+    }, env='RATE_LIMITS')
+    jobs_path: str = Field(os.path.join(BASE_DIR, 'files', '.jobs'), env='JOBS_DIR')
+    job_workers: int = Field(4, env='JOB_WORKERS')
+    job_user_concurrency: int = Field(2, env='JOB_USER_CONCURRENCY')
+    job_result_ttl: int = Field(3600, env='JOB_RESULT_TTL')
+    job_queued_ttl: int = Field(24 * 3600, env='JOB_QUEUED_TTL')
+    job_timeout: int = Field(6 * 3600, env='JOB_TIMEOUT')
+    job_poll_interval: float = Field(1.0, env='JOB_POLL_INTERVAL')
+    job_progress_interval: float = Field(1.0, env='JOB_PROGRESS_INTERVAL')
+    job_heartbeat_interval: float = Field(30, env='JOB_HEARTBEAT_INTERVAL')
+    job_heartbeat_timeout: float = Field(300, env='JOB_HEARTBEAT_TIMEOUT')
+    job_collect_interval: float = Field(60, env='JOB_COLLECT_INTERVAL')
+    job_queue_prefix: str = Field('jobs', env='JOB_QUEUE_PREFIX')
 
     class Config:
         env_file = os.path.join(BASE_DIR, '../../.env')
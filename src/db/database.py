@@ -1,16 +1,55 @@
+import time
 from typing import AsyncIterator
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, AsyncConnection, AsyncEngine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, AsyncConnection, AsyncEngine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
-from src.core.settings import Settings
+from src.core.settings import settings
 
 
-settings = Settings()
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    wait_count = 0
+    wait_seconds = 0.0
+    wait_max_seconds = 0.0
+    timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            TimedQueuePool.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            TimedQueuePool.wait_count += 1
+            TimedQueuePool.wait_seconds += elapsed
+            TimedQueuePool.wait_max_seconds = max(TimedQueuePool.wait_max_seconds, elapsed)
+
+
+def get_engine_options() -> dict:
+    if settings.db_pgbouncer:
+        return {
+            'poolclass': NullPool,
+            'connect_args': {'statement_cache_size': 0, 'prepared_statement_cache_size': 0},
+        }
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': settings.db_pool_size,
+        'max_overflow': settings.db_max_overflow,
+        'pool_timeout': settings.db_pool_timeout,
+        'pool_recycle': settings.db_pool_recycle,
+        'pool_pre_ping': settings.db_pool_pre_ping,
+        'connect_args': {
+            'statement_cache_size': settings.db_statement_cache_size,
+            'prepared_statement_cache_size': settings.db_statement_cache_size,
+        },
+    }
 
 
 def create_engine() -> AsyncEngine:
-    return create_async_engine(settings.database_dsn, echo=True, future=True)
+    return create_async_engine(settings.database_dsn, echo=settings.db_echo, future=True, **get_engine_options())
 
 
 def create_sessionmaker(bind_engine: AsyncEngine | AsyncConnection) -> sessionmaker:
@@ -21,6 +60,27 @@ engine = create_engine()
 async_session = create_sessionmaker(engine)
 
 
+def get_pool_gauges() -> dict:
+    return {key: value for key, value in get_pool_stats().items() if key != 'pool'}
+
+
+def get_pool_stats() -> dict:
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, TimedQueuePool):
+        return {'pool': type(pool).__name__}
+    return {
+        'pool': type(pool).__name__,
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+        'wait_count': TimedQueuePool.wait_count,
+        'wait_seconds': round(TimedQueuePool.wait_seconds, 6),
+        'wait_max_seconds': round(TimedQueuePool.wait_max_seconds, 6),
+        'timeouts': TimedQueuePool.timeouts,
+    }
+
+
 async def get_session() -> AsyncIterator[AsyncSession]:
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        yield session
@@ -1,13 +1,26 @@
+import asyncio
+
 import uvicorn
 
 from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, Response
 from fastapi_cache import caches, close_caches
 from fastapi_cache.backends.redis import CACHE_KEY, RedisCacheBackend
-from fastapi.staticfiles import StaticFiles
 
 from src.api.v1 import base
+from src.core.logger import LogContextMiddleware, get_log_stats
+from src.core.metrics import MetricsMiddleware, gauges, metrics_response
+from src.core.ratelimit import RateLimitMiddleware, rate_limiter
 from src.core.settings import settings
+from src.db.database import async_session, get_pool_gauges
+from src.utils.blob import collect_blobs_periodically
+from src.utils.cache import cache_invalidator, get_redis_pool_stats
+from src.utils.executor import compression_executor
+from src.utils.fsync import fsync_batcher
+from src.utils.jobs import job_queue
+from src.utils.password import password_hasher
+from src.utils.upload import sweep_sessions_periodically
+from src.utils.usage import reconcile_usage_periodically
 
 
 app = FastAPI(title=settings.title,
@@ -16,18 +29,53 @@ app = FastAPI(title=settings.title,
               default_response_class=ORJSONResponse,)
 
 app.include_router(base.router, prefix='/api/v1')
-app.mount('/files', StaticFiles(directory=settings.base_dir + '/files'), name='files')
+if settings.rate_limit_enabled:
+    app.add_middleware(RateLimitMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+    gauges.add('db_pool_connections', 'Database pool connections and checkout waits.', get_pool_gauges)
+    gauges.add('redis_cache_pool_connections', 'Connections of the Redis cache pool.', get_redis_pool_stats)
+    gauges.add('redis_pubsub_pool_connections', 'Connections of the Redis invalidation client.',
+               cache_invalidator.pool_stats)
+    gauges.add('compression_executor_jobs', 'Archive jobs running or queued in the compression pool.',
+               compression_executor.stats)
+    gauges.add('background_jobs', 'Background jobs running in this process.', job_queue.stats)
+    gauges.add('password_hasher_jobs', 'Password hashing jobs running or queued.', password_hasher.stats)
+    gauges.add('upload_fsyncs', 'Upload fsyncs waiting for a batch, batches flushed and paths synced.',
+               fsync_batcher.stats)
+    gauges.add('rate_limited_requests', 'Requests admitted and running, and requests rejected with 429.',
+               rate_limiter.stats)
+    gauges.add('log_records', 'Log records waiting for the writer thread and dropped on a full queue.', get_log_stats)
+app.add_middleware(LogContextMiddleware)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics() -> Response:
+    return metrics_response()
 
 
 @app.on_event('startup')
 async def on_startup() -> None:
     redis_cache = RedisCacheBackend(settings.redis_url)
     caches.set(CACHE_KEY, redis_cache)
+    compression_executor.start()
+    await cache_invalidator.start()
+    await job_queue.start()
+    app.state.blob_gc = asyncio.create_task(collect_blobs_periodically(async_session))
+    app.state.usage_reconcile = asyncio.create_task(reconcile_usage_periodically(async_session))
+    app.state.upload_sweep = asyncio.create_task(sweep_sessions_periodically())
 
 
 @app.on_event('shutdown')
 async def on_shutdown() -> None:
+    app.state.blob_gc.cancel()
+    app.state.usage_reconcile.cancel()
+    app.state.upload_sweep.cancel()
+    await job_queue.stop()
+    await rate_limiter.close()
+    await cache_invalidator.stop()
     await close_caches()
+    compression_executor.shutdown()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,84 @@
+"""blob store
+
+Revision ID: 4c2f8e1a7b3d
+Revises: 9530ef500463
+Create Date: 2026-10-18 12:05:41.204518
+
+"""
+import hashlib
+import os
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.settings import settings
+
+# revision identifiers, used by Alembic.
+revision = '4c2f8e1a7b3d'
+down_revision = '9530ef500463'
+branch_labels = None
+depends_on = None
+
+
+def hash_path(path: str) -> tuple[str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def store_blob(full_path: str, digest: str) -> None:
+    blob_path = os.path.join(settings.blobs_path, digest[:2], digest)
+    if not os.path.exists(blob_path):
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.link(full_path, blob_path)
+    elif not os.path.samefile(full_path, blob_path):
+        temp_path = '{}.{}.tmp'.format(full_path, uuid.uuid4().hex)
+        os.link(blob_path, temp_path)
+        os.replace(temp_path, full_path)
+
+
+def backfill_hashes() -> None:
+    connection = op.get_bind()
+    files = connection.execute(sa.text('SELECT id, path FROM files')).fetchall()
+    blobs = {}
+    for file_id, path in files:
+        full_path = settings.files_path + path
+        if not os.path.isfile(full_path):
+            continue
+        digest, size = hash_path(full_path)
+        store_blob(full_path, digest)
+        if digest not in blobs:
+            blobs[digest] = {'digest': digest, 'size': size, 'ref_count': 0}
+            connection.execute(sa.text('INSERT INTO blobs (digest, size, ref_count, created_at) '
+                                       'VALUES (:digest, :size, 0, now())'), blobs[digest])
+        blobs[digest]['ref_count'] += 1
+        connection.execute(sa.text('UPDATE files SET hash = :digest, size = :size WHERE id = :id'),
+                           {'digest': digest, 'size': size, 'id': file_id})
+    for blob in blobs.values():
+        connection.execute(sa.text('UPDATE blobs SET ref_count = :ref_count WHERE digest = :digest'), blob)
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('digest')
+    )
+    op.add_column('files', sa.Column('hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_files_hash'), 'files', ['hash'], unique=False)
+    op.create_foreign_key('files_hash_fkey', 'files', 'blobs', ['hash'], ['digest'])
+    backfill_hashes()
+
+
+def downgrade() -> None:
+    op.drop_constraint('files_hash_fkey', 'files', type_='foreignkey')
+    op.drop_index(op.f('ix_files_hash'), table_name='files')
+    op.drop_column('files', 'hash')
+    op.drop_table('blobs')
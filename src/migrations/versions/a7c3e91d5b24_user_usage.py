@@ -0,0 +1,31 @@
+"""user usage
+
+Revision ID: a7c3e91d5b24
+Revises: f4c19a7e2b85
+Create Date: 2026-10-18 20:02:47.316254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e91d5b24'
+down_revision = 'f4c19a7e2b85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('used_bytes', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('file_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('quota_bytes', sa.BigInteger(), nullable=True))
+    op.execute('UPDATE users SET used_bytes = usage.size, file_count = usage.count '
+               'FROM (SELECT user_id, sum(size) AS size, count(*) AS count FROM files GROUP BY user_id) AS usage '
+               'WHERE users.id = usage.user_id')
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'quota_bytes')
+    op.drop_column('users', 'file_count')
+    op.drop_column('users', 'used_bytes')
@@ -0,0 +1,25 @@
+"""directory children
+
+Revision ID: b3e8f2a61c4d
+Revises: a7c3e91d5b24
+Create Date: 2026-10-18 23:14:05.902118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f2a61c4d'
+down_revision = 'a7c3e91d5b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_directories_parent_id_path', 'directories', ['parent_id', 'path'], unique=False)
+    op.create_index('ix_files_directory_id_path', 'files', ['directory_id', 'path'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_files_directory_id_path', table_name='files')
+    op.drop_index('ix_directories_parent_id_path', table_name='directories')
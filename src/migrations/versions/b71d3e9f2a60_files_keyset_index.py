@@ -0,0 +1,24 @@
+"""files keyset index
+
+Revision ID: b71d3e9f2a60
+Revises: 4c2f8e1a7b3d
+Create Date: 2026-10-18 13:42:09.518733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71d3e9f2a60'
+down_revision = '4c2f8e1a7b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_files_user_id_created_at_id', 'files', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_files_user_id_created_at_id', table_name='files')
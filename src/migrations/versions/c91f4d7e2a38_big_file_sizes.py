@@ -0,0 +1,26 @@
+"""big file sizes
+
+Revision ID: c91f4d7e2a38
+Revises: b3e8f2a61c4d
+Create Date: 2026-10-19 10:42:17.563081
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c91f4d7e2a38'
+down_revision = 'b3e8f2a61c4d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column('files', 'size', type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=False)
+    op.alter_column('blobs', 'size', type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=False)
+
+
+def downgrade() -> None:
+    op.alter_column('blobs', 'size', type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=False)
+    op.alter_column('files', 'size', type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=False)
@@ -0,0 +1,85 @@
+"""directory tree
+
+Revision ID: d5a8c3f1e702
+Revises: b71d3e9f2a60
+Create Date: 2026-10-18 17:31:12.804115
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'd5a8c3f1e702'
+down_revision = 'b71d3e9f2a60'
+branch_labels = None
+depends_on = None
+
+
+def get_parent_dirs(path: str) -> list[str]:
+    parts = path.split('/')[1:-1]
+    return ['/' + '/'.join(parts[:index]) for index in range(1, len(parts) + 1)]
+
+
+def backfill_tree() -> None:
+    connection = op.get_bind()
+    files = connection.execute(sa.text('SELECT id, path, size, created_at FROM files')).fetchall()
+    # Rows written before the tree hold one absolute filesystem path per path segment, flattened under
+    # the files directory, so they cannot be mapped to logical paths. Rebuild the tree from files instead.
+    connection.execute(sa.text('DELETE FROM directories'))
+    ids = {}
+    stats = {}
+    for _, path, size, created_at in files:
+        for parent in get_parent_dirs(path):
+            total_size, file_count, updated_at = stats.get(parent, (0, 0, None))
+            if created_at and (updated_at is None or created_at > updated_at):
+                updated_at = created_at
+            stats[parent] = (total_size + size, file_count + 1, updated_at)
+    for path in sorted(stats.keys(), key=lambda path: path.count('/')):
+        ids[path] = uuid.uuid1()
+        connection.execute(sa.text('INSERT INTO directories (id, path, total_size, file_count) VALUES (:id, :path, 0, 0)'),
+                           {'id': ids[path], 'path': path})
+    for path, directory_id in ids.items():
+        parents = get_parent_dirs(path)
+        total_size, file_count, updated_at = stats.get(path, (0, 0, None))
+        connection.execute(sa.text('UPDATE directories SET parent_id = :parent_id, total_size = :total_size, '
+                                   'file_count = :file_count, updated_at = :updated_at WHERE id = :id'),
+                           {'parent_id': ids.get(parents[-1]) if parents else None, 'total_size': total_size,
+                            'file_count': file_count, 'updated_at': updated_at, 'id': directory_id})
+    for file_id, path, _, _ in files:
+        parents = get_parent_dirs(path)
+        if parents:
+            connection.execute(sa.text('UPDATE files SET directory_id = :directory_id WHERE id = :id'),
+                               {'directory_id': ids[parents[-1]], 'id': file_id})
+
+
+def upgrade() -> None:
+    op.add_column('directories', sa.Column('parent_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.add_column('directories', sa.Column('total_size', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('directories', sa.Column('file_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('directories', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_directories_parent_id'), 'directories', ['parent_id'], unique=False)
+    op.create_foreign_key('directories_parent_id_fkey', 'directories', 'directories', ['parent_id'], ['id'],
+                          ondelete='CASCADE')
+    op.create_index('ix_directories_path_pattern', 'directories', ['path'], unique=False,
+                    postgresql_ops={'path': 'text_pattern_ops'})
+    op.add_column('files', sa.Column('directory_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_index(op.f('ix_files_directory_id'), 'files', ['directory_id'], unique=False)
+    op.create_foreign_key('files_directory_id_fkey', 'files', 'directories', ['directory_id'], ['id'],
+                          ondelete='SET NULL')
+    backfill_tree()
+
+
+def downgrade() -> None:
+    op.drop_constraint('files_directory_id_fkey', 'files', type_='foreignkey')
+    op.drop_index(op.f('ix_files_directory_id'), table_name='files')
+    op.drop_column('files', 'directory_id')
+    op.drop_index('ix_directories_path_pattern', table_name='directories')
+    op.drop_constraint('directories_parent_id_fkey', 'directories', type_='foreignkey')
+    op.drop_index(op.f('ix_directories_parent_id'), table_name='directories')
+    op.drop_column('directories', 'updated_at')
+    op.drop_column('directories', 'file_count')
+    op.drop_column('directories', 'total_size')
+    op.drop_column('directories', 'parent_id')
@@ -0,0 +1,75 @@
+"""directory owner
+
+Revision ID: e2b7a4c9d613
+Revises: c91f4d7e2a38
+Create Date: 2026-10-20 09:12:48.331907
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7a4c9d613'
+down_revision = 'c91f4d7e2a38'
+branch_labels = None
+depends_on = None
+
+
+def get_parent_dirs(path: str) -> list[str]:
+    parts = path.split('/')[1:-1]
+    return ['/' + '/'.join(parts[:index]) for index in range(1, len(parts) + 1)]
+
+
+def backfill_tree(per_user: bool) -> None:
+    connection = op.get_bind()
+    files = connection.execute(sa.text('SELECT id, user_id, path, size, created_at FROM files')).fetchall()
+    # Stats cannot be split or merged in place, so rebuild the tree from files, one per user when scoped.
+    connection.execute(sa.text('UPDATE files SET directory_id = NULL'))
+    connection.execute(sa.text('DELETE FROM directories'))
+    ids = {}
+    stats = {}
+    for _, user_id, path, size, created_at in files:
+        owner = user_id if per_user else None
+        for parent in get_parent_dirs(path):
+            total_size, file_count, updated_at = stats.get((owner, parent), (0, 0, None))
+            if created_at and (updated_at is None or created_at > updated_at):
+                updated_at = created_at
+            stats[(owner, parent)] = (total_size + size, file_count + 1, updated_at)
+    columns = 'id, user_id, path' if per_user else 'id, path'
+    values = ':id, :user_id, :path' if per_user else ':id, :path'
+    for owner, path in sorted(stats.keys(), key=lambda key: key[1].count('/')):
+        parents = get_parent_dirs(path)
+        total_size, file_count, updated_at = stats[(owner, path)]
+        ids[(owner, path)] = uuid.uuid1()
+        connection.execute(sa.text('INSERT INTO directories ({}, parent_id, total_size, file_count, updated_at, '
+                                   'version) VALUES ({}, :parent_id, :total_size, :file_count, :updated_at, 0)'
+                                   .format(columns, values)),
+                           {'id': ids[(owner, path)], 'user_id': owner, 'path': path,
+                            'parent_id': ids.get((owner, parents[-1])) if parents else None,
+                            'total_size': total_size, 'file_count': file_count, 'updated_at': updated_at})
+    for file_id, user_id, path, _, _ in files:
+        parents = get_parent_dirs(path)
+        if parents:
+            connection.execute(sa.text('UPDATE files SET directory_id = :directory_id WHERE id = :id'),
+                               {'directory_id': ids[(user_id if per_user else None, parents[-1])], 'id': file_id})
+
+
+def upgrade() -> None:
+    op.drop_constraint('directories_path_key', 'directories', type_='unique')
+    op.add_column('directories', sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=True))
+    backfill_tree(per_user=True)
+    op.alter_column('directories', 'user_id', existing_type=postgresql.UUID(as_uuid=True), nullable=False)
+    op.create_foreign_key('directories_user_id_fkey', 'directories', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+    op.create_unique_constraint('uq_directories_user_id_path', 'directories', ['user_id', 'path'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_directories_user_id_path', 'directories', type_='unique')
+    op.drop_constraint('directories_user_id_fkey', 'directories', type_='foreignkey')
+    op.drop_column('directories', 'user_id')
+    backfill_tree(per_user=False)
+    op.create_unique_constraint('directories_path_key', 'directories', ['path'])
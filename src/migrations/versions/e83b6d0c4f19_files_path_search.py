@@ -0,0 +1,29 @@
+"""files path search
+
+Revision ID: e83b6d0c4f19
+Revises: d5a8c3f1e702
+Create Date: 2026-10-18 18:02:47.113954
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e83b6d0c4f19'
+down_revision = 'd5a8c3f1e702'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_files_user_id_path_c', 'files', ['user_id', sa.text('path COLLATE "C"')], unique=False,
+                    postgresql_include=['id', 'size', 'created_at'])
+    op.create_index('ix_files_path_trgm', 'files', ['path'], unique=False, postgresql_using='gin',
+                    postgresql_ops={'path': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_files_path_trgm', table_name='files')
+    op.drop_index('ix_files_user_id_path_c', table_name='files')
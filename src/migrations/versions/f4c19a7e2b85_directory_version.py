@@ -0,0 +1,24 @@
+"""directory version
+
+Revision ID: f4c19a7e2b85
+Revises: e83b6d0c4f19
+Create Date: 2026-10-18 19:10:33.586207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c19a7e2b85'
+down_revision = 'e83b6d0c4f19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('directories', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('directories', 'version')
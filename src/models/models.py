@@ -1,7 +1,7 @@
 from datetime import datetime
 import uuid
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, declarative_base
 
@@ -12,7 +12,28 @@ class Directory(Base):
     __tablename__ = 'directories'
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid1)
-    path = Column(String(255), nullable=False, unique=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    path = Column(String(255), nullable=False)
+    parent_id = Column(UUID(as_uuid=True), ForeignKey('directories.id', ondelete='CASCADE'), nullable=True, index=True)
+    total_size = Column(BigInteger, nullable=False, default=0)
+    file_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+    version = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'path', name='uq_directories_user_id_path'),
+        Index('ix_directories_path_pattern', 'path', postgresql_ops={'path': 'text_pattern_ops'}),
+        Index('ix_directories_parent_id_path', 'parent_id', 'path'),
+    )
+
+
+class Blob(Base):
+    __tablename__ = 'blobs'
+
+    digest = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 
 class File(Base):
@@ -22,10 +43,17 @@ class File(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     name = Column(String(125), nullable=False)
     path = Column(String(255), nullable=False, unique=True)
-    size = Column(Integer, nullable=False)
+    size = Column(BigInteger, nullable=False)
     is_downloadable = Column(Boolean, default=False)
+    hash = Column(String(64), ForeignKey('blobs.digest'), nullable=True, index=True)
+    directory_id = Column(UUID(as_uuid=True), ForeignKey('directories.id', ondelete='SET NULL'), nullable=True, index=True)
     created_at = Column(DateTime, index=True, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index('ix_files_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_files_directory_id_path', 'directory_id', 'path'),
+    )
+
 
 class User(Base):
     __tablename__ = 'users'
@@ -33,5 +61,8 @@ class User(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid1)
     username = Column(String(125), nullable=False, unique=True)
     password = Column(String(125), nullable=False)
+    used_bytes = Column(BigInteger, nullable=False, default=0)
+    file_count = Column(Integer, nullable=False, default=0)
+    quota_bytes = Column(BigInteger, nullable=True)
     files = relationship('File', backref='user')
     created_at = Column(DateTime, index=True, default=datetime.utcnow)
@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from .file import ORM
+
+
+class DirectoryStats(ORM):
+    id: Optional[UUID] = None
+    path: str
+    parent_id: Optional[UUID] = None
+    total_size: int
+    file_count: int
+    updated_at: Optional[datetime] = None
+
+
+class DirectoryListing(BaseModel):
+    directory: DirectoryStats
+    directories: List[DirectoryStats]
+
+
+class DirectoryChild(BaseModel):
+    type: str
+    id: UUID
+    name: str
+    path: str
+    size: int
+    file_count: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class DirectoryChildren(BaseModel):
+    directory_id: Optional[UUID] = None
+    path: str
+    children: List[DirectoryChild]
+    next_cursor: Optional[str] = None
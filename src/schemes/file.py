@@ -1,10 +1,16 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, validator
 
 
+SORT_FIELDS = ('created_at', 'size', 'path')
+SORT_PATTERN = '^-?({})$'.format('|'.join(SORT_FIELDS))
+SEARCH_MODES = ('prefix', 'glob', 'substring')
+SEARCH_MODE_PATTERN = '^({})$'.format('|'.join(SEARCH_MODES))
+
+
 class ORM(BaseModel):
 
     class Config:
@@ -14,6 +20,38 @@ class ORM(BaseModel):
 class FilesList(ORM):
     account_id: UUID
     files: List
+    next_cursor: Optional[str] = None
+
+
+class FilesQuery(BaseModel):
+    limit: int = 100
+    cursor: Optional[str] = None
+    sort: str = '-created_at'
+    path_prefix: Optional[str] = None
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+    @property
+    def sort_field(self) -> str:
+        return self.sort.lstrip('-')
+
+    @property
+    def descending(self) -> bool:
+        return self.sort.startswith('-')
+
+
+class FileSearchItem(ORM):
+    id: UUID
+    path: str
+    size: int
+    created_at: datetime
+
+
+class FilesSearch(BaseModel):
+    files: List[FileSearchItem]
+    next_cursor: Optional[str] = None
 
 
 class Path(ORM):
@@ -22,10 +60,12 @@ class Path(ORM):
 
 class FileBase(ORM):
     id: UUID
+    user_id: Optional[UUID] = None
     name: str
     path: str
     size: int
     is_downloadable: bool
+    hash: Optional[str] = None
     created_at: datetime
 
 
@@ -47,3 +87,15 @@ class File(FileBase):
             return datetime.fromisoformat(value)
         else:
             return value
+
+
+class BulkEntry(BaseModel):
+    path: str
+    status: str
+    id: Optional[UUID] = None
+    size: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class BulkResult(BaseModel):
+    entries: List[BulkEntry]
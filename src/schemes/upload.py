@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel, validator
+
+
+class UploadSessionCreate(BaseModel):
+    path: str
+    size: int
+    chunk_size: Optional[int] = None
+
+    @validator('path')
+    def path_to_file(cls, value):
+        if not value.startswith('/') or value.endswith('/'):
+            raise ValueError('Path must starts with / and point to a file.')
+        return value
+
+    @validator('size')
+    def positive_size(cls, value):
+        if value < 0:
+            raise ValueError('Size must not be negative.')
+        return value
+
+
+class UploadSession(BaseModel):
+    id: UUID
+    path: str
+    size: int
+    chunk_size: int
+    chunks_total: int
+    created_at: datetime
+    missing_chunks: List[int] = []
+    missing_ranges: List[List[int]] = []
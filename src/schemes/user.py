@@ -44,13 +44,23 @@ class UserAuth(UserRegister):
 class CurrentUser(User):
     id: UUID
     created_at: datetime
+    quota_bytes: Optional[int] = None
 
     @validator('created_at', pre=True)
     def time_to_str(cls, value):
         if isinstance(value, str):
             return datetime.fromisoformat(value)
+        return value
 
 
 class UserDB(CurrentUser):
     password: str
     files: list[File] = []
+
+
+class UserStatus(BaseModel):
+    account_id: UUID
+    used: int
+    files: int
+    allocated: Optional[int] = None
+    available: Optional[int] = None
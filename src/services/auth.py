@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
-from typing import Union
+from typing import Optional, Union
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from fastapi_cache.backends.redis import RedisCacheBackend
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -11,11 +12,16 @@ from src.core.settings import settings
 from src.db.database import get_session
 from src.models.models import User
 from src.schemes import user as user_schema
-from src.utils.password import verify_password
+from src.utils.cache import TTLCache, cache_invalidator, delete_cache, get_cache, redis_cache, set_cache
+from src.utils.password import password_hasher
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='v1/auth/token')
 
+user_cache = TTLCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+cache_invalidator.register(user_cache)
+redis_user_stats = {'hits': 0, 'misses': 0}
+
 
 async def get_user(db: AsyncSession, username: str):
     statement = select(User).where(User.username == username)
@@ -23,26 +29,77 @@ async def get_user(db: AsyncSession, username: str):
     return results.scalar_one_or_none()
 
 
-async def auth_user(db: AsyncSession, username: str, password: str):
+def get_user_cache_key(username: str) -> str:
+    return 'user_{}'.format(username)
+
+
+async def resolve_user(db: AsyncSession, redis_cache: RedisCacheBackend, username: str) -> Optional[user_schema.CurrentUser]:
+    redis_key = get_user_cache_key(username)
+    current_user = user_cache.get(redis_key)
+    if current_user:
+        return current_user
+    cache_data = await get_cache(redis_cache, redis_key, local=False)
+    if cache_data:
+        redis_user_stats['hits'] += 1
+        current_user = user_schema.CurrentUser(**cache_data)
+    else:
+        redis_user_stats['misses'] += 1
+        user = await get_user(db=db, username=username)
+        if user is None:
+            return None
+        current_user = user_schema.CurrentUser.from_orm(user)
+        await set_cache(redis_cache, current_user.dict(), redis_key, expire=settings.user_cache_redis_ttl, local=False)
+    user_cache.set(redis_key, current_user)
+    return current_user
+
+
+async def get_cached_user(redis_cache: RedisCacheBackend, username: str) -> Optional[user_schema.CurrentUser]:
+    redis_key = get_user_cache_key(username)
+    current_user = user_cache.get(redis_key)
+    if current_user is None:
+        cache_data = await get_cache(redis_cache, redis_key, local=False)
+        current_user = user_schema.CurrentUser(**cache_data) if cache_data else None
+    return current_user
+
+
+async def invalidate_user(redis_cache: RedisCacheBackend, username: str) -> None:
+    await delete_cache(redis_cache, get_user_cache_key(username))
+
+
+def get_user_cache_stats() -> dict:
+    return {'local': user_cache.stats(), 'redis': redis_user_stats}
+
+
+async def auth_user(db: AsyncSession, redis_cache: RedisCacheBackend, username: str, password: str):
     user = await get_user(db=db, username=username)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    verified, new_password = await password_hasher.verify_and_update(password, user.password)
+    if not verified:
         return False
+    if new_password:
+        user.password = new_password
+        await db.commit()
+        await invalidate_user(redis_cache=redis_cache, username=username)
     return user
 
 
-async def get_current_user(db: AsyncSession = Depends(get_session), token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, headers={"WWW-Authenticate": "Bearer"})
+def get_token_username(token: str) -> Optional[str]:
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = user_schema.TokenData(username=username)
     except JWTError:
+        return None
+    return payload.get("sub")
+
+
+async def get_current_user(db: AsyncSession = Depends(get_session), token: str = Depends(oauth2_scheme),
+                           redis_cache: RedisCacheBackend = Depends(redis_cache)) -> user_schema.CurrentUser:
+    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, headers={"WWW-Authenticate": "Bearer"})
+    username = get_token_username(token)
+    if username is None:
         raise credentials_exception
-    user = await get_user(db=db, username=token_data.username)
+    token_data = user_schema.TokenData(username=username)
+    user = await resolve_user(db=db, redis_cache=redis_cache, username=token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -59,8 +116,8 @@ def create_access_token(data: dict, delta: Union[timedelta, None] = None):
     return encoded_jwt
 
 
-async def get_token(db: AsyncSession, username: str, password: str):
-    user: Union[User, bool] = await auth_user(db, username, password)
+async def get_token(db: AsyncSession, redis_cache: RedisCacheBackend, username: str, password: str):
+    user: Union[User, bool] = await auth_user(db, redis_cache, username, password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, headers={"WWW-Authenticate": "Bearer"})
     access_token_expires = timedelta(minutes=settings.token_expire)
@@ -21,31 +21,57 @@ class Repository(ABC):
     def get_dir_by_id(self, *args, **kwargs):
         raise NotImplementedError
 
+    @abstractmethod
+    def get_versions_by_path(self, *args, **kwargs):
+        raise NotImplementedError
+
     @abstractmethod
     def create_directory(self, *args, **kwargs):
         raise NotImplementedError
 
+    @abstractmethod
+    def get_children(self, *args, **kwargs):
+        raise NotImplementedError
+
 
 class RepositoryDirectoryDB(Repository, Generic[ModelType]):
     def __init__(self, model: Type[ModelType]):
         self._model = model
 
-    async def get_dir_by_path(self, db: AsyncSession, dir_path: str) -> Optional[ModelType]:
+    async def get_dir_by_path(self, db: AsyncSession, dir_path: str, user_id: uuid.UUID) -> Optional[ModelType]:
         if not dir_path.startswith('/'):
             dir_path = '/' + dir_path
-        statement = select(self._model).where(self._model.path == dir_path)
+        statement = select(self._model).where(self._model.user_id == user_id, self._model.path == dir_path)
         result = await db.execute(statement=statement)
         return result.scalar_one_or_none()
 
-    async def get_dir_by_id(self, db: AsyncSession, dir_id: uuid.UUID) -> Optional[ModelType]:
+    async def get_dir_by_id(self, db: AsyncSession, dir_id: uuid.UUID,
+                            user_id: Optional[uuid.UUID] = None) -> Optional[ModelType]:
         statement = select(self._model).where(self._model.id == dir_id)
+        if user_id is not None:
+            statement = statement.where(self._model.user_id == user_id)
         result = await db.execute(statement=statement)
         return result.scalar_one_or_none()
 
-    async def create_directory(self, db: AsyncSession, path: str) -> ModelType:
-        dir_obj = self._model(path=path)
+    async def get_versions_by_path(self, db: AsyncSession, dir_path: str) -> list[tuple[uuid.UUID, int]]:
+        statement = select(self._model.id, self._model.version).where(self._model.path == dir_path)
+        result = await db.execute(statement=statement.order_by(self._model.id))
+        return result.all()
+
+    async def create_directory(self, db: AsyncSession, user_id: uuid.UUID, path: str) -> ModelType:
+        dir_obj = self._model(user_id=user_id, path=path)
 
         db.add(dir_obj)
         await db.commit()
         await db.refresh(dir_obj)
         return dir_obj
+
+    async def get_children(self, db: AsyncSession, user_id: uuid.UUID, parent_id: Optional[uuid.UUID],
+                           after: Optional[str] = None, limit: Optional[int] = None) -> list[ModelType]:
+        condition = self._model.parent_id.is_(None) if parent_id is None else self._model.parent_id == parent_id
+        statement = select(self._model).where(self._model.user_id == user_id, condition)
+        if after is not None:
+            statement = statement.where(self._model.path > after)
+        statement = statement.order_by(self._model.path).limit(limit)
+        result = await db.execute(statement=statement)
+        return result.scalars().all()
@@ -1,14 +1,23 @@
 from abc import ABC, abstractmethod
-from typing import Generic, Optional, Type, TypeVar
-
-from fastapi import File
+from collections import Counter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Generic, Optional, Type, TypeVar
+from uuid import UUID, uuid1
+
+from fastapi import File, HTTPException, status
+from sqlalchemy import func, literal, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.sql import Select
 
 from src.models.models import Base
-from src.utils.base import get_full_path
-from src.utils.directory import create_directory
+from src.schemes.file import FilesQuery
+from src.utils.base import batched, get_full_path, get_like_pattern, normalize_path
+from src.utils.blob import BATCH_SIZE, acquire_blobs, release_blobs
+from src.utils.directory import get_parent_path, get_stats_deltas, update_directory_stats, upsert_directories
 from src.utils.file import put_file, create_file
+from src.utils.usage import update_usage
 
 
 ModelType = TypeVar("ModelType", bound=Base)
@@ -32,6 +41,22 @@ class Repository(ABC):
     def create_or_put_file(self, *args, **kwargs):
         raise NotImplementedError
 
+    @abstractmethod
+    def bulk_create_or_put_files(self, *args, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_stats_by_directory(self, *args, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_by_path(self, *args, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_list_by_directory(self, *args, **kwargs):
+        raise NotImplementedError
+
 
 class RepositoryFileDB(Repository, Generic[ModelType]):
     def __init__(self, model: Type[ModelType]):
@@ -49,16 +74,156 @@ class RepositoryFileDB(Repository, Generic[ModelType]):
         result = await db.execute(statement=statement)
         return result.scalar_one_or_none()
 
-    async def get_list_by_user(self, db: AsyncSession, user: ModelType) -> list[ModelType]:
+    async def get_list_by_user(self, db: AsyncSession, user: ModelType, query: FilesQuery,
+                               after: Optional[tuple[Any, Any]] = None) -> list[ModelType]:
+        column = getattr(self._model, query.sort_field)
         statement = select(self._model).where(self._model.user_id == user.id)
-        results = await db.execute(statement=statement)
+        if query.path_prefix:
+            statement = statement.where(self._model.path.startswith(query.path_prefix, autoescape=True))
+        if query.min_size is not None:
+            statement = statement.where(self._model.size >= query.min_size)
+        if query.max_size is not None:
+            statement = statement.where(self._model.size <= query.max_size)
+        if query.created_from is not None:
+            statement = statement.where(self._model.created_at >= query.created_from)
+        if query.created_to is not None:
+            statement = statement.where(self._model.created_at < query.created_to)
+        if after is not None:
+            key = tuple_(column, self._model.id)
+            bound = tuple_(literal(after[0], type_=column.type), literal(after[1], type_=self._model.id.type))
+            statement = statement.where(key < bound if query.descending else key > bound)
+        if query.descending:
+            statement = statement.order_by(column.desc(), self._model.id.desc())
+        else:
+            statement = statement.order_by(column.asc(), self._model.id.asc())
+        results = await db.execute(statement=statement.limit(query.limit))
         return results.scalars().all()
 
+    def get_search_statement(self, user_id: UUID, mode: str, pattern: str, after: Optional[str] = None,
+                             limit: int = 100) -> Select:
+        sorted_path = self._model.path.collate('C')
+        like_pattern = get_like_pattern(mode=mode, pattern=pattern)
+        column = self._model.path if like_pattern[0] in '%_' else sorted_path
+        statement = select(self._model.id, self._model.path, self._model.size, self._model.created_at)
+        statement = statement.where(self._model.user_id == user_id, column.like(like_pattern, escape='\\'))
+        if after is not None:
+            statement = statement.where(sorted_path > literal(after, type_=self._model.path.type))
+        return statement.order_by(sorted_path).limit(limit)
+
+    async def search_by_path(self, db: AsyncSession, user: ModelType, mode: str, pattern: str,
+                             after: Optional[str] = None, limit: int = 100) -> list:
+        statement = self.get_search_statement(user_id=user.id, mode=mode, pattern=pattern, after=after, limit=limit)
+        result = await db.execute(statement=statement)
+        return result.all()
+
+    async def get_stats_by_directory(self, db: AsyncSession, user: ModelType,
+                                     directory_id: Optional[UUID]) -> tuple[int, int, Optional[datetime]]:
+        column = self._model.directory_id
+        condition = column.is_(None) if directory_id is None else column == directory_id
+        statement = select(func.coalesce(func.sum(self._model.size), 0), func.count(), func.max(self._model.created_at))
+        result = await db.execute(statement=statement.where(condition, self._model.user_id == user.id))
+        return tuple(result.one())
+
+    async def get_list_by_directory(self, db: AsyncSession, user: ModelType, directory_id: Optional[UUID],
+                                    after: Optional[str] = None, limit: int = 100) -> list:
+        column = self._model.directory_id
+        condition = column.is_(None) if directory_id is None else column == directory_id
+        statement = select(self._model.id, self._model.name, self._model.path, self._model.size,
+                           self._model.created_at).where(condition, self._model.user_id == user.id)
+        if after is not None:
+            statement = statement.where(self._model.path > after)
+        result = await db.execute(statement=statement.order_by(self._model.path).limit(limit))
+        return result.all()
+
     async def create_or_put_file(self, db: AsyncSession, user: ModelType, file: File, file_path: str) -> Optional[ModelType]:
+        if normalize_path(file_path) != file_path:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Path is not allowed.')
         file_in_storage = await self.get_file_by_path(db=db, file_path=file_path)
         full_path = get_full_path(file_path)
+        if file_in_storage and file_in_storage.user_id != user.id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Path belongs to another user.')
         if file_in_storage:
-            return await put_file(db=db, full_path=full_path, file_obj=file_in_storage, file=file)
+            return await put_file(db=db, full_path=full_path, file_obj=file_in_storage, file=file, user=user)
         else:
-            return await create_file(db=db, file_path=file_path, full_path=full_path, create_directory=create_directory,
-                                     file=file, model=self._model, user=user)
+            return await create_file(db=db, file_path=file_path, full_path=full_path, file=file, model=self._model,
+                                     user=user)
+
+    async def get_owned_files(self, db: AsyncSession, user: ModelType,
+                              paths: list[str]) -> tuple[dict[str, tuple[str, int]], set[str]]:
+        existing, foreign = {}, set()
+        for batch in batched(paths, BATCH_SIZE):
+            statement = select(self._model.path, self._model.hash, self._model.size,
+                               self._model.user_id).where(self._model.path.in_(batch))
+            result = await db.execute(statement=statement)
+            for path, digest, size, user_id in result.all():
+                if user_id == user.id:
+                    existing[path] = (digest, size)
+                else:
+                    foreign.add(path)
+        return existing, foreign
+
+    @staticmethod
+    def get_changes(entries: list, existing: dict[str, tuple[str, int]]) -> list[tuple[str, int, int]]:
+        return [(entry.path, entry.size - existing[entry.path][1], 0) if entry.path in existing
+                else (entry.path, entry.size, 1) for entry in entries]
+
+    async def link_entries(self, db: AsyncSession, user: ModelType, entries: list,
+                           existing: dict[str, tuple[str, int]], link: Callable[[list], Awaitable[list]]) -> list:
+        changes = self.get_changes(entries, existing)
+        await update_usage(db=db, user_id=user.id, size_delta=sum(size for _, size, _ in changes),
+                           count_delta=sum(count for _, _, count in changes))
+        linked = await link(entries)
+        if len(linked) < len(entries):
+            unlinked = self.get_changes([entry for entry in entries if entry.status != 'stored'], existing)
+            await update_usage(db=db, user_id=user.id, size_delta=-sum(size for _, size, _ in unlinked),
+                               count_delta=-sum(count for _, _, count in unlinked), enforce=False)
+        return linked
+
+    async def insert_entries(self, db: AsyncSession, user: ModelType, entries: list,
+                             directory_ids: dict[str, UUID], created_at: datetime) -> dict[str, UUID]:
+        table = self._model.__table__
+        ids = {}
+        for batch in batched(entries, BATCH_SIZE):
+            statement = insert(table).values([{'id': uuid1(), 'user_id': user.id, 'name': entry.name, 'path': entry.path,
+                                               'size': entry.size, 'is_downloadable': True, 'hash': entry.digest,
+                                               'directory_id': directory_ids.get(get_parent_path(entry.path)),
+                                               'created_at': created_at} for entry in batch])
+            statement = statement.on_conflict_do_update(index_elements=['path'], set_={
+                'size': statement.excluded.size,
+                'hash': statement.excluded.hash,
+                'created_at': statement.excluded.created_at,
+            }, where=table.c.user_id == statement.excluded.user_id).returning(table.c.path, table.c.id)
+            result = await db.execute(statement)
+            ids.update(result.all())
+        return ids
+
+    async def bulk_create_or_put_files(self, db: AsyncSession, user: ModelType, entries: list,
+                                       link: Callable[[list], Awaitable[list]]) -> None:
+        existing, foreign = await self.get_owned_files(db=db, user=user, paths=[entry.path for entry in entries])
+        for entry in entries:
+            if entry.path in foreign:
+                entry.status, entry.detail = 'failed', 'Path belongs to another user.'
+        entries = [entry for entry in entries if entry.status == 'stored']
+        if entries:
+            entries = await self.link_entries(db=db, user=user, entries=entries, existing=existing, link=link)
+        if not entries:
+            await db.commit()
+            return
+        existing = {entry.path: existing[entry.path] for entry in entries if entry.path in existing}
+        directory_ids = await upsert_directories(db=db, user_id=user.id, file_paths=[entry.path for entry in entries])
+        sizes = {entry.digest: entry.size for entry in entries}
+        await acquire_blobs(db=db, blobs={digest: (sizes[digest], count)
+                                          for digest, count in Counter(entry.digest for entry in entries).items()})
+        await release_blobs(db=db, counts=Counter(digest for digest, _ in existing.values() if digest))
+        created_at = datetime.utcnow()
+        deltas = get_stats_deltas(self.get_changes(entries, existing))
+        await update_directory_stats(db=db, user_id=user.id, deltas=deltas, modified_at=created_at)
+        ids = await self.insert_entries(db=db, user=user, entries=entries, directory_ids=directory_ids,
+                                        created_at=created_at)
+        await db.commit()
+        for entry in entries:
+            if entry.path not in ids:
+                entry.status, entry.detail = 'failed', 'Path belongs to another user.'
+                continue
+            entry.id = ids[entry.path]
+            entry.status = 'updated' if entry.path in existing else 'created'
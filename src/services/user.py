@@ -8,7 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from src.models.models import Base
-from src.utils.password import get_hashed_password
+from src.utils.password import password_hasher
 
 
 ModelType = TypeVar("ModelType", bound=Base)
@@ -36,18 +36,19 @@ class RepositoryUserDB(Repository, Generic[ModelType, CreateSchemaType]):
         results = await db.execute(statement=statement)
         return results.scalar_one_or_none()
 
-    def create_object(self, data: dict):
+    def create_object(self, data: dict, hashed_password: str):
         extra_obj_data = {}
         user_id = str(uuid1())
         extra_obj_data['id'] = user_id
-        password = data.pop('password')
-        extra_obj_data['password'] = get_hashed_password(password)
+        data.pop('password')
+        extra_obj_data['password'] = hashed_password
         data.update(extra_obj_data)
         return self._model(**data)
 
     async def create(self, db: AsyncSession, *, obj: CreateSchemaType) -> ModelType:
         obj_json = jsonable_encoder(obj)
-        db_obj = self.create_object(obj_json)
+        hashed_password = await password_hasher.hash(obj_json['password'])
+        db_obj = self.create_object(obj_json, hashed_password)
         db.add(db_obj)
         await db.commit()
         await db.refresh(db_obj)
@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import suppress
+from typing import AsyncIterator, BinaryIO, Optional
+
+from src.core.logger import logger
+from src.core.settings import settings
+
+
+TEMP_SUFFIX = '.tmp'
+TEMP_MAX_AGE = 3600
+
+
+class ArchiveCache:
+    def __init__(self, path: str, max_size: int):
+        self._path = path
+        self._max_size = max_size
+        self._building: dict[str, asyncio.Future] = {}
+
+    def get_path(self, path: str, compression_type: str, version: str, level: Optional[int] = None,
+                 options: str = '') -> str:
+        key = '\0'.join((path, compression_type, str(level), options, version))
+        key = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self._path, '{}.{}'.format(key, compression_type))
+
+    @staticmethod
+    def touch(cache_path: str) -> Optional[os.stat_result]:
+        try:
+            os.utime(cache_path)
+            return os.stat(cache_path)
+        except FileNotFoundError:
+            return None
+
+    async def get(self, cache_path: str) -> Optional[os.stat_result]:
+        future = self._building.get(cache_path)
+        if future is not None:
+            await asyncio.shield(future)
+        return await asyncio.to_thread(self.touch, cache_path)
+
+    def claim(self, cache_path: str) -> Optional[asyncio.Future]:
+        if cache_path in self._building:
+            return None
+        future = self._building[cache_path] = asyncio.get_running_loop().create_future()
+        return future
+
+    def open_temp(self) -> tuple[BinaryIO, str]:
+        os.makedirs(self._path, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self._path, suffix=TEMP_SUFFIX)
+        return os.fdopen(fd, 'wb'), temp_path
+
+    async def build(self, cache_path: str, chunks: AsyncIterator[bytes], future: asyncio.Future) -> AsyncIterator[bytes]:
+        file, temp_path = None, None
+        try:
+            # Started by the caller, so an abandoned response still closes the generator and resolves the claim.
+            yield b''
+            file, temp_path = await asyncio.to_thread(self.open_temp)
+            async for chunk in chunks:
+                await asyncio.to_thread(file.write, chunk)
+                yield chunk
+            await asyncio.to_thread(file.close)
+            await asyncio.to_thread(os.replace, temp_path, cache_path)
+        except BaseException:
+            if file is not None:
+                file.close()
+                with suppress(FileNotFoundError):
+                    os.remove(temp_path)
+            raise
+        else:
+            asyncio.get_running_loop().run_in_executor(None, self.evict)
+        finally:
+            self._building.pop(cache_path, None)
+            future.set_result(None)
+
+    def evict(self) -> None:
+        entries, total = [], 0
+        now = time.time()
+        with os.scandir(self._path) as directory:
+            for entry in directory:
+                try:
+                    stat_result = entry.stat()
+                    if entry.name.endswith(TEMP_SUFFIX):
+                        if now - stat_result.st_mtime > TEMP_MAX_AGE:
+                            os.remove(entry.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+                total += stat_result.st_size
+        for _, size, path in sorted(entries):
+            if total <= self._max_size:
+                break
+            with suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+            logger.info('Archive %s evicted from cache', path)
+
+
+archive_cache = ArchiveCache(path=settings.archive_cache_path, max_size=settings.archive_cache_size)
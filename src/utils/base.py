@@ -1,3 +1,8 @@
+import os.path
+from itertools import islice
+import uuid
+from typing import Iterable, Iterator, Optional
+
 from src.core.settings import settings
 
 
@@ -5,3 +10,53 @@ def get_full_path(path: str):
     return settings.files_path + path
 
 
+def get_internal_paths() -> set[str]:
+    paths = (settings.blobs_path, settings.uploads_path, settings.archive_cache_path, settings.jobs_path)
+    return {os.path.normpath(path) for path in paths}
+
+
+def is_internal_path(full_path: str) -> bool:
+    full_path = os.path.normpath(full_path)
+    return any(full_path == path or full_path.startswith(path + os.sep) for path in get_internal_paths())
+
+
+def normalize_path(path: str) -> Optional[str]:
+    parts = [part for part in path.split('/') if part not in ('', '.')]
+    if not path.startswith('/') or '..' in parts or '\x00' in path:
+        return None
+    path = '/' + '/'.join(parts)
+    return None if is_internal_path(get_full_path(path)) else path
+
+
+def get_parent_dirs(path: str):
+    parts = path.split('/')[1:-1]
+    return ['/' + '/'.join(parts[:index]) for index in range(1, len(parts) + 1)]
+
+
+def parse_uuid(value: str) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        return None
+
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def get_like_pattern(mode: str, pattern: str) -> str:
+    if mode == 'prefix':
+        return escape_like(pattern) + '%'
+    if mode == 'substring':
+        return '%' + escape_like(pattern) + '%'
+    return escape_like(pattern).replace('*', '%').replace('?', '_')
+
+
+def get_blob_path(digest: str):
+    return os.path.join(settings.blobs_path, digest[:2], digest)
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
+from typing import BinaryIO, Callable, Optional
+
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.logger import logger
+from src.core.settings import settings
+from src.models.models import Blob
+
+from .base import batched, get_blob_path
+from .fsync import fsync_path
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+BATCH_SIZE = 1000
+
+
+def hash_path(path: str) -> tuple[str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def blob_exists(digest: str) -> bool:
+    return os.path.exists(get_blob_path(digest))
+
+
+def make_blob_temp(digest: Optional[str] = None) -> tuple[int, str]:
+    blob_dir = os.path.dirname(get_blob_path(digest)) if digest else settings.blobs_path
+    os.makedirs(blob_dir, exist_ok=True)
+    return tempfile.mkstemp(dir=blob_dir, suffix='.tmp')
+
+
+def commit_blob(temp_path: str, digest: str) -> None:
+    os.makedirs(os.path.dirname(get_blob_path(digest)), exist_ok=True)
+    os.replace(temp_path, get_blob_path(digest))
+
+
+def write_blob_temp(fileobj: BinaryIO) -> tuple[str, str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    fd, temp_path = make_blob_temp()
+    try:
+        with open(fd, 'wb') as f:
+            while chunk := fileobj.read(HASH_CHUNK_SIZE):
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, hasher.hexdigest(), size
+
+
+def store_stream(fileobj: BinaryIO) -> tuple[str, int]:
+    temp_path, digest, size = write_blob_temp(fileobj)
+    try:
+        if blob_exists(digest):
+            os.remove(temp_path)
+        else:
+            if settings.upload_fsync != 'none':
+                fsync_path(temp_path)
+            commit_blob(temp_path, digest)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return digest, size
+
+
+def adopt_blob(path: str, digest: str) -> None:
+    os.makedirs(os.path.dirname(get_blob_path(digest)), exist_ok=True)
+    os.replace(path, get_blob_path(digest))
+
+
+def link_blob(digest: str, full_path: str) -> None:
+    temp_path = '{}.{}.tmp'.format(full_path, uuid.uuid4().hex)
+    os.link(get_blob_path(digest), temp_path)
+    os.replace(temp_path, full_path)
+
+
+def unlink_blob(digest: str) -> bool:
+    blob_path = get_blob_path(digest)
+    try:
+        if os.stat(blob_path).st_nlink > 1:
+            return False
+        os.remove(blob_path)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+async def acquire_blob(db: AsyncSession, digest: str, size: int) -> None:
+    statement = insert(Blob).values(digest=digest, size=size, ref_count=1)
+    statement = statement.on_conflict_do_update(index_elements=[Blob.digest], set_={'ref_count': Blob.ref_count + 1})
+    await db.execute(statement)
+
+
+async def release_blob(db: AsyncSession, digest: str | None) -> None:
+    if not digest:
+        return
+    statement = update(Blob).where(Blob.digest == digest).values(ref_count=Blob.ref_count - 1)
+    await db.execute(statement)
+
+
+async def acquire_blobs(db: AsyncSession, blobs: dict[str, tuple[int, int]]) -> None:
+    rows = [{'digest': digest, 'size': size, 'ref_count': count} for digest, (size, count) in blobs.items()]
+    for batch in batched(rows, BATCH_SIZE):
+        statement = insert(Blob.__table__).values(batch)
+        statement = statement.on_conflict_do_update(index_elements=['digest'],
+                                                    set_={'ref_count': Blob.ref_count + statement.excluded.ref_count})
+        await db.execute(statement)
+
+
+async def release_blobs(db: AsyncSession, counts: dict[str, int]) -> None:
+    if not counts:
+        return
+    statement = update(Blob.__table__).where(Blob.digest == bindparam('b_digest'))
+    statement = statement.values(ref_count=Blob.ref_count - bindparam('b_count'))
+    await db.execute(statement, [{'b_digest': digest, 'b_count': count} for digest, count in counts.items()])
+
+
+async def collect_blobs(db: AsyncSession, limit: int) -> int:
+    unreferenced = select(Blob.digest).where(Blob.ref_count <= 0).limit(limit).with_for_update(skip_locked=True)
+    statement = delete(Blob).where(Blob.digest.in_(unreferenced.scalar_subquery())).returning(Blob.digest)
+    result = await db.execute(statement)
+    digests = result.scalars().all()
+    await db.commit()
+    for digest in digests:
+        await asyncio.to_thread(unlink_blob, digest)
+    return len(digests)
+
+
+async def collect_blobs_periodically(session_factory: Callable) -> None:
+    while True:
+        await asyncio.sleep(settings.blob_gc_interval)
+        try:
+            async with session_factory() as db:
+                collected = batch = await collect_blobs(db=db, limit=settings.blob_gc_batch)
+                while batch == settings.blob_gc_batch:
+                    batch = await collect_blobs(db=db, limit=settings.blob_gc_batch)
+                    collected += batch
+            logger.info('Blob garbage collection removed %s blobs', collected)
+        except Exception as exc:
+            logger.error('Blob garbage collection failed: %s', exc)
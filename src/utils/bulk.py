@@ -0,0 +1,356 @@
+import asyncio
+import io
+import os
+import queue
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Optional
+from uuid import UUID
+
+import pyzstd
+from fastapi import HTTPException, UploadFile, status
+from fastapi_cache.backends.redis import RedisCacheBackend
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.settings import settings
+from src.services.base import file_crud
+
+from .base import get_full_path, normalize_path
+from .blob import link_blob, store_stream, unlink_blob
+from .cache import delete_cache
+from .files import bump_list_version, get_file_info_key
+
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+RATIO_MIN_SIZE = 1024 * 1024
+QUEUE_POLL_INTERVAL = 0.1
+
+
+@dataclass
+class BulkEntry:
+    path: str
+    name: str
+    status: str = 'failed'
+    digest: Optional[str] = None
+    size: Optional[int] = None
+    id: Optional[UUID] = None
+    detail: Optional[str] = None
+
+
+class StreamAbortedError(Exception):
+    pass
+
+
+class QueueReader(io.RawIOBase):
+    def __init__(self, chunks: queue.Queue, aborted: threading.Event):
+        self._chunks = chunks
+        self._aborted = aborted
+        self._buffer = memoryview(b'')
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer and not self._eof:
+            try:
+                chunk = self._chunks.get(timeout=QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                if self._aborted.is_set():
+                    raise StreamAbortedError('Upload stream was interrupted.')
+                continue
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer = memoryview(chunk)
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class ExtractLimitError(Exception):
+    pass
+
+
+class ExtractLimits:
+    def __init__(self, compressed: int = 0):
+        self.compressed = compressed
+        self.entries = 0
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def check(self, size: int) -> None:
+        if size > settings.extract_max_size:
+            raise ExtractLimitError('Archive expands to more than {} bytes.'.format(settings.extract_max_size))
+        if size > settings.extract_max_ratio * max(self.compressed, RATIO_MIN_SIZE):
+            raise ExtractLimitError('Archive expands more than {} times.'.format(settings.extract_max_ratio))
+
+    def add_entry(self) -> None:
+        self.entries += 1
+        if self.entries > settings.extract_max_entries:
+            raise ExtractLimitError('Archive has more than {} entries.'.format(settings.extract_max_entries))
+
+    def add_compressed(self, size: int) -> None:
+        self.compressed += size
+
+    def add_bytes(self, size: int) -> None:
+        with self._lock:
+            self.size += size
+            self.check(self.size)
+
+
+class CountingReader(io.RawIOBase):
+    def __init__(self, fileobj: BinaryIO, counter: Callable[[int], None]):
+        self._fileobj = fileobj
+        self._counter = counter
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = self._fileobj.readinto(buffer)
+        self._counter(size)
+        return size
+
+
+class LimitedReader(io.RawIOBase):
+    def __init__(self, fileobj: BinaryIO, limits: ExtractLimits):
+        self._fileobj = fileobj
+        self._limits = limits
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._fileobj.read(len(buffer))
+        self._limits.add_bytes(len(data))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def make_entry(base: str, name: str) -> BulkEntry:
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    path = normalize_path(base.rstrip('/') + '/' + '/'.join(parts)) if parts else None
+    if path is None:
+        return BulkEntry(path=name, name=name, detail='Entry path is not allowed.')
+    return BulkEntry(path=path, name=parts[-1])
+
+
+def store_entry(entry: BulkEntry, fileobj: BinaryIO) -> BulkEntry:
+    try:
+        entry.digest, entry.size = store_stream(fileobj)
+        entry.status = 'stored'
+    except (OSError, tarfile.TarError, zipfile.BadZipFile) as exc:
+        entry.detail = str(exc)
+    return entry
+
+
+def discard_entries(entries: list[BulkEntry]) -> None:
+    committed = {entry.digest for entry in entries if entry.status in ('created', 'updated')}
+    for digest in {entry.digest for entry in entries if entry.digest} - committed:
+        unlink_blob(digest)
+
+
+def open_tar(fileobj: BinaryIO) -> tarfile.TarFile:
+    reader = io.BufferedReader(fileobj)
+    if reader.peek(len(ZSTD_MAGIC))[:len(ZSTD_MAGIC)] == ZSTD_MAGIC:
+        return tarfile.open(fileobj=pyzstd.ZstdFile(reader), mode='r|')
+    return tarfile.open(fileobj=reader, mode='r|*')
+
+
+def extract_tar(fileobj: BinaryIO, base: str, limits: ExtractLimits) -> list[BulkEntry]:
+    entries = []
+    slots = threading.BoundedSemaphore(settings.bulk_concurrency)
+
+    def store_buffered(entry: BulkEntry, data: bytes) -> None:
+        try:
+            store_entry(entry, io.BytesIO(data))
+        finally:
+            slots.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=settings.bulk_concurrency) as executor, open_tar(fileobj) as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                limits.add_entry()
+                entry = make_entry(base, member.name)
+                entries.append(entry)
+                if entry.detail is not None:
+                    continue
+                member_file = LimitedReader(archive.extractfile(member), limits)
+                if member.size > settings.extract_buffer_size:
+                    store_entry(entry, member_file)
+                    continue
+                data = member_file.read()
+                slots.acquire()
+                executor.submit(store_buffered, entry, data)
+    except BaseException:
+        discard_entries(entries)
+        raise
+    return entries
+
+
+def extract_zip(fileobj: BinaryIO, base: str, limits: ExtractLimits) -> list[BulkEntry]:
+    with zipfile.ZipFile(fileobj) as archive:
+        members = [member for member in archive.infolist() if not member.is_dir()]
+        for _ in members:
+            limits.add_entry()
+        limits.check(sum(member.file_size for member in members))
+        entries = [make_entry(base, member.filename) for member in members]
+
+        def extract_member(index: int) -> BulkEntry:
+            entry = entries[index]
+            if entry.detail is None:
+                with archive.open(members[index]) as member_file:
+                    store_entry(entry, LimitedReader(member_file, limits))
+            return entry
+
+        try:
+            with ThreadPoolExecutor(max_workers=settings.bulk_concurrency) as executor:
+                return list(executor.map(extract_member, range(len(members))))
+        except BaseException:
+            discard_entries(entries)
+            raise
+
+
+def extract_file(fileobj: BinaryIO, base: str) -> list[BulkEntry]:
+    limits = ExtractLimits(compressed=fileobj.seek(0, os.SEEK_END))
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        return extract_zip(fileobj, base, limits)
+    fileobj.seek(0)
+    return extract_tar(fileobj, base, limits)
+
+
+async def feed_queue(stream: AsyncIterator[bytes], chunks: queue.Queue, aborted: threading.Event,
+                     worker: asyncio.Future) -> None:
+    completed = False
+    try:
+        async for data in stream:
+            while not worker.done():
+                try:
+                    await asyncio.to_thread(chunks.put, data, True, QUEUE_POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    continue
+        while not worker.done():
+            try:
+                await asyncio.to_thread(chunks.put, None, True, QUEUE_POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        completed = True
+    finally:
+        if not completed:
+            aborted.set()
+
+
+async def extract_tar_stream(stream: AsyncIterator[bytes], base: str) -> list[BulkEntry]:
+    chunks = queue.Queue(maxsize=settings.archive_queue_size)
+    aborted = threading.Event()
+    limits = ExtractLimits()
+    reader = CountingReader(QueueReader(chunks, aborted), limits.add_compressed)
+    worker = asyncio.ensure_future(asyncio.to_thread(extract_tar, reader, base, limits))
+    try:
+        await feed_queue(stream=stream, chunks=chunks, aborted=aborted, worker=worker)
+    except BaseException:
+        worker.add_done_callback(lambda future: future.cancelled() or future.exception())
+        raise
+    return await worker
+
+
+async def extract_zip_stream(stream: AsyncIterator[bytes], base: str) -> list[BulkEntry]:
+    os.makedirs(settings.uploads_path, exist_ok=True)
+    with tempfile.SpooledTemporaryFile(max_size=settings.bulk_spool_size, dir=settings.uploads_path) as spool:
+        async for data in stream:
+            await asyncio.to_thread(spool.write, data)
+        limits = ExtractLimits(compressed=spool.tell())
+        await asyncio.to_thread(spool.seek, 0)
+        return await asyncio.to_thread(extract_zip, spool, base, limits)
+
+
+ARCHIVE_EXTRACTORS = {
+    'tar': extract_tar_stream,
+    'zip': extract_zip_stream,
+}
+
+
+async def guard_extraction(extraction: Awaitable[list[BulkEntry]], base: str) -> list[BulkEntry]:
+    try:
+        return await extraction
+    except ExtractLimitError as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    except (tarfile.TarError, zipfile.BadZipFile, pyzstd.ZstdError, EOFError) as exc:
+        return [BulkEntry(path=base, name=base, detail='Archive is broken: {}'.format(exc))]
+
+
+async def extract_archive(stream: AsyncIterator[bytes], base: str, archive_type: str) -> list[BulkEntry]:
+    return await guard_extraction(ARCHIVE_EXTRACTORS[archive_type](stream=stream, base=base), base=base)
+
+
+async def extract_upload(upload: UploadFile, base: str) -> list[BulkEntry]:
+    return await guard_extraction(asyncio.to_thread(extract_file, upload.file, base), base=base)
+
+
+async def save_uploads(files: list[UploadFile], base: str) -> list[BulkEntry]:
+    semaphore = asyncio.Semaphore(settings.bulk_concurrency)
+
+    async def save_upload(upload: UploadFile) -> BulkEntry:
+        entry = make_entry(base, upload.filename or '')
+        if entry.detail is None:
+            async with semaphore:
+                await asyncio.to_thread(store_entry, entry, upload.file)
+        return entry
+
+    return list(await asyncio.gather(*(save_upload(upload) for upload in files)))
+
+
+def link_entries(entries: list[BulkEntry]) -> None:
+    for entry in entries:
+        full_path = get_full_path(entry.path)
+        try:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            link_blob(entry.digest, full_path)
+        except OSError as exc:
+            entry.status, entry.detail = 'failed', str(exc)
+
+
+def drop_duplicates(entries: list[BulkEntry]) -> list[BulkEntry]:
+    counts = Counter(entry.path for entry in entries if entry.status == 'stored')
+    for entry in entries:
+        if entry.status == 'stored' and counts[entry.path] > 1:
+            counts[entry.path] -= 1
+            entry.status, entry.detail = 'failed', 'Entry is overwritten later in the batch.'
+    return [entry for entry in entries if entry.status == 'stored']
+
+
+async def link_stored(entries: list[BulkEntry]) -> list[BulkEntry]:
+    await asyncio.to_thread(link_entries, entries)
+    return [entry for entry in entries if entry.status == 'stored']
+
+
+async def commit_entries(db: AsyncSession, user: Any, entries: list[BulkEntry]) -> list[dict]:
+    stored = drop_duplicates(entries)
+    try:
+        if stored:
+            await file_crud.bulk_create_or_put_files(db=db, user=user, entries=stored, link=link_stored)
+    except HTTPException:
+        await db.rollback()
+        raise
+    finally:
+        await asyncio.to_thread(discard_entries, entries)
+    return [asdict(entry) for entry in entries]
+
+
+async def forget_bulk_entries(redis_cache: RedisCacheBackend, user_id: UUID, entries: list[dict]) -> None:
+    await bump_list_version(redis_cache=redis_cache, user_id=user_id)
+    await asyncio.gather(*(delete_cache(redis_cache, get_file_info_key(entry['path']))
+                           for entry in entries if entry['status'] == 'updated'))
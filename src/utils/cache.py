@@ -1,12 +1,63 @@
+import asyncio
 import json
+import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
-from typing import Callable, Type
+from typing import Any, Callable, Hashable, Optional, Type
 
+import orjson
+import redis.asyncio
 from fastapi_cache import caches
 from fastapi_cache.backends.redis import CACHE_KEY, RedisCacheBackend
 from pydantic import BaseModel
 
+from src.core.logger import logger
+from src.core.metrics import timed
+from src.core.settings import settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + min(ttl or self._ttl, self._ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0}
+
 
 def redis_cache():
     return caches.get(CACHE_KEY)
@@ -20,25 +71,190 @@ def serialized_data(value):
     return value
 
 
-async def get_cache(redis_cache: RedisCacheBackend, redis_key: str) -> dict:
-    data = await redis_cache.get(redis_key)
-    if data:
-        data = json.loads(data)
+class JsonCodec:
+    def encode(self, data: Any) -> bytes:
+        return json.dumps(data, default=serialized_data).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    def encode(self, data: Any) -> bytes:
+        return orjson.dumps(data, default=serialized_data)
+
+    def decode(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError('msgpack is not installed, choose another CACHE_CODEC.')
+
+    def encode(self, data: Any) -> bytes:
+        return msgpack.packb(data, default=serialized_data)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data)
+
+
+CACHE_CODECS = {
+    'json': JsonCodec,
+    'orjson': OrjsonCodec,
+    'msgpack': MsgpackCodec,
+}
+
+codec = CACHE_CODECS[settings.cache_codec]()
+local_cache = TTLCache(maxsize=settings.cache_local_size, ttl=settings.cache_local_ttl)
+
+
+class CacheInvalidator:
+    def __init__(self, redis_url: str, channel: str):
+        self._redis_url = redis_url
+        self._channel = channel
+        self._origin = uuid.uuid4().hex
+        self._caches = [local_cache]
+        self._client: Optional[redis.asyncio.Redis] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> redis.asyncio.Redis:
+        if self._client is None:
+            self._client = redis.asyncio.from_url(self._redis_url)
+        return self._client
+
+    def pool_stats(self) -> dict:
+        if self._client is None:
+            return {}
+        pool = self._client.connection_pool
+        return {'created': pool._created_connections, 'available': len(pool._available_connections),
+                'in_use': len(pool._in_use_connections), 'max': pool.max_connections}
+
+    def register(self, cache: TTLCache) -> None:
+        self._caches.append(cache)
+
+    def drop(self, key: str) -> None:
+        for cache in self._caches:
+            cache.delete(key)
+
+    async def start(self) -> None:
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+        if self._client:
+            await self._client.close()
+            self._client = None
+
+    async def publish(self, key: str) -> None:
+        if self._client is None:
+            return
+        try:
+            await self._client.publish(self._channel, '{}:{}'.format(self._origin, key))
+        except redis.RedisError as exc:
+            logger.warning('Cache invalidation for %s was not published: %s', key, exc)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self._channel)
+                    async for message in pubsub.listen():
+                        if message['type'] != 'message':
+                            continue
+                        origin, _, key = message['data'].decode().partition(':')
+                        if origin != self._origin:
+                            self.drop(key)
+            except redis.RedisError as exc:
+                logger.warning('Cache invalidation listener reconnects: %s', exc)
+                await asyncio.sleep(1)
+
+
+def get_redis_pool_stats() -> dict:
+    backend = caches.get(CACHE_KEY)
+    pool = getattr(getattr(backend, '_pool', None), '_pool_or_conn', None)
+    if pool is None or not hasattr(pool, 'freesize'):
+        return {}
+    return {'size': pool.size, 'free': pool.freesize, 'max': pool.maxsize}
+
+
+cache_invalidator = CacheInvalidator(redis_url=settings.redis_url, channel=settings.cache_invalidation_channel)
+in_flight: dict[str, asyncio.Future] = {}
+
+
+async def get_cache(redis_cache: RedisCacheBackend, redis_key: str, local: bool = True) -> Any:
+    if local:
+        data = local_cache.get(redis_key)
+        if data is not None:
+            return data
+    with timed('cache_get'):
+        data = await redis_cache.get(redis_key, encoding=None)
+    if not data:
+        return None
+    try:
+        data = codec.decode(data)
+    except ValueError:
+        return None
+    if local:
+        local_cache.set(redis_key, data)
     return data
 
 
-async def set_cache(redis_cache: RedisCacheBackend, data: dict, redis_key: str, expire: int = 30):
-    await redis_cache.set(key=redis_key, value=json.dumps(data, default=serialized_data), expire=expire)
+async def set_cache(redis_cache: RedisCacheBackend, data: Any, redis_key: str, expire: int = 30, local: bool = True):
+    encoded = codec.encode(data)
+    with timed('cache_set'):
+        await redis_cache.set(key=redis_key, value=encoded, expire=expire)
+    if local:
+        local_cache.set(redis_key, codec.decode(encoded), ttl=expire)
+    await cache_invalidator.publish(redis_key)
+
+
+async def delete_cache(redis_cache: RedisCacheBackend, redis_key: str):
+    cache_invalidator.drop(redis_key)
+    await redis_cache.delete(redis_key)
+    await cache_invalidator.publish(redis_key)
+
+
+async def wait_in_flight(redis_key: str) -> tuple[bool, Any]:
+    while redis_key in in_flight:
+        future = in_flight[redis_key]
+        try:
+            return True, await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+    return False, None
 
 
 async def get_cache_or_data(redis_key: str, redis_cache: RedisCacheBackend, db_obj: Callable, data_schema: Type[BaseModel],
                             db_args: tuple = (), db_kwargs: dict = {}, cache_expire: int = 30):
     data = await get_cache(redis_cache, redis_key)
-    if not data:
-        data = await db_obj(*db_args, **db_kwargs)
+    if data:
+        return data
+    shared, data = await wait_in_flight(redis_key)
+    if shared:
+        return data
+    future = asyncio.get_running_loop().create_future()
+    in_flight[redis_key] = future
+    try:
+        with timed('db_lookup'):
+            data = await db_obj(*db_args, **db_kwargs)
         if data:
             data = data_schema.from_orm(data).dict()
             await set_cache(redis_cache=redis_cache, data=data, redis_key=redis_key, expire=cache_expire)
         else:
-            return None
+            data = None
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception()
+        raise
+    else:
+        future.set_result(data)
+    finally:
+        in_flight.pop(redis_key, None)
     return data
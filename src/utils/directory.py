@@ -1,15 +1,82 @@
 import uuid
+from collections import defaultdict
+from datetime import datetime
+from itertools import groupby
+from typing import Iterable, Optional
 
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
 
 from src.models.models import Directory
+from src.utils.base import batched, get_parent_dirs
 
 
-async def create_directory(db: AsyncSession, path: str) -> Directory:
+async def create_directory(db: AsyncSession, user_id: uuid.UUID, path: str) -> Directory:
     directory_id = str(uuid.uuid1())
-    directory_obj = Directory(id=directory_id, path=path)
+    directory_obj = Directory(id=directory_id, user_id=user_id, path=path)
 
     db.add(directory_obj)
     await db.commit()
     await db.refresh(directory_obj)
     return directory_obj
+
+
+def get_parent_path(path: str) -> Optional[str]:
+    parents = get_parent_dirs(path)
+    return parents[-1] if parents else None
+
+
+def get_depth(path: str) -> int:
+    return path.count('/')
+
+
+async def get_directory_ids(db: AsyncSession, user_id: uuid.UUID, paths: Iterable[str]) -> dict[str, uuid.UUID]:
+    ids = {}
+    for batch in batched(list(paths), 1000):
+        statement = select(Directory.path, Directory.id).where(Directory.user_id == user_id, Directory.path.in_(batch))
+        result = await db.execute(statement)
+        ids.update(result.all())
+    return ids
+
+
+async def upsert_directories(db: AsyncSession, user_id: uuid.UUID, file_paths: Iterable[str]) -> dict[str, uuid.UUID]:
+    paths = {path for file_path in file_paths for path in get_parent_dirs(file_path)}
+    ids = await get_directory_ids(db=db, user_id=user_id, paths=paths)
+    missing = sorted(paths - ids.keys(), key=get_depth)
+    for _, level in groupby(missing, key=get_depth):
+        level = list(level)
+        for batch in batched(level, 1000):
+            statement = insert(Directory).values([{'id': uuid.uuid1(), 'user_id': user_id, 'path': path,
+                                                   'total_size': 0, 'file_count': 0, 'version': 0,
+                                                   'parent_id': ids.get(get_parent_path(path))} for path in batch])
+            await db.execute(statement.on_conflict_do_nothing(index_elements=['user_id', 'path']))
+        ids.update(await get_directory_ids(db=db, user_id=user_id, paths=level))
+    return ids
+
+
+def get_stats_deltas(changes: Iterable[tuple[str, int, int]]) -> dict[str, tuple[int, int]]:
+    deltas = defaultdict(lambda: [0, 0])
+    for path, size, count in changes:
+        for parent in get_parent_dirs(path):
+            deltas[parent][0] += size
+            deltas[parent][1] += count
+    return {path: (size, count) for path, (size, count) in deltas.items()}
+
+
+async def update_directory_stats(db: AsyncSession, user_id: uuid.UUID, deltas: dict[str, tuple[int, int]],
+                                 modified_at: datetime) -> None:
+    if not deltas:
+        return
+    table = Directory.__table__
+    statement = update(table).where(table.c.user_id == user_id, table.c.path == bindparam('dir_path')).values(
+        total_size=table.c.total_size + bindparam('size_delta'),
+        file_count=table.c.file_count + bindparam('count_delta'),
+        version=table.c.version + 1,
+        updated_at=func.greatest(func.coalesce(table.c.updated_at, bindparam('modified_at')), bindparam('modified_at')),
+    )
+    params = [{'dir_path': path, 'size_delta': size, 'count_delta': count, 'modified_at': modified_at}
+              for path, (size, count) in sorted(deltas.items())]
+    for batch in batched(params, 1000):
+        await db.execute(statement, batch)
@@ -0,0 +1,94 @@
+import asyncio
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import SyncManager
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, status
+
+from src.core.logger import logger
+from src.core.settings import settings
+
+
+class CompressionSlot:
+    def __init__(self, executor: 'CompressionExecutor'):
+        self._executor = executor
+        self._released = False
+
+    def __enter__(self) -> 'CompressionSlot':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._executor._pending -= 1
+
+
+class CompressionExecutor:
+    def __init__(self, max_workers: int, max_pending: int, start_method: str = 'spawn'):
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._context = multiprocessing.get_context(start_method)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager: Optional[SyncManager] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def stats(self) -> dict:
+        return {'pending': self._pending, 'max_pending': self._max_pending, 'workers': self._max_workers}
+
+    def start(self) -> None:
+        if self._pool is not None:
+            return
+        self._manager = self._context.Manager()
+        self._pool = ProcessPoolExecutor(max_workers=self._max_workers, mp_context=self._context)
+        logger.info('Compression executor started with %s workers', self._max_workers)
+
+    def shutdown(self) -> None:
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._manager.shutdown()
+        self._pool, self._manager = None, None
+
+    def acquire(self) -> CompressionSlot:
+        self._pending += 1
+        return CompressionSlot(self)
+
+    def try_acquire(self) -> CompressionSlot:
+        if self._pending >= self._max_pending:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Compression queue is full.',
+                                headers={'Retry-After': '1'})
+        return self.acquire()
+
+    def channel(self, maxsize: int) -> tuple[queue.Queue, threading.Event]:
+        self.start()
+        return self._manager.Queue(maxsize=maxsize), self._manager.Event()
+
+    def submit(self, chunks: queue.Queue, func: Callable, *args: Any) -> asyncio.Future:
+        self.start()
+        job = asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        job.add_done_callback(lambda future: forward_failure(future, chunks))
+        return job
+
+
+def forward_failure(job: asyncio.Future, chunks: queue.Queue) -> None:
+    if job.cancelled() or job.exception() is None:
+        return
+    try:
+        chunks.put_nowait(job.exception())
+    except (queue.Full, EOFError, OSError):
+        pass
+
+
+compression_executor = CompressionExecutor(max_workers=settings.compression_workers,
+                                           max_pending=settings.compression_max_pending,
+                                           start_method=settings.compression_start_method)
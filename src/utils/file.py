@@ -1,46 +1,119 @@
+import asyncio
 import os.path
+import uuid
+from contextlib import suppress
 from datetime import datetime
-from typing import Callable, Type
+from typing import Optional, Type
 
-from aioshutil import copyfileobj
-from fastapi import File
+from fastapi import File, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.metrics import timed
 from src.models.models import File as FileModel, User
-from src.core.settings import settings
+from src.utils.base import get_blob_path
+from src.utils.blob import (acquire_blob, adopt_blob, blob_exists, commit_blob, hash_path, link_blob, release_blob,
+                            unlink_blob, write_blob_temp)
+from src.utils.directory import get_parent_path, get_stats_deltas, update_directory_stats, upsert_directories
+from src.utils.fsync import fsync_batcher
+from src.utils.upload import AssembledFile
+from src.utils.usage import update_usage
 
 
-async def write_down_to_file(file: File, full_path: str):
-    with open(full_path, 'wb') as f:
-        await copyfileobj(file.file, f)
+async def adopt_assembled_file(file: AssembledFile) -> tuple[str, int, Optional[str]]:
+    with timed('upload_hash'):
+        digest, size = await asyncio.to_thread(hash_path, file.path)
+    if await asyncio.to_thread(blob_exists, digest):
+        return digest, size, file.path
+    await fsync_batcher.sync(file.path)
+    await asyncio.to_thread(adopt_blob, file.path, digest)
+    await fsync_batcher.sync(os.path.dirname(get_blob_path(digest)))
+    return digest, size, None
 
 
-async def create_file(db: AsyncSession, file_path: str, full_path: str, create_directory: Callable, file: File,
-                      model: Type[FileModel], user: Type[User]):
-    files_path = settings.files_path
-    for dir_name in file_path.split('/')[1:-1]:
-        path = os.path.join(files_path, dir_name)
-        if os.path.exists(path):
-            continue
-        else:
-            os.mkdir(path)
-            await create_directory(db=db, path=path)
-    await write_down_to_file(file=file, full_path=full_path)
-    size = os.path.getsize(full_path)
-    created_file = model(name=file.filename, path=file_path, size=size, is_downloadable=True, user=user)
+async def write_down_to_file(file: File) -> tuple[str, int, Optional[str]]:
+    if isinstance(file, AssembledFile):
+        return await adopt_assembled_file(file)
+    with timed('disk_write'):
+        temp_path, digest, size = await asyncio.to_thread(write_blob_temp, file.file)
+    try:
+        if await asyncio.to_thread(blob_exists, digest):
+            # Kept until linked, the existing blob may be collected in between.
+            return digest, size, temp_path
+        await fsync_batcher.sync(temp_path)
+        await asyncio.to_thread(commit_blob, temp_path, digest)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+    await fsync_batcher.sync(os.path.dirname(get_blob_path(digest)))
+    return digest, size, None
+
+
+async def link_file(digest: str, full_path: str, spare_path: Optional[str]) -> None:
+    try:
+        await asyncio.to_thread(link_blob, digest, full_path)
+    except FileNotFoundError:
+        if spare_path is None:
+            raise
+        await fsync_batcher.sync(spare_path)
+        await asyncio.to_thread(adopt_blob, spare_path, digest)
+        await asyncio.to_thread(link_blob, digest, full_path)
+    if spare_path is not None:
+        with suppress(FileNotFoundError):
+            await asyncio.to_thread(os.remove, spare_path)
+
+
+async def store_file(db: AsyncSession, file: File, full_path: str, user_id: uuid.UUID,
+                     replaced_size: Optional[int] = None) -> tuple[str, int]:
+    digest, size, spare_path = await write_down_to_file(file=file)
+    try:
+        await update_usage(db=db, user_id=user_id, size_delta=size - (replaced_size or 0),
+                           count_delta=0 if replaced_size is not None else 1)
+        await acquire_blob(db=db, digest=digest, size=size)
+        await link_file(digest=digest, full_path=full_path, spare_path=spare_path)
+    except BaseException as exc:
+        if spare_path is None and isinstance(exc, HTTPException):
+            await asyncio.to_thread(unlink_blob, digest)
+        elif spare_path is not None and not isinstance(file, AssembledFile):
+            with suppress(FileNotFoundError):
+                os.remove(spare_path)
+        raise
+    await fsync_batcher.sync(os.path.dirname(full_path))
+    return digest, size
+
+
+async def create_file(db: AsyncSession, file_path: str, full_path: str, file: File, model: Type[FileModel],
+                      user: Type[User]):
+    await asyncio.to_thread(os.makedirs, os.path.dirname(full_path), exist_ok=True)
+    digest, size = await store_file(db=db, file=file, full_path=full_path, user_id=user.id)
+    directory_ids = await upsert_directories(db=db, user_id=user.id, file_paths=[file_path])
+    created_at = datetime.utcnow()
+    await update_directory_stats(db=db, user_id=user.id, deltas=get_stats_deltas([(file_path, size, 1)]),
+                                 modified_at=created_at)
+    created_file = model(name=file.filename, path=file_path, size=size, is_downloadable=True, hash=digest,
+                         user_id=user.id, directory_id=directory_ids.get(get_parent_path(file_path)), created_at=created_at)
 
     db.add(created_file)
-    await db.commit()
+    with timed('db_commit'):
+        await db.commit()
     await db.refresh(created_file)
     return created_file
 
 
-async def put_file(db: AsyncSession, file: File, full_path: str, file_obj: Type[FileModel]):
-    await write_down_to_file(file=file, full_path=full_path)
-    size = os.path.getsize(full_path)
+async def put_file(db: AsyncSession, file: File, full_path: str, file_obj: Type[FileModel], user: Type[User]):
+    previous_digest = file_obj.hash
+    digest, size = await store_file(db=db, file=file, full_path=full_path, user_id=user.id,
+                                    replaced_size=file_obj.size)
+    await release_blob(db=db, digest=previous_digest)
+    modified_at = datetime.utcnow()
+    await update_directory_stats(db=db, user_id=user.id,
+                                 deltas=get_stats_deltas([(file_obj.path, size - file_obj.size, 0)]),
+                                 modified_at=modified_at)
+    file_obj.hash = digest
     file_obj.size = size
-    file_obj.created_at = datetime.utcnow()
+    file_obj.created_at = modified_at
 
-    await db.commit()
+    with timed('db_commit'):
+        await db.commit()
     await db.refresh(file_obj)
     return file_obj
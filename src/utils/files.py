@@ -1,41 +1,244 @@
+import asyncio
+import base64
+import fnmatch
+import functools
+import binascii
+import gzip
+import hashlib
 import io
-import logging.config
+import json
 import os.path
+import queue
+import shutil
 import tarfile
+import tempfile
+import threading
+import time
+import uuid
 import zipfile
-from io import BytesIO
-from typing import Callable
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, BinaryIO, Callable, Iterator, Optional
 
 import py7zr
-from fastapi import HTTPException, status
+import pyzstd
+from fastapi import HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
 from fastapi_cache.backends.redis import RedisCacheBackend
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
 
 from src.core.logger import logger
+from src.core.metrics import ARCHIVE_BYTES, ARCHIVE_LATENCY, timed
+from src.core.settings import settings
 from src.schemes import file as file_schema
 from src.services.base import directory_crud, file_crud
 
-from .base import get_full_path
-from .cache import get_cache_or_data
+from .base import get_full_path, get_internal_paths, normalize_path, parse_uuid
+from .cache import get_cache, get_cache_or_data, serialized_data, set_cache
+from .archive_cache import archive_cache
+from .executor import CompressionSlot, compression_executor
+from .response import RangeFileResponse, get_content_disposition
 
 
 async def get_file_data(db: AsyncSession, path: str):
-    if path.find('/') != -1:
+    file_id = parse_uuid(path)
+    if file_id is None:
         file_data = await file_crud.get_file_by_path(db=db, file_path=path)
     else:
-        file_data = await file_crud.get_file_by_id(db=db, file_id=path)
+        file_data = await file_crud.get_file_by_id(db=db, file_id=file_id)
     if not file_data:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
     return file_data
 
 
+def encode_cursor(query: file_schema.FilesQuery, file_obj: Any) -> str:
+    payload = [query.sort, serialized_data(getattr(file_obj, query.sort_field)), str(file_obj.id)]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(query: file_schema.FilesQuery) -> Optional[tuple[Any, uuid.UUID]]:
+    if not query.cursor:
+        return None
+    try:
+        sort, value, file_id = json.loads(base64.urlsafe_b64decode(query.cursor))
+        if sort != query.sort:
+            raise ValueError('Cursor belongs to another sort order.')
+        if query.sort_field == 'created_at':
+            value = datetime.fromisoformat(value)
+        return value, uuid.UUID(file_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor.')
+
+
+def get_file_info_key(path: str) -> str:
+    return 'file_info_for_{}'.format(path)
+
+
+def get_list_version_key(user_id: uuid.UUID) -> str:
+    return 'list_version_{}'.format(user_id)
+
+
+async def bump_list_version(redis_cache: RedisCacheBackend, user_id: uuid.UUID) -> None:
+    await redis_cache.set(get_list_version_key(user_id), uuid.uuid4().hex)
+
+
+async def get_files_page(db: AsyncSession, redis_cache: RedisCacheBackend, user: Any,
+                         query: file_schema.FilesQuery) -> dict:
+    version = await redis_cache.get(get_list_version_key(user.id)) or '0'
+    query_hash = hashlib.md5(query.json(sort_keys=True).encode()).hexdigest()
+    redis_key = 'list_for_{}_{}_{}'.format(user.id, version, query_hash)
+    cache_data = await get_cache(redis_cache, redis_key)
+    if cache_data:
+        return cache_data
+    with timed('db_lookup'):
+        files = await file_crud.get_list_by_user(db=db, user=user, query=query, after=decode_cursor(query))
+    next_cursor = encode_cursor(query, files[-1]) if len(files) == query.limit else None
+    cache_data = {'account_id': user.id, 'files': [file_schema.File.from_orm(file_obj).dict() for file_obj in files],
+                  'next_cursor': next_cursor}
+    await set_cache(redis_cache, cache_data, redis_key, expire=settings.list_cache_expire)
+    return cache_data
+
+
+async def search_files(db: AsyncSession, user: Any, mode: str, pattern: str, limit: int, cursor: Optional[str]) -> dict:
+    query = file_schema.FilesQuery(limit=limit, cursor=cursor, sort='path')
+    after = decode_cursor(query)
+    rows = await file_crud.search_by_path(db=db, user=user, mode=mode, pattern=pattern,
+                                          after=after[0] if after else None, limit=limit)
+    next_cursor = encode_cursor(query, rows[-1]) if len(rows) == limit else None
+    return {'files': rows, 'next_cursor': next_cursor}
+
+
+async def get_directory_listing(db: AsyncSession, path: str, user: Any) -> dict:
+    path = '/' + path.strip('/') if path.strip('/') else '/'
+    if path == '/':
+        directory = None
+    else:
+        directory = await directory_crud.get_dir_by_path(db=db, dir_path=path, user_id=user.id)
+        if not directory:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Directory not found')
+    children = await directory_crud.get_children(db=db, user_id=user.id, parent_id=directory.id if directory else None)
+    if directory is None:
+        size, count, updated_at = await file_crud.get_stats_by_directory(db=db, user=user, directory_id=None)
+        timestamps = [value for value in (updated_at, *(child.updated_at for child in children)) if value]
+        directory = {
+            'path': path,
+            'total_size': size + sum(child.total_size for child in children),
+            'file_count': count + sum(child.file_count for child in children),
+            'updated_at': max(timestamps, default=None),
+        }
+    return {'directory': directory, 'directories': children}
+
+
+def encode_children_cursor(child: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([child['type'], child['path']]).encode()).decode()
+
+
+def decode_children_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        kind, path = json.loads(base64.urlsafe_b64decode(cursor))
+        if kind not in ('directory', 'file') or not isinstance(path, str):
+            raise ValueError('Cursor is not a children cursor.')
+        return kind, path
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor.')
+
+
+async def get_directory_by_ref(db: AsyncSession, directory_ref: str, user: Any) -> Optional[Any]:
+    if directory_ref == 'root':
+        return None
+    directory_id = parse_uuid(directory_ref)
+    directory = await directory_crud.get_dir_by_id(db=db, dir_id=directory_id,
+                                                   user_id=user.id) if directory_id else None
+    if directory is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Directory not found')
+    return directory
+
+
+def get_children_etag(directory: Optional[Any], user_id: uuid.UUID, limit: int, cursor: Optional[str]) -> Optional[str]:
+    if directory is None:
+        return None
+    query_hash = hashlib.md5('{}:{}:{}'.format(user_id, limit, cursor).encode()).hexdigest()[:16]
+    return 'W/"{}-{}-{}"'.format(directory.id, directory.version, query_hash)
+
+
+def get_listing_etag(listing: dict) -> str:
+    return 'W/"{}"'.format(hashlib.md5(json.dumps(listing, default=serialized_data).encode()).hexdigest())
+
+
+async def get_directory_children(db: AsyncSession, directory: Optional[Any], user: Any, limit: int,
+                                 cursor: Optional[str]) -> dict:
+    kind, after = decode_children_cursor(cursor) if cursor else ('directory', None)
+    directory_id = directory.id if directory else None
+    children = []
+    if kind == 'directory':
+        directories = await directory_crud.get_children(db=db, user_id=user.id, parent_id=directory_id, after=after,
+                                                        limit=limit + 1)
+        children = [{'type': 'directory', 'id': child.id, 'name': child.path.rsplit('/', 1)[-1], 'path': child.path,
+                     'size': child.total_size, 'file_count': child.file_count, 'updated_at': child.updated_at}
+                    for child in directories]
+        after = None
+    if len(children) <= limit:
+        files = await file_crud.get_list_by_directory(db=db, user=user, directory_id=directory_id, after=after,
+                                                      limit=limit + 1 - len(children))
+        children += [{'type': 'file', 'id': child.id, 'name': child.name, 'path': child.path, 'size': child.size,
+                      'created_at': child.created_at} for child in files]
+    next_cursor = encode_children_cursor(children[limit - 1]) if len(children) > limit else None
+    return {'directory_id': directory_id, 'path': directory.path if directory else '/', 'children': children[:limit],
+            'next_cursor': next_cursor}
+
+
 def is_file(path: str) -> bool:
     return os.path.isfile(path)
 
 
-def get_files_paths(full_path: str) -> list:
-    result = [os.path.join(full_path, f) for f in os.listdir(full_path) if os.path.isfile(os.path.join(full_path, f))]
-    return result
+@dataclass(frozen=True)
+class WalkOptions:
+    include: tuple[str, ...] = ()
+    exclude: tuple[str, ...] = ()
+    max_depth: Optional[int] = None
+
+    def is_included(self, arcname: str) -> bool:
+        if any(fnmatch.fnmatchcase(arcname, pattern) for pattern in self.exclude):
+            return False
+        return not self.include or any(fnmatch.fnmatchcase(arcname, pattern) for pattern in self.include)
+
+    def is_pruned(self, arcname: str, depth: int) -> bool:
+        if self.max_depth is not None and depth >= self.max_depth:
+            return True
+        return any(fnmatch.fnmatchcase(arcname, pattern) for pattern in self.exclude)
+
+
+def check_path(path: str) -> str:
+    if not path.startswith('/'):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Path must starts with / .')
+    normalized_path = normalize_path(path)
+    if normalized_path is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Path is not allowed.')
+    return normalized_path
+
+
+def walk_files(full_path: str, options: WalkOptions = WalkOptions()) -> Iterator[tuple[str, str]]:
+    internal_paths = get_internal_paths()
+    iterators = [(os.scandir(full_path), '', 0)]
+    try:
+        while iterators:
+            directory, prefix, depth = iterators[-1]
+            entry = next(directory, None)
+            if entry is None:
+                iterators.pop()[0].close()
+                continue
+            arcname = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if not options.is_pruned(arcname, depth) and os.path.normpath(entry.path) not in internal_paths:
+                    iterators.append((os.scandir(entry.path), arcname + '/', depth + 1))
+            elif entry.is_file(follow_symlinks=False) and options.is_included(arcname):
+                yield entry.path, arcname
+    finally:
+        for directory, _, _ in iterators:
+            directory.close()
 
 
 async def get_path_by_id(db: AsyncSession, obj_id: str, redis_cache: RedisCacheBackend) -> str:
@@ -47,60 +250,295 @@ async def get_path_by_id(db: AsyncSession, obj_id: str, redis_cache: RedisCacheB
                                            data_schema=file_schema.Path, db_args=(db, obj_id), cache_expire=3600)
         if not dir_data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-        return dir_data.get()
+        return dir_data.get('path')
     return file_data.get('path')
 
 
-def compress_file(write_down_to_file: Callable, full_path: str) -> None:
+def compress_file(write_down_to_file: Callable, full_path: str, options: WalkOptions = WalkOptions()) -> None:
     if is_file(full_path):
-        write_down_to_file(full_path)
+        write_down_to_file(full_path, os.path.basename(full_path))
     else:
-        files_paths = get_files_paths(full_path)
-        for file_path in files_paths:
-            write_down_to_file(file_path)
+        for file_path, arcname in walk_files(full_path, options):
+            write_down_to_file(file_path, arcname)
+
+
+class ArchiveCancelled(Exception):
+    pass
+
 
+class ArchiveStream(io.RawIOBase):
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event, chunk_size: int):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._position = 0
 
-def zip_files(bytes_io_obj: BytesIO, full_path: str) -> tuple[io.BytesIO, str]:
-    with zipfile.ZipFile(bytes_io_obj, mode='w', compression=zipfile.ZIP_DEFLATED) as zip_compressed:
-        compress_file(write_down_to_file=zip_compressed.write, full_path=full_path)
-        zip_compressed.close()
-    return bytes_io_obj, 'application/x-zip-compressed'
+    def writable(self) -> bool:
+        return True
 
+    def tell(self) -> int:
+        return self._position
 
-def tar_files(bytes_io_obj: BytesIO, full_path: str) -> tuple[io.BytesIO, str]:
-    with tarfile.open(fileobj=bytes_io_obj, mode='w:gz') as tar_compressed:
-        compress_file(write_down_to_file=tar_compressed.add, full_path=full_path)
-        tar_compressed.close()
-    return bytes_io_obj, 'application/x-gtar'
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self._chunk_size:
+            self._put(bytes(self._buffer[:self._chunk_size]))
+            del self._buffer[:self._chunk_size]
+        return len(data)
 
+    def close(self) -> None:
+        if not self.closed and self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        super().close()
 
-def seven_zip_files(bytes_io_obj: BytesIO, full_path: str) -> tuple[io.BytesIO, str]:
-    with py7zr.SevenZipFile(bytes_io_obj, mode='w') as seven_zip:
-        compress_file(write_down_to_file=seven_zip.write, full_path=full_path)
-    return bytes_io_obj, 'application/x-7z-compressed'
+    def _put(self, chunk: bytes) -> None:
+        put_chunk(chunks=self._chunks, cancelled=self._cancelled, chunk=chunk)
+
+
+def put_chunk(chunks: queue.Queue, cancelled: threading.Event, chunk: Optional[bytes | Exception]) -> None:
+    while True:
+        if cancelled.is_set():
+            raise ArchiveCancelled
+        try:
+            chunks.put(chunk, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    def __init__(self, fileobj: BinaryIO, level: int, workers: int, block_size: int):
+        self._fileobj = fileobj
+        self._level = level
+        self._block_size = block_size
+        self._max_pending = workers * 2
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pgzip')
+        self._pending: deque[Future] = deque()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer[:self._block_size]))
+            del self._buffer[:self._block_size]
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._fileobj.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown(cancel_futures=True)
+            super().close()
+
+    def _submit(self, block: bytes) -> None:
+        self._pending.append(self._executor.submit(gzip.compress, block, compresslevel=self._level, mtime=0))
+        while len(self._pending) > self._max_pending:
+            self._fileobj.write(self._pending.popleft().result())
+
+
+def zip_files(fileobj: BinaryIO, full_path: str, level: Optional[int] = None,
+              options: WalkOptions = WalkOptions()) -> None:
+    compression = zipfile.ZIP_STORED if level == 0 else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(fileobj, mode='w', compression=compression, compresslevel=level) as zip_compressed:
+        compress_file(write_down_to_file=zip_compressed.write, full_path=full_path, options=options)
+
+
+def tar_to(fileobj: BinaryIO, full_path: str, options: WalkOptions) -> None:
+    with tarfile.open(fileobj=fileobj, mode='w|', bufsize=settings.archive_chunk_size) as tar_compressed:
+        compress_file(write_down_to_file=functools.partial(tar_compressed.add, recursive=False), full_path=full_path,
+                      options=options)
+
+
+def tar_files(fileobj: BinaryIO, full_path: str, level: Optional[int] = None,
+              options: WalkOptions = WalkOptions()) -> None:
+    with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=9 if level is None else level, mtime=0) as gz:
+        tar_to(gz, full_path, options)
+
+
+def tar_zstd_files(fileobj: BinaryIO, full_path: str, level: Optional[int] = None,
+                   options: WalkOptions = WalkOptions()) -> None:
+    option = {pyzstd.CParameter.compressionLevel: level or 3, pyzstd.CParameter.nbWorkers: settings.compression_threads}
+    with pyzstd.ZstdFile(fileobj, mode='w', level_or_option=option) as zst:
+        tar_to(zst, full_path, options)
+
+
+def tar_parallel_gzip_files(fileobj: BinaryIO, full_path: str, level: Optional[int] = None,
+                            options: WalkOptions = WalkOptions()) -> None:
+    with ParallelGzipWriter(fileobj, level=6 if level is None else level, workers=settings.compression_threads,
+                            block_size=settings.pgzip_block_size) as gz:
+        tar_to(gz, full_path, options)
+
+
+def tar_store_files(fileobj: BinaryIO, full_path: str, level: Optional[int] = None,
+                    options: WalkOptions = WalkOptions()) -> None:
+    tar_to(fileobj, full_path, options)
+
+
+def seven_zip_files(fileobj: BinaryIO, full_path: str, level: Optional[int] = None,
+                    options: WalkOptions = WalkOptions()) -> None:
+    filters = None if level is None else [{'id': py7zr.FILTER_LZMA2, 'preset': level}]
+    with tempfile.TemporaryFile(dir=settings.files_path) as spool:
+        with py7zr.SevenZipFile(spool, mode='w', filters=filters) as seven_zip:
+            compress_file(write_down_to_file=seven_zip.write, full_path=full_path, options=options)
+        spool.seek(0)
+        shutil.copyfileobj(spool, fileobj, settings.archive_chunk_size)
 
 
 COMPRESSION_TYPE = {
     'zip': zip_files,
     'tar': tar_files,
-    '7z': seven_zip_files
+    '7z': seven_zip_files,
+    'tar.zst': tar_zstd_files,
+    'pgzip': tar_parallel_gzip_files,
+    'store': tar_store_files,
 }
 
+MEDIA_TYPE = {
+    'zip': 'application/x-zip-compressed',
+    'tar': 'application/x-gtar',
+    '7z': 'application/x-7z-compressed',
+    'tar.zst': 'application/zstd',
+    'pgzip': 'application/gzip',
+    'store': 'application/x-tar',
+}
+
+FILE_EXTENSION = {
+    'zip': 'zip',
+    'tar': 'tar.gz',
+    '7z': '7z',
+    'tar.zst': 'tar.zst',
+    'pgzip': 'tar.gz',
+    'store': 'tar',
+}
+
+COMPRESSION_LEVELS = {
+    'zip': (0, 9),
+    'tar': (0, 9),
+    '7z': (0, 9),
+    'tar.zst': (1, 22),
+    'pgzip': (0, 9),
+    'store': (0, 0),
+}
+
+
+def check_compression_level(compression_type: str, level: Optional[int]) -> None:
+    if level is None:
+        return
+    lowest, highest = COMPRESSION_LEVELS[compression_type]
+    if not lowest <= level <= highest:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail='Level for {} must be between {} and {}.'.format(compression_type, lowest, highest))
 
-def compress_by_full_path(bytes_io_obj: BytesIO, path: str, compression_type: str):
-    full_path = get_full_path(path=path)
-    bytes_io_obj, media_type = COMPRESSION_TYPE[compression_type](bytes_io_obj, full_path)
-    return bytes_io_obj, media_type
 
+def compress_by_full_path(chunks: queue.Queue, cancelled: threading.Event, full_path: str, compression_type: str,
+                          level: Optional[int] = None, options: WalkOptions = WalkOptions()) -> None:
+    try:
+        with ArchiveStream(chunks=chunks, cancelled=cancelled, chunk_size=settings.archive_chunk_size) as stream:
+            COMPRESSION_TYPE[compression_type](stream, full_path, level, options)
+    except ArchiveCancelled:
+        return
+    except Exception as exc:
+        result = exc
+    else:
+        result = None
+    try:
+        put_chunk(chunks=chunks, cancelled=cancelled, chunk=result)
+    except ArchiveCancelled:
+        pass
+
+
+async def iter_archive(full_path: str, compression_type: str, level: Optional[int] = None,
+                       options: WalkOptions = WalkOptions(),
+                       slot: Optional[CompressionSlot] = None) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    with slot or compression_executor.acquire():
+        chunks, cancelled = compression_executor.channel(maxsize=settings.archive_queue_size)
+        job = compression_executor.submit(chunks, compress_by_full_path, chunks, cancelled, full_path, compression_type,
+                                          level, options)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, chunks.get)
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    logger.error('Archive %s of %s failed: %s', compression_type, full_path, chunk)
+                    raise chunk
+                ARCHIVE_BYTES.labels(compression_type).inc(len(chunk))
+                yield chunk
+        finally:
+            ARCHIVE_LATENCY.labels(compression_type).observe(time.perf_counter() - started)
+            job.cancel()
+            cancelled.set()
+            try:
+                chunks.put_nowait(None)
+            except queue.Full:
+                pass
+
+
+async def get_content_version(db: AsyncSession, path: str) -> Optional[str]:
+    file_obj = await file_crud.get_file_by_path(db=db, file_path=path)
+    if file_obj is not None:
+        return file_obj.hash
+    # Every user sharing the path has their own tree row, and the archive covers all of them.
+    versions = await directory_crud.get_versions_by_path(db=db, dir_path=path)
+    if versions:
+        return ','.join('{}:{}'.format(dir_id, version) for dir_id, version in versions)
+    return None
 
-async def get_updated_io_obj_with_media_type(db: AsyncSession, redis_cache: RedisCacheBackend, path: str, compression_type: str) -> tuple[BytesIO, str]:
-    bytes_io_obj = BytesIO()
-    if path.find('/') == -1:
+
+async def resolve_archive_path(db: AsyncSession, redis_cache: RedisCacheBackend, path: str) -> str:
+    if parse_uuid(path) is not None:
         path = await get_path_by_id(db=db, obj_id=path, redis_cache=redis_cache)
     if not path.startswith('/'):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Path must starts with / .')
-    updated_io_obj, media_type = compress_by_full_path(bytes_io_obj=bytes_io_obj, path=path, compression_type=compression_type)
-    return updated_io_obj, media_type
+    if not await asyncio.to_thread(os.path.exists, get_full_path(path=path)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
+    return path
+
+
+async def get_archive_response(db: AsyncSession, redis_cache: RedisCacheBackend, path: str, compression_type: str,
+                               level: Optional[int], request: Request, options: WalkOptions = WalkOptions()) -> Response:
+    check_compression_level(compression_type=compression_type, level=level)
+    path = await resolve_archive_path(db=db, redis_cache=redis_cache, path=path)
+    full_path = get_full_path(path=path)
+    filename = 'archive.{}'.format(FILE_EXTENSION[compression_type])
+    headers = {'Content-Disposition': get_content_disposition(filename)}
+    version = await get_content_version(db=db, path=path) if settings.archive_cache_enabled else None
+    if version is None:
+        slot = compression_executor.try_acquire()
+        chunks = iter_archive(full_path=full_path, compression_type=compression_type, level=level, options=options,
+                              slot=slot)
+        return StreamingResponse(chunks, media_type=MEDIA_TYPE[compression_type], headers=headers,
+                                 background=BackgroundTask(slot.release))
+    cache_path = archive_cache.get_path(path=path, compression_type=compression_type, version=version,
+                                        level=level, options=repr(options))
+    stat_result = await archive_cache.get(cache_path)
+    if stat_result is not None:
+        etag = '"{}"'.format(os.path.basename(cache_path))
+        return RangeFileResponse(full_path=cache_path, stat_result=stat_result, etag=etag, filename=filename,
+                                 request=request, media_type=MEDIA_TYPE[compression_type])
+    slot = compression_executor.try_acquire()
+    chunks = iter_archive(full_path=full_path, compression_type=compression_type, level=level, options=options,
+                          slot=slot)
+    future = archive_cache.claim(cache_path)
+    if future is not None:
+        chunks = archive_cache.build(cache_path=cache_path, chunks=chunks, future=future)
+        await anext(chunks)
+    return StreamingResponse(chunks, media_type=MEDIA_TYPE[compression_type], headers=headers,
+                             background=BackgroundTask(slot.release))
 
 
 def is_downloadable(file_data: dict):
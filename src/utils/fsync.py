@@ -0,0 +1,59 @@
+import asyncio
+import os
+from typing import Optional
+
+from src.core.metrics import timed
+from src.core.settings import settings
+
+
+def fsync_path(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FsyncBatcher:
+    def __init__(self, mode: str, window: float):
+        self._mode = mode
+        self._window = window
+        self._pending: dict[str, asyncio.Future] = {}
+        self._flush: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.synced = 0
+
+    def stats(self) -> dict:
+        return {'pending': len(self._pending), 'batches': self.batches, 'synced': self.synced}
+
+    async def sync(self, path: str) -> None:
+        if self._mode == 'none':
+            return
+        if self._mode == 'file':
+            with timed('fsync'):
+                await asyncio.to_thread(fsync_path, path)
+            self.synced += 1
+            return
+        future = self._pending.get(path)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[path] = loop.create_future()
+            if self._flush is None:
+                self._flush = loop.call_later(self._window, lambda: asyncio.ensure_future(self._sync_pending()))
+        with timed('fsync'):
+            await asyncio.shield(future)
+
+    async def _sync_pending(self) -> None:
+        pending, self._pending, self._flush = self._pending, {}, None
+        results = await asyncio.gather(*(asyncio.to_thread(fsync_path, path) for path in pending),
+                                       return_exceptions=True)
+        self.batches += 1
+        self.synced += len(pending)
+        for future, result in zip(pending.values(), results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(None)
+
+
+fsync_batcher = FsyncBatcher(mode=settings.upload_fsync, window=settings.upload_fsync_window)
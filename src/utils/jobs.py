@@ -0,0 +1,387 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import suppress
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import redis.asyncio
+from fastapi import HTTPException, status
+from fastapi_cache import caches
+from fastapi_cache.backends.redis import CACHE_KEY
+
+from src.core.logger import logger
+from src.core.settings import settings
+from src.db.database import async_session
+from src.schemes.user import CurrentUser
+
+from .base import get_full_path
+from .bulk import commit_entries, extract_archive, forget_bulk_entries
+from .files import FILE_EXTENSION, MEDIA_TYPE, WalkOptions, iter_archive
+
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+PRIORITY_PATTERN = '^({})$'.format('|'.join(PRIORITIES))
+SCORE_STEP = 10 ** 13
+CLAIM_WINDOW = 100
+READ_CHUNK_SIZE = 1024 * 1024
+
+CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+for _, id in ipairs(ids) do
+    local key = ARGV[3] .. id
+    local user_id = redis.call('HGET', key, 'user_id')
+    if not user_id then
+        redis.call('ZREM', KEYS[1], id)
+    else
+        local running_key = ARGV[4] .. user_id
+        if tonumber(redis.call('GET', running_key) or '0') < tonumber(ARGV[2]) then
+            redis.call('ZREM', KEYS[1], id)
+            redis.call('INCR', running_key)
+            redis.call('EXPIRE', running_key, ARGV[6])
+            redis.call('HSET', key, 'status', 'running', 'started_at', ARGV[5])
+            redis.call('ZADD', KEYS[2], ARGV[7], id)
+            return id
+        end
+    end
+end
+return false
+"""
+
+REQUEUE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    local key = ARGV[2] .. id
+    local job = redis.call('HMGET', key, 'user_id', 'score')
+    if job[1] then
+        local running_key = ARGV[3] .. job[1]
+        if redis.call('DECR', running_key) <= 0 then
+            redis.call('DEL', running_key)
+        end
+        redis.call('HSET', key, 'status', 'queued')
+        redis.call('HDEL', key, 'started_at')
+        redis.call('EXPIRE', key, ARGV[4])
+        redis.call('ZADD', KEYS[2], job[2] or ARGV[5], id)
+    end
+end
+return #ids
+"""
+
+
+def get_job_path(job_id: str, suffix: str) -> str:
+    return os.path.join(settings.jobs_path, '{}.{}'.format(job_id, suffix))
+
+
+def remove_job_files(job_id: str) -> None:
+    with os.scandir(settings.jobs_path) as directory:
+        for entry in directory:
+            if entry.name.startswith(job_id + '.'):
+                with suppress(FileNotFoundError):
+                    os.remove(entry.path)
+
+
+def find_job_files(max_age: float) -> dict[str, list[str]]:
+    job_files = {}
+    now = time.time()
+    with suppress(FileNotFoundError), os.scandir(settings.jobs_path) as directory:
+        for entry in directory:
+            with suppress(FileNotFoundError):
+                if now - entry.stat().st_mtime > max_age:
+                    job_files.setdefault(entry.name.partition('.')[0], []).append(entry.path)
+    return job_files
+
+
+def remove_files(paths: list[str]) -> int:
+    removed = 0
+    for path in paths:
+        with suppress(FileNotFoundError):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+class JobQueue:
+    def __init__(self, redis_url: str, prefix: str, workers: int, user_concurrency: int):
+        self._redis_url = redis_url
+        self._prefix = prefix
+        self._workers = workers
+        self._user_concurrency = user_concurrency
+        self._client: Optional[redis.asyncio.Redis] = None
+        self._claim: Optional[Callable] = None
+        self._requeue: Optional[Callable] = None
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._running = 0
+
+    @property
+    def client(self) -> redis.asyncio.Redis:
+        if self._client is None:
+            self._client = redis.asyncio.from_url(self._redis_url, decode_responses=True)
+            self._claim = self._client.register_script(CLAIM_SCRIPT)
+            self._requeue = self._client.register_script(REQUEUE_SCRIPT)
+        return self._client
+
+    @property
+    def queue_key(self) -> str:
+        return '{}:queue'.format(self._prefix)
+
+    @property
+    def running_jobs_key(self) -> str:
+        return '{}:running_jobs'.format(self._prefix)
+
+    def get_key(self, job_id: str) -> str:
+        return '{}:job:{}'.format(self._prefix, job_id)
+
+    def get_running_key(self, user_id: str) -> str:
+        return '{}:running:{}'.format(self._prefix, user_id)
+
+    def stats(self) -> dict:
+        return {'running': self._running, 'workers': self._workers}
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self._workers)]
+        self._tasks.append(asyncio.create_task(self._collect()))
+        logger.info('Job queue started with %s workers', self._workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client:
+            await self._client.close()
+            self._client = None
+
+    async def submit(self, user: CurrentUser, kind: str, params: dict, priority: str = 'normal',
+                     job_id: Optional[str] = None, total: int = 0) -> dict:
+        job = {
+            'id': job_id or str(uuid.uuid4()),
+            'user_id': str(user.id),
+            'user': user.json(),
+            'kind': kind,
+            'params': json.dumps(params),
+            'priority': priority,
+            'status': 'queued',
+            'progress': 0,
+            'total': total,
+            'created_at': datetime.utcnow().isoformat(),
+        }
+        job['score'] = score = PRIORITIES[priority] * SCORE_STEP + int(time.time() * 1000)
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.hset(self.get_key(job['id']), mapping=job)
+                pipe.expire(self.get_key(job['id']), settings.job_queued_ttl)
+                pipe.zadd(self.queue_key, {job['id']: score})
+                await pipe.execute()
+        except redis.RedisError as exc:
+            logger.error('Job %s of %s was not queued: %s', job['id'], kind, exc)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Job queue is unavailable.',
+                                headers={'Retry-After': '1'})
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str, user_id: uuid.UUID) -> dict:
+        job = await self.client.hgetall(self.get_key(job_id))
+        if not job or job['user_id'] != str(user_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Job not found')
+        return job
+
+    async def set_progress(self, job_id: str, progress: int, total: Optional[int] = None) -> None:
+        fields = {'progress': progress} if total is None else {'progress': progress, 'total': total}
+        await self.client.hset(self.get_key(job_id), mapping=fields)
+
+    async def finish(self, job: dict, fields: dict) -> None:
+        fields = {**fields, 'finished_at': datetime.utcnow().isoformat()}
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self.get_key(job['id']), mapping=fields)
+            pipe.expire(self.get_key(job['id']), settings.job_result_ttl)
+            pipe.zrem(self.running_jobs_key, job['id'])
+            pipe.decr(self.get_running_key(job['user_id']))
+            *_, running = await pipe.execute()
+        if running < 0:
+            await self.client.delete(self.get_running_key(job['user_id']))
+        self._wakeup.set()
+
+    async def claim(self) -> Optional[dict]:
+        client = self.client
+        job_id = await self._claim(keys=[self.queue_key, self.running_jobs_key], args=[
+            CLAIM_WINDOW, self._user_concurrency, self.get_key(''), self.get_running_key(''),
+            datetime.utcnow().isoformat(), settings.job_timeout, time.time(),
+        ], client=client)
+        if not job_id:
+            return None
+        return await client.hgetall(self.get_key(job_id))
+
+    async def heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(settings.job_heartbeat_interval)
+            try:
+                await self.client.zadd(self.running_jobs_key, {job_id: time.time()}, xx=True)
+            except redis.RedisError as exc:
+                logger.warning('Heartbeat of job %s was not sent: %s', job_id, exc)
+
+    async def requeue_stale(self) -> int:
+        client = self.client
+        return await self._requeue(keys=[self.running_jobs_key, self.queue_key], args=[
+            time.time() - settings.job_heartbeat_timeout, self.get_key(''), self.get_running_key(''),
+            settings.job_queued_ttl, PRIORITIES['normal'] * SCORE_STEP + int(time.time() * 1000),
+        ], client=client)
+
+    async def get_active_jobs(self, job_ids: list[str]) -> set[str]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hget(self.get_key(job_id), 'status')
+            statuses = await pipe.execute()
+        return {job_id for job_id, job_status in zip(job_ids, statuses) if job_status in ('queued', 'running')}
+
+    async def collect(self) -> tuple[int, int]:
+        requeued = await self.requeue_stale()
+        if requeued:
+            self._wakeup.set()
+        job_files = await asyncio.to_thread(find_job_files, settings.job_result_ttl)
+        active = await self.get_active_jobs(list(job_files)) if job_files else set()
+        paths = [path for job_id, paths in job_files.items() if job_id not in active for path in paths]
+        return requeued, await asyncio.to_thread(remove_files, paths)
+
+    async def run(self, job: dict) -> None:
+        runner = JOB_RUNNERS[job['kind']]
+        self._running += 1
+        heartbeat = asyncio.create_task(self.heartbeat(job['id']))
+        try:
+            result = await asyncio.wait_for(runner(self, job), timeout=settings.job_timeout)
+        except asyncio.CancelledError:
+            await asyncio.shield(self.finish(job, {'status': 'failed', 'error': 'Job was interrupted.'}))
+            raise
+        except Exception as exc:
+            logger.error('Job %s of %s failed: %s', job['id'], job['kind'], exc)
+            error = getattr(exc, 'detail', None) or str(exc) or exc.__class__.__name__
+            await self.finish(job, {'status': 'failed', 'error': error})
+        else:
+            await self.finish(job, {'status': 'done', **result})
+            logger.info('Job %s of %s done', job['id'], job['kind'])
+        finally:
+            heartbeat.cancel()
+            self._running -= 1
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                job = await self.claim()
+            except redis.RedisError as exc:
+                logger.warning('Job queue is unavailable: %s', exc)
+                await asyncio.sleep(settings.job_poll_interval)
+                continue
+            if job is None:
+                self._wakeup.clear()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.job_poll_interval)
+                continue
+            try:
+                await self.run(job)
+            except Exception as exc:
+                logger.error('Job %s of %s was not finished: %s', job['id'], job['kind'], exc)
+                await asyncio.sleep(settings.job_poll_interval)
+
+    async def _collect(self) -> None:
+        while True:
+            try:
+                requeued, removed = await self.collect()
+                if requeued:
+                    logger.warning('Stale running jobs requeued: %s', requeued)
+                if removed:
+                    logger.info('Job files removed: %s', removed)
+            except Exception as exc:
+                logger.error('Job collection failed: %s', exc)
+            await asyncio.sleep(settings.job_collect_interval)
+
+
+def load_job(job: dict) -> dict:
+    result = job.get('result')
+    return {**job, 'result': json.loads(result) if result else None}
+
+
+class ProgressReporter:
+    def __init__(self, job_queue: JobQueue, job_id: str):
+        self._job_queue = job_queue
+        self._job_id = job_id
+        self._reported_at = 0.0
+
+    async def __call__(self, progress: int, total: Optional[int] = None, force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._reported_at >= settings.job_progress_interval:
+            self._reported_at = now
+            await self._job_queue.set_progress(self._job_id, progress, total)
+
+
+async def run_archive_job(job_queue: JobQueue, job: dict) -> dict:
+    params = json.loads(job['params'])
+    compression_type = params['compression_type']
+    options = WalkOptions(tuple(params['include']), tuple(params['exclude']), params['max_depth'])
+    report = ProgressReporter(job_queue, job['id'])
+    result_path = get_job_path(job['id'], FILE_EXTENSION[compression_type])
+    await asyncio.to_thread(os.makedirs, settings.jobs_path, exist_ok=True)
+    file = await asyncio.to_thread(open, result_path, 'wb')
+    written = 0
+    try:
+        async for chunk in iter_archive(full_path=get_full_path(params['path']), compression_type=compression_type,
+                                        level=params['level'], options=options):
+            await asyncio.to_thread(file.write, chunk)
+            written += len(chunk)
+            await report(written)
+    except BaseException:
+        file.close()
+        await asyncio.to_thread(remove_job_files, job['id'])
+        raise
+    await asyncio.to_thread(file.close)
+    return {'progress': written, 'total': written, 'filename': 'archive.{}'.format(FILE_EXTENSION[compression_type]),
+            'media_type': MEDIA_TYPE[compression_type], 'result_path': result_path}
+
+
+async def read_job_input(path: str, report: Callable[..., Awaitable[None]]) -> AsyncIterator[bytes]:
+    with await asyncio.to_thread(open, path, 'rb') as file:
+        read = 0
+        while data := await asyncio.to_thread(file.read, READ_CHUNK_SIZE):
+            read += len(data)
+            await report(read)
+            yield data
+
+
+async def run_bulk_archive_job(job_queue: JobQueue, job: dict) -> dict:
+    params = json.loads(job['params'])
+    user = CurrentUser.parse_raw(job['user'])
+    input_path = get_job_path(job['id'], 'input')
+    report = ProgressReporter(job_queue, job['id'])
+    try:
+        entries = await extract_archive(stream=read_job_input(input_path, report), base=params['path'],
+                                        archive_type=params['archive_type'])
+        async with async_session() as db:
+            results = await commit_entries(db=db, user=user, entries=entries)
+    finally:
+        await asyncio.to_thread(remove_job_files, job['id'])
+    await forget_bulk_entries(redis_cache=caches.get(CACHE_KEY), user_id=user.id, entries=results)
+    return {'progress': job['total'], 'result': json.dumps({'entries': results}, default=str)}
+
+
+JOB_RUNNERS = {
+    'archive': run_archive_job,
+    'bulk_archive': run_bulk_archive_job,
+}
+
+
+async def save_job_input(job_id: str, stream: AsyncIterator[bytes]) -> int:
+    await asyncio.to_thread(os.makedirs, settings.jobs_path, exist_ok=True)
+    size = 0
+    with await asyncio.to_thread(open, get_job_path(job_id, 'input'), 'wb') as file:
+        async for data in stream:
+            await asyncio.to_thread(file.write, data)
+            size += len(data)
+    return size
+
+
+job_queue = JobQueue(redis_url=settings.redis_url, prefix=settings.job_queue_prefix, workers=settings.job_workers,
+                     user_concurrency=settings.job_user_concurrency)
@@ -1,12 +1,60 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
+from src.core.settings import settings
+
 
-crypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+crypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds,
+                             bcrypt__min_rounds=settings.bcrypt_rounds, bcrypt__max_rounds=settings.bcrypt_rounds)
 
 
 def verify_password(plain_password, password):
     return crypt_context.verify(plain_password, password)
 
 
+def verify_and_update_password(plain_password, password):
+    return crypt_context.verify_and_update(plain_password, password)
+
+
 def get_hashed_password(password):
     return crypt_context.hash(password)
+
+
+class PasswordHasher:
+    def __init__(self, max_workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password')
+        self._max_pending = max_pending
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def stats(self) -> dict:
+        return {'pending': self._pending, 'max_pending': self._max_pending}
+
+    async def _run(self, func: Callable, *args: Any) -> Any:
+        if self._pending >= self._max_pending:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Too many authentication requests.',
+                                headers={'Retry-After': '1'})
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def verify(self, plain_password: str, password: str) -> bool:
+        return await self._run(verify_password, plain_password, password)
+
+    async def verify_and_update(self, plain_password: str, password: str) -> tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update_password, plain_password, password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_hashed_password, password)
+
+
+password_hasher = PasswordHasher(max_workers=settings.password_workers, max_pending=settings.password_max_pending)
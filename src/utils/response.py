@@ -0,0 +1,183 @@
+import asyncio
+import mimetypes
+import os
+import uuid
+from email.utils import formatdate
+from typing import BinaryIO, Optional
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, status
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from src.core.settings import settings
+
+from .base import get_full_path
+
+
+ZERO_COPY_EXTENSION = 'http.response.zerocopysend'
+
+
+def make_etag(digest: Optional[str], stat_result: os.stat_result) -> str:
+    if digest:
+        return '"{}"'.format(digest)
+    return '"{:x}-{:x}"'.format(stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    return any(value.strip() in (etag, '*') for value in header.split(','))
+
+
+def parse_range_part(part: str, size: int) -> Optional[tuple[int, int]]:
+    start, separator, end = part.strip().partition('-')
+    if not separator:
+        raise ValueError('Range has no separator.')
+    if not start:
+        length = int(end)
+        return (max(size - length, 0), size - 1) if length > 0 and size > 0 else None
+    first, last = int(start), int(end) if end else size - 1
+    if first >= size:
+        return None
+    if first > last:
+        raise ValueError('Range ends before it starts.')
+    return first, min(last, size - 1)
+
+
+def parse_range(header: str, size: int) -> Optional[list[tuple[int, int]]]:
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    try:
+        ranges = [part for part in (parse_range_part(part, size) for part in spec.split(',')) if part is not None]
+    except ValueError:
+        return None
+    if len(ranges) > settings.download_max_ranges:
+        return None
+    return ranges
+
+
+def get_content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return "attachment; filename*=utf-8''{}".format(quoted)
+    return 'attachment; filename="{}"'.format(filename)
+
+
+class RangeFileResponse(Response):
+    chunk_size = 256 * 1024
+
+    def __init__(self, full_path: str, stat_result: os.stat_result, etag: str, filename: str, request: Request,
+                 media_type: Optional[str] = None):
+        self.full_path = full_path
+        self.size = stat_result.st_size
+        self.send_header_only = request.method == 'HEAD'
+        self.media_type = media_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self.background = None
+        self.ranges: list[tuple[int, int]] = []
+        self.boundary = uuid.uuid4().hex
+        self.parts: list[bytes] = []
+        self.init_headers({
+            'accept-ranges': 'bytes',
+            'etag': etag,
+            'last-modified': formatdate(stat_result.st_mtime, usegmt=True),
+            'content-disposition': get_content_disposition(filename),
+        })
+        self.status_code = status.HTTP_200_OK
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            self.status_code = status.HTTP_304_NOT_MODIFIED
+            self.send_header_only = True
+            del self.headers['content-type']
+            return
+        range_header = request.headers.get('range')
+        if_range = request.headers.get('if-range')
+        if range_header and (not if_range or if_range.strip() == etag):
+            ranges = parse_range(range_header, self.size)
+            if ranges == []:
+                self.status_code = status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+                self.send_header_only = True
+                self.headers['content-range'] = 'bytes */{}'.format(self.size)
+                self.headers['content-length'] = '0'
+                return
+            if ranges:
+                self.status_code = status.HTTP_206_PARTIAL_CONTENT
+                self.ranges = ranges
+        self.set_range_headers()
+
+    def set_range_headers(self) -> None:
+        if not self.ranges:
+            self.headers['content-length'] = str(self.size)
+            return
+        if len(self.ranges) == 1:
+            start, end = self.ranges[0]
+            self.headers['content-range'] = 'bytes {}-{}/{}'.format(start, end, self.size)
+            self.headers['content-length'] = str(end - start + 1)
+            return
+        for start, end in self.ranges:
+            self.parts.append('--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'.format(
+                self.boundary, self.media_type, start, end, self.size).encode())
+        closing = '\r\n--{}--\r\n'.format(self.boundary).encode()
+        self.parts.append(closing)
+        length = sum(len(part) for part in self.parts) + sum(end - start + 1 for start, end in self.ranges)
+        length += 2 * (len(self.ranges) - 1)
+        self.headers['content-type'] = 'multipart/byteranges; boundary={}'.format(self.boundary)
+        self.headers['content-length'] = str(length)
+
+    async def send_range(self, scope: Scope, send: Send, file: BinaryIO, start: int, length: int) -> None:
+        if ZERO_COPY_EXTENSION in scope.get('extensions', {}):
+            await send({'type': ZERO_COPY_EXTENSION, 'file': file, 'offset': start, 'count': length, 'more_body': True})
+            return
+        fd = file.fileno()
+        end = start + length
+        while start < end:
+            chunk = await asyncio.to_thread(os.pread, fd, min(self.chunk_size, end - start), start)
+            if not chunk:
+                break
+            start += len(chunk)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        if self.send_header_only:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            return
+        file = await asyncio.to_thread(open, self.full_path, 'rb')
+        try:
+            if not self.ranges:
+                await self.send_range(scope, send, file, 0, self.size)
+            elif len(self.ranges) == 1:
+                start, end = self.ranges[0]
+                await self.send_range(scope, send, file, start, end - start + 1)
+            else:
+                for index, (start, end) in enumerate(self.ranges):
+                    prefix = b'\r\n' if index else b''
+                    await send({'type': 'http.response.body', 'body': prefix + self.parts[index], 'more_body': True})
+                    await self.send_range(scope, send, file, start, end - start + 1)
+                await send({'type': 'http.response.body', 'body': self.parts[-1], 'more_body': True})
+        finally:
+            await asyncio.to_thread(file.close)
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+def get_accel_response(file_data: dict, etag: str) -> Response:
+    headers = {
+        'X-Accel-Redirect': quote(settings.accel_redirect_prefix + file_data['path']),
+        'Content-Disposition': get_content_disposition(file_data['name']),
+        'ETag': etag,
+    }
+    media_type = mimetypes.guess_type(file_data['name'])[0] or 'application/octet-stream'
+    return Response(headers=headers, media_type=media_type)
+
+
+async def get_file_response(file_data: dict, request: Request) -> Response:
+    full_path = get_full_path(file_data['path'])
+    try:
+        stat_result = await asyncio.to_thread(os.stat, full_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
+    etag = make_etag(file_data.get('hash'), stat_result)
+    if settings.download_mode == 'accel':
+        return get_accel_response(file_data=file_data, etag=etag)
+    return RangeFileResponse(full_path=full_path, stat_result=stat_result, etag=etag, filename=file_data['name'],
+                             request=request)
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import math
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+
+from src.core.logger import logger
+from src.core.settings import settings
+from src.schemes.upload import UploadSessionCreate
+from src.utils.base import normalize_path
+
+
+@dataclass
+class AssembledFile:
+    filename: str
+    path: str
+
+
+def get_session_path(session_id: uuid.UUID, suffix: str) -> str:
+    return os.path.join(settings.uploads_path, '{}.{}'.format(session_id, suffix))
+
+
+def pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view, offset = view[written:], offset + written
+
+
+def allocate_session(session: dict) -> None:
+    os.makedirs(settings.uploads_path, exist_ok=True)
+    with open(get_session_path(session['id'], 'part'), 'wb') as part:
+        part.truncate(session['size'])
+    with open(get_session_path(session['id'], 'map'), 'wb') as chunks_map:
+        chunks_map.truncate(session['chunks_total'])
+    with open(get_session_path(session['id'], 'json'), 'w') as meta:
+        json.dump(session, meta)
+
+
+def read_session(session_id: uuid.UUID) -> dict | None:
+    try:
+        with open(get_session_path(session_id, 'json')) as meta:
+            return json.load(meta)
+    except FileNotFoundError:
+        return None
+
+
+def read_missing_chunks(session: dict) -> list[int]:
+    with open(get_session_path(session['id'], 'map'), 'rb') as chunks_map:
+        received = chunks_map.read()
+    return [index for index, flag in enumerate(received) if not flag]
+
+
+SESSION_SUFFIXES = ('json', 'map', 'part', 'commit')
+
+
+def remove_session_files(session_id: uuid.UUID) -> None:
+    for suffix in SESSION_SUFFIXES:
+        try:
+            os.remove(get_session_path(session_id, suffix))
+        except FileNotFoundError:
+            pass
+
+
+def get_missing_ranges(session: dict, missing_chunks: list[int]) -> list[list[int]]:
+    ranges = []
+    for index in missing_chunks:
+        start = index * session['chunk_size']
+        end = min(start + session['chunk_size'], session['size'])
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+async def create_upload_session(user_id: uuid.UUID, obj: UploadSessionCreate) -> dict:
+    chunk_size = obj.chunk_size or settings.upload_chunk_size
+    if not 0 < chunk_size <= settings.upload_max_chunk_size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Chunk size is out of range.')
+    if obj.size > settings.upload_max_size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Upload is too large.')
+    file_path = normalize_path(obj.path)
+    if file_path is None or file_path == '/':
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Path is not allowed.')
+    session = {
+        'id': str(uuid.uuid4()),
+        'user_id': str(user_id),
+        'path': file_path,
+        'size': obj.size,
+        'chunk_size': chunk_size,
+        'chunks_total': math.ceil(obj.size / chunk_size),
+        'created_at': datetime.utcnow().isoformat(),
+    }
+    await asyncio.to_thread(allocate_session, session)
+    return session
+
+
+async def get_upload_session(session_id: uuid.UUID, user_id: uuid.UUID) -> dict:
+    session = await asyncio.to_thread(read_session, session_id)
+    if not session or session['user_id'] != str(user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Upload session not found')
+    return session
+
+
+async def get_upload_status(session: dict) -> dict:
+    missing_chunks = await asyncio.to_thread(read_missing_chunks, session)
+    return {**session, 'missing_chunks': missing_chunks, 'missing_ranges': get_missing_ranges(session, missing_chunks)}
+
+
+async def write_chunk(session: dict, index: int, stream: AsyncIterator[bytes]) -> None:
+    if not 0 <= index < session['chunks_total']:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Chunk index is out of range.')
+    offset = index * session['chunk_size']
+    expected = min(session['chunk_size'], session['size'] - offset)
+    written = 0
+    buffer = bytearray()
+    try:
+        fd = await asyncio.to_thread(os.open, get_session_path(session['id'], 'part'), os.O_WRONLY)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Upload is already committed.')
+    try:
+        async for data in stream:
+            if written + len(buffer) + len(data) > expected:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Chunk is larger than expected.')
+            buffer += data
+            if len(buffer) >= settings.upload_write_buffer:
+                await asyncio.to_thread(pwrite_all, fd, bytes(buffer), offset + written)
+                written += len(buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(pwrite_all, fd, bytes(buffer), offset + written)
+            written += len(buffer)
+    finally:
+        await asyncio.to_thread(os.close, fd)
+    if written != expected:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Chunk is smaller than expected.')
+    await asyncio.to_thread(mark_chunk, session, index)
+
+
+def mark_chunk(session: dict, index: int) -> None:
+    fd = os.open(get_session_path(session['id'], 'map'), os.O_WRONLY)
+    try:
+        os.pwrite(fd, b'\x01', index)
+    finally:
+        os.close(fd)
+
+
+async def assemble_upload(session: dict) -> AssembledFile:
+    missing_chunks = await asyncio.to_thread(read_missing_chunks, session)
+    if missing_chunks:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Upload is not complete.')
+    claimed_path = get_session_path(session['id'], 'commit')
+    try:
+        await asyncio.to_thread(os.rename, get_session_path(session['id'], 'part'), claimed_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Upload is already committed.')
+    return AssembledFile(filename=session['path'].split('/')[-1], path=claimed_path)
+
+
+def release_session_files(session_id: uuid.UUID) -> None:
+    try:
+        os.rename(get_session_path(session_id, 'commit'), get_session_path(session_id, 'part'))
+    except FileNotFoundError:
+        remove_session_files(session_id)
+
+
+async def release_upload(session: dict) -> None:
+    await asyncio.to_thread(release_session_files, session['id'])
+
+
+async def remove_session(session_id: uuid.UUID) -> None:
+    await asyncio.to_thread(remove_session_files, session_id)
+
+
+def sweep_sessions(ttl: float) -> int:
+    updated: dict[str, float] = {}
+    try:
+        entries = list(os.scandir(settings.uploads_path))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        session_id, _, suffix = entry.name.partition('.')
+        if suffix not in SESSION_SUFFIXES:
+            continue
+        try:
+            updated[session_id] = max(updated.get(session_id, 0), entry.stat().st_mtime)
+        except FileNotFoundError:
+            continue
+    expired = [session_id for session_id, mtime in updated.items() if time.time() - mtime > ttl]
+    for session_id in expired:
+        remove_session_files(session_id)
+    return len(expired)
+
+
+async def sweep_sessions_periodically() -> None:
+    while True:
+        await asyncio.sleep(settings.upload_sweep_interval)
+        try:
+            swept = await asyncio.to_thread(sweep_sessions, settings.upload_session_ttl)
+            logger.info('Upload sweep removed %s stale sessions', swept)
+        except Exception as exc:
+            logger.error('Upload sweep failed: %s', exc)
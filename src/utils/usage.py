@@ -0,0 +1,196 @@
+import asyncio
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Optional
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
+from sqlalchemy import BigInteger, bindparam, func, literal, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.core.logger import logger
+from src.core.settings import settings
+from src.db.database import get_session
+from src.models.models import File, User
+from src.schemes.user import CurrentUser
+from src.services.auth import get_cached_user, get_current_user, get_token_username
+from src.utils.base import get_full_path, normalize_path
+from src.utils.cache import redis_cache
+from src.utils.directory import get_stats_deltas, update_directory_stats
+
+
+def get_quota_expression():
+    return func.coalesce(User.quota_bytes, literal(settings.user_quota, BigInteger))
+
+
+def quota_exceeded() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='Storage quota exceeded.')
+
+
+async def update_usage(db: AsyncSession, user_id: uuid.UUID, size_delta: int, count_delta: int,
+                       enforce: bool = True) -> None:
+    quota = get_quota_expression()
+    statement = update(User.__table__).where(User.id == user_id)
+    if enforce and size_delta > 0:
+        statement = statement.where(or_(quota == 0, User.used_bytes + size_delta <= quota))
+    statement = statement.values(used_bytes=User.used_bytes + size_delta, file_count=User.file_count + count_delta)
+    result = await db.execute(statement.returning(User.id))
+    if result.first() is None:
+        raise quota_exceeded()
+
+
+async def get_usage(db: AsyncSession, user_id: uuid.UUID) -> Optional[dict]:
+    statement = select(User.used_bytes, User.file_count, get_quota_expression()).where(User.id == user_id)
+    row = (await db.execute(statement)).first()
+    if row is None:
+        return None
+    used, files, quota = row
+    return {'account_id': user_id, 'used': used, 'files': files, 'allocated': quota or None,
+            'available': max(quota - used, 0) if quota else None}
+
+
+async def check_quota(db: AsyncSession, user_id: uuid.UUID, incoming: int, path: Optional[str] = None) -> None:
+    usage = await get_usage(db=db, user_id=user_id)
+    if usage is None or usage['allocated'] is None:
+        return
+    credit = 0
+    path = normalize_path(path) if path is not None else None
+    if path is not None:
+        statement = select(File.size).where(File.path == path, File.user_id == user_id)
+        credit = (await db.execute(statement)).scalar_one_or_none() or 0
+    if incoming - credit > usage['available']:
+        raise quota_exceeded()
+
+
+def get_user_quota(user: CurrentUser) -> int:
+    return settings.user_quota if user.quota_bytes is None else user.quota_bytes
+
+
+def get_declared_size(request: Request) -> Optional[int]:
+    length = request.headers.get('content-length', '')
+    return int(length) - settings.upload_quota_slack if length.isdigit() else None
+
+
+async def check_content_length(request: Request, db: AsyncSession = Depends(get_session),
+                               current_user: CurrentUser = Depends(get_current_user)) -> None:
+    incoming = get_declared_size(request)
+    if incoming is not None:
+        await check_quota(db=db, user_id=current_user.id, incoming=incoming, path=request.query_params.get('path'))
+
+
+async def check_declared_quota(request: Request) -> None:
+    incoming = get_declared_size(request)
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if incoming is None or scheme.lower() != 'bearer':
+        return
+    username = get_token_username(token)
+    current_user = await get_cached_user(redis_cache(), username) if username is not None else None
+    if current_user is None:
+        return
+    quota = get_user_quota(current_user)
+    if quota and incoming > quota:
+        raise quota_exceeded()
+
+
+class QuotaCheckedRoute(APIRoute):
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def check_quota_first(request: Request) -> Response:
+            await check_declared_quota(request)
+            return await handler(request)
+
+        return check_quota_first
+
+
+def stat_sizes(paths: list[str]) -> list[Optional[int]]:
+    sizes = []
+    for path in paths:
+        try:
+            sizes.append(os.stat(get_full_path(path)).st_size)
+        except FileNotFoundError:
+            sizes.append(None)
+    return sizes
+
+
+async def reconcile_files_batch(db: AsyncSession, after: Optional[uuid.UUID],
+                                limit: int) -> tuple[Optional[uuid.UUID], int, int]:
+    statement = select(File.id, File.path, File.size, File.user_id).order_by(File.id).limit(limit)
+    if after is not None:
+        statement = statement.where(File.id > after)
+    rows = (await db.execute(statement)).all()
+    if not rows:
+        return None, 0, 0
+    sizes = await asyncio.to_thread(stat_sizes, [path for _, path, _, _ in rows])
+    missing = [path for (_, path, _, _), size in zip(rows, sizes) if size is None]
+    fixed = [(file_id, path, size - (stored or 0), user_id)
+             for (file_id, path, stored, user_id), size in zip(rows, sizes) if size is not None and size != stored]
+    if missing:
+        logger.warning('Files missing on disk: %s', ', '.join(missing[:10]))
+    if fixed:
+        table = File.__table__
+        statement = update(table).where(table.c.id == bindparam('f_id')).values(size=table.c.size + bindparam('f_delta'))
+        await db.execute(statement, [{'f_id': file_id, 'f_delta': delta} for file_id, _, delta, _ in fixed])
+        changes = defaultdict(list)
+        for _, path, delta, user_id in fixed:
+            changes[user_id].append((path, delta, 0))
+        modified_at = datetime.utcnow()
+        for user_id, user_changes in changes.items():
+            await update_directory_stats(db=db, user_id=user_id, deltas=get_stats_deltas(user_changes),
+                                         modified_at=modified_at)
+    await db.commit()
+    return rows[-1][0], len(missing), len(fixed)
+
+
+async def reconcile_users_batch(db: AsyncSession, after: Optional[uuid.UUID],
+                                limit: int) -> tuple[Optional[uuid.UUID], int]:
+    statement = select(User.id).order_by(User.id).limit(limit)
+    if after is not None:
+        statement = statement.where(User.id > after)
+    user_ids = (await db.execute(statement)).scalars().all()
+    if not user_ids:
+        return None, 0
+    totals = (
+        select(User.id.label('user_id'), func.coalesce(func.sum(File.size), 0).label('size'),
+               func.count(File.id).label('count'))
+        .select_from(User).outerjoin(File, File.user_id == User.id)
+        .where(User.id.in_(user_ids)).group_by(User.id).subquery()
+    )
+    statement = (
+        update(User.__table__)
+        .where(User.id == totals.c.user_id)
+        .where(or_(User.used_bytes != totals.c.size, User.file_count != totals.c.count))
+        .values(used_bytes=totals.c.size, file_count=totals.c.count)
+        .returning(User.id)
+    )
+    drifted = len((await db.execute(statement)).all())
+    await db.commit()
+    return user_ids[-1], drifted
+
+
+async def reconcile_usage(db: AsyncSession, limit: int) -> dict:
+    report = {'files_missing': 0, 'files_fixed': 0, 'users_fixed': 0}
+    after, missing, fixed = await reconcile_files_batch(db=db, after=None, limit=limit)
+    while after is not None:
+        report['files_missing'] += missing
+        report['files_fixed'] += fixed
+        after, missing, fixed = await reconcile_files_batch(db=db, after=after, limit=limit)
+    after, drifted = await reconcile_users_batch(db=db, after=None, limit=limit)
+    while after is not None:
+        report['users_fixed'] += drifted
+        after, drifted = await reconcile_users_batch(db=db, after=after, limit=limit)
+    return report
+
+
+async def reconcile_usage_periodically(session_factory: Callable) -> None:
+    while True:
+        await asyncio.sleep(settings.usage_reconcile_interval)
+        try:
+            async with session_factory() as db:
+                report = await reconcile_usage(db=db, limit=settings.usage_reconcile_batch)
+            logger.info('Usage reconciled: %s', report)
+        except Exception as exc:
+            logger.error('Usage reconciliation failed: %s', exc)
@@ -6,15 +6,44 @@ from pathlib import Path
 import pytest
 import pytest_asyncio
 from fastapi_cache import caches
-from fastapi_cache.backends.redis import RedisCacheBackend
+from fastapi_cache.backends.redis import CACHE_KEY, RedisCacheBackend
 from httpx import AsyncClient
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql.base import PGCompiler
+from sqlalchemy.dialects.sqlite.base import SQLiteCompiler
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.elements import CollationClause
+from sqlalchemy.sql.functions import Function
 
+from src.core.ratelimit import rate_limiter
 from src.core.settings import settings
+from src.db.database import get_session
 from src.main import app
-from src.models.models import Base, get_session
+from src.models.models import Base
 from src.utils.cache import redis_cache
+from src.utils.executor import compression_executor
+
+
+SQLiteCompiler.returning_clause = PGCompiler.returning_clause
+
+
+@compiles(UUID, 'sqlite')
+def compile_uuid(element, compiler, **kw):
+    return 'CHAR(32)'
+
+
+@compiles(CollationClause, 'sqlite')
+def compile_collation(element, compiler, **kw):
+    return 'BINARY' if element.collation == 'C' else compiler.visit_collation(element, **kw)
+
+
+@compiles(Function, 'sqlite')
+def compile_function(element, compiler, **kw):
+    if element.name.lower() == 'greatest':
+        return 'max{}'.format(compiler.process(element.clause_expr, **kw))
+    return compiler.visit_function(element, **kw)
 
 
 def get_test_engine():
@@ -45,7 +74,7 @@ def async_session(engine):
 async def create_base(engine):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-        yield
+    yield
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
 
@@ -60,43 +89,56 @@ async def test_app(engine, create_base):
 
     app.dependency_overrides[get_session] = get_test_session
 
-    redis_cache = RedisCacheBackend(settings.redis_url_local)
-    caches.set('TEST_REDIS', redis_cache)
+    test_cache = RedisCacheBackend(settings.redis_url_local)
+    caches.set(CACHE_KEY, test_cache)
 
     def redis_test_cache():
-        return caches.get('TEST_REDIS')
+        return caches.get(CACHE_KEY)
 
     app.dependency_overrides[redis_cache] = redis_test_cache
+    rate_limiter._limits.clear()
+    compression_executor.start()
     yield app
+    compression_executor.shutdown()
+
+
+async def login(client: AsyncClient, test_user: str) -> None:
+    test_password = test_user
+    await client.post(
+        '/register/',
+        json={
+            'username': test_user,
+            'password': test_password
+        }
+    )
+    response_success = await client.post(
+        '/auth/auth',
+        json={
+            'username': test_user,
+            'password': test_password
+        }
+    )
+    token = 'Bearer ' + response_success.json()['access_token']
+    client.headers = {'Authorization': token}
 
 
 @pytest_asyncio.fixture(scope="session")
 async def auth_client(test_app):
-    test_user = 'test_user_1'
-    test_password = test_user
     async with AsyncClient(app=test_app, base_url='http://127.0.0.1:8080/api/v1') as client:
-        await client.post(
-            '/register/',
-            json={
-                'username': test_user,
-                'password': test_password
-            }
-        )
-        response_success = await client.post(
-            '/auth/',
-            json={
-                'username': test_user,
-                'password': test_password
-            }
-        )
-        token = 'Bearer ' + response_success.json()['access_token']
-        client.headers = {'Authorization': token}
+        await login(client, 'test_user_1')
+        yield client
+
+
+@pytest_asyncio.fixture(scope="session")
+async def other_client(test_app):
+    async with AsyncClient(app=test_app, base_url='http://127.0.0.1:8080/api/v1') as client:
+        await login(client, 'test_user_2')
         yield client
 
 
 @pytest_asyncio.fixture(scope="session")
 async def auth_client_with_file(auth_client):
-    file_path = Path('test_file.txt')
+    file_path = Path(__file__).parent / 'test_file.txt'
     file = {'file': file_path.open('rb')}
     await auth_client.post(
         '/files/upload',
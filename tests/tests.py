@@ -1,12 +1,40 @@
+import asyncio
+import hashlib
+import io
+import logging
 import os.path
+import queue
+import zipfile
 from http import HTTPStatus
 from datetime import datetime
 from pathlib import Path
+from types import SimpleNamespace
 
 import aiofile
 import pytest
+import redis
+from fastapi import HTTPException
+from fastapi_cache import caches
+from fastapi_cache.backends.redis import CACHE_KEY
 from httpx import AsyncClient
+from sqlalchemy import text, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from src.core.logger import DroppingQueueHandler, SamplingFilter, request_path
+from src.core.ratelimit import RateLimit, rate_limiter
 from src.core.settings import settings
+from src.db.database import TimedQueuePool, get_engine_options
+from src.models.models import User
+from src.schemes.user import User as UserSchema
+from src.services.auth import get_user_cache_key, invalidate_user, redis_user_stats, resolve_user, user_cache
+from src.utils.base import get_blob_path
+from src.utils.blob import acquire_blob, store_stream
+from src.utils.cache import CACHE_CODECS, delete_cache, get_cache, get_cache_or_data, msgpack, set_cache
+from src.utils.executor import compression_executor
+from src.utils.files import get_archive_response
+from src.utils.fsync import FsyncBatcher
+from src.utils.jobs import job_queue
+from src.utils.password import PasswordHasher
 
 
 @pytest.mark.asyncio
@@ -46,7 +74,7 @@ async def test_auth_api(test_app):
             }
         )
         response_success = await ac.post(
-            '/auth/',
+            '/auth/auth',
             json={
                 'username': test_user,
                 'password': test_password
@@ -56,7 +84,7 @@ async def test_auth_api(test_app):
         assert 'access_token' in response_success.json()
 
         response_failed = await ac.post(
-            '/auth/',
+            '/auth/auth',
             json={
                 'username': test_user,
                 'password': test_password + '1'
@@ -78,7 +106,7 @@ async def test_ping_api(test_app):
 
 @pytest.mark.asyncio
 async def test_upload_file(auth_client):
-    file_path = Path('file_for_test.txt')
+    file_path = Path(__file__).parent / 'test_file.txt'
     file = {'file': file_path.open('rb')}
     response = await auth_client.post(
         '/files/upload',
@@ -91,6 +119,17 @@ async def test_upload_file(auth_client):
     assert 'id' in response.json()
 
 
+@pytest.mark.asyncio
+async def test_upload_file_path_not_allowed(auth_client):
+    for path in ('/test/../../outside', '/.blobs', '/test/\x00'):
+        response = await auth_client.post(
+            '/files/upload',
+            params={'path': path},
+            files={'file': ('escape.txt', b'data')},
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST, path
+
+
 @pytest.mark.asyncio
 async def test_download_file(auth_client_with_file):
     request = auth_client_with_file.build_request(
@@ -104,11 +143,11 @@ async def test_download_file(auth_client_with_file):
     response = await auth_client_with_file.send(request, stream=True)
     assert response.status_code == HTTPStatus.TEMPORARY_REDIRECT
     location = response.headers['Location']
-    assert location == settings.static_url + '/test/file_for_test.txt'
+    assert location == settings.static_url + '/test/test_file.txt'
 
 
 @pytest.mark.asyncio
-async def test_download_compressed_file(auth_client_with_file):
+async def test_download_compressed_file(auth_client_with_file, tmp_path):
     request = auth_client_with_file.build_request(
         'GET',
         '/files/download',
@@ -120,7 +159,7 @@ async def test_download_compressed_file(auth_client_with_file):
     )
     response = await auth_client_with_file.send(request, stream=True)
     assert response.status_code == HTTPStatus.OK
-    result_path = '../file_test/test.zip'
+    result_path = tmp_path / 'test.zip'
 
     async with aiofile.async_open(result_path, "wb+") as afp:
         async for chunk in response.aiter_bytes():
@@ -128,3 +167,526 @@ async def test_download_compressed_file(auth_client_with_file):
     assert os.path.exists(result_path)
     assert os.path.getsize(result_path) > 5
     os.remove(result_path)
+
+
+@pytest.mark.asyncio
+async def test_chunked_upload(auth_client):
+    content = os.urandom(2500)
+    response_create = await auth_client.post(
+        '/files/uploads',
+        json={
+            'path': '/test/chunked.bin',
+            'size': len(content),
+            'chunk_size': 1000
+        }
+    )
+    assert response_create.status_code == HTTPStatus.CREATED
+    upload_id = response_create.json()['id']
+    assert response_create.json()['missing_chunks'] == [0, 1, 2]
+
+    for index in (2, 0):
+        response_chunk = await auth_client.put(
+            f'/files/uploads/{upload_id}/chunks/{index}',
+            content=content[index * 1000:(index + 1) * 1000]
+        )
+        assert response_chunk.status_code == HTTPStatus.NO_CONTENT
+
+    response_status = await auth_client.get(f'/files/uploads/{upload_id}')
+    assert response_status.json()['missing_ranges'] == [[1000, 2000]]
+    response_incomplete = await auth_client.post(f'/files/uploads/{upload_id}/commit')
+    assert response_incomplete.status_code == HTTPStatus.CONFLICT
+
+    await auth_client.put(f'/files/uploads/{upload_id}/chunks/1', content=content[1000:2000])
+    response_commit = await auth_client.post(f'/files/uploads/{upload_id}/commit')
+    assert response_commit.status_code == HTTPStatus.CREATED
+    assert response_commit.json()['size'] == len(content)
+    response_repeated = await auth_client.post(f'/files/uploads/{upload_id}/commit')
+    assert response_repeated.status_code == HTTPStatus.NOT_FOUND
+
+    response_too_large = await auth_client.post(
+        '/files/uploads',
+        json={'path': '/test/huge.bin', 'size': settings.upload_max_size + 1}
+    )
+    assert response_too_large.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+@pytest.mark.asyncio
+async def test_files_list_pagination(auth_client_with_file):
+    response_first = await auth_client_with_file.get('/files/list', params={'limit': 1, 'sort': 'created_at'})
+    assert response_first.status_code == HTTPStatus.OK
+    assert len(response_first.json()['files']) == 1
+    next_cursor = response_first.json()['next_cursor']
+    assert next_cursor
+
+    response_next = await auth_client_with_file.get(
+        '/files/list',
+        params={'limit': 1, 'sort': 'created_at', 'cursor': next_cursor}
+    )
+    assert response_next.status_code == HTTPStatus.OK
+    assert response_next.json()['files'][0]['id'] != response_first.json()['files'][0]['id']
+
+    response_invalid = await auth_client_with_file.get('/files/list', params={'cursor': next_cursor})
+    assert response_invalid.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_directory_stats(auth_client_with_file):
+    response = await auth_client_with_file.get('/directories/stats', params={'path': '/test'})
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['directory']['file_count'] >= 1
+    assert response.json()['directory']['total_size'] > 0
+
+    response_root = await auth_client_with_file.get('/directories/stats')
+    assert response_root.status_code == HTTPStatus.OK
+    assert '/test' in [child['path'] for child in response_root.json()['directories']]
+
+    response_missing = await auth_client_with_file.get('/directories/stats', params={'path': '/missing'})
+    assert response_missing.status_code == HTTPStatus.NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_files_search(auth_client_with_file):
+    response_prefix = await auth_client_with_file.get('/files/search', params={'pattern': '/test/'})
+    assert response_prefix.status_code == HTTPStatus.OK
+    assert all(item['path'].startswith('/test/') for item in response_prefix.json()['files'])
+    assert response_prefix.json()['files']
+
+    response_glob = await auth_client_with_file.get('/files/search', params={'pattern': '/test/*.txt', 'mode': 'glob'})
+    assert response_glob.status_code == HTTPStatus.OK
+    assert response_glob.json()['files']
+
+    response_mode = await auth_client_with_file.get('/files/search', params={'pattern': 'x', 'mode': 'regex'})
+    assert response_mode.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_download_compressed_file_cached(auth_client_with_file):
+    params = {'path': '/test/test_file.txt', 'compression_type': 'tar'}
+    response_build = await auth_client_with_file.get('/files/download', params=params)
+    assert response_build.status_code == HTTPStatus.OK
+
+    response_hit = await auth_client_with_file.get('/files/download', params=params)
+    assert response_hit.status_code == HTTPStatus.OK
+    assert response_hit.headers['accept-ranges'] == 'bytes'
+    assert response_hit.content == response_build.content
+
+
+@pytest.mark.asyncio
+async def test_download_compressed_file_levels(auth_client_with_file):
+    for compression_type in ('tar.zst', 'pgzip', 'store'):
+        params = {'path': '/test/test_file.txt', 'compression_type': compression_type}
+        response = await auth_client_with_file.get('/files/download', params=params)
+        assert response.status_code == HTTPStatus.OK
+        assert response.content
+
+    params = {'path': '/test/test_file.txt', 'compression_type': 'tar.zst', 'level': 19}
+    response_level = await auth_client_with_file.get('/files/download', params=params)
+    assert response_level.status_code == HTTPStatus.OK
+
+    params = {'path': '/test/test_file.txt', 'compression_type': 'zip', 'level': 19}
+    response_invalid = await auth_client_with_file.get('/files/download', params=params)
+    assert response_invalid.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_download_directory_recursive(auth_client_with_file):
+    params = {'path': '/', 'compression_type': 'zip'}
+    response = await auth_client_with_file.get('/files/download', params=params)
+    assert response.status_code == HTTPStatus.OK
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert 'test/test_file.txt' in archive.namelist()
+
+    params = {'path': '/', 'compression_type': 'zip', 'exclude': '*.txt'}
+    response_excluded = await auth_client_with_file.get('/files/download', params=params)
+    assert response_excluded.status_code == HTTPStatus.OK
+    with zipfile.ZipFile(io.BytesIO(response_excluded.content)) as archive:
+        assert 'test/test_file.txt' not in archive.namelist()
+
+
+@pytest.mark.asyncio
+async def test_archive_job(auth_client_with_file):
+    params = {'path': '/test', 'compression_type': 'zip', 'priority': 'high'}
+    response_submit = await auth_client_with_file.post('/jobs/archive', params=params)
+    assert response_submit.status_code == HTTPStatus.ACCEPTED
+    job_id = response_submit.json()['id']
+    assert response_submit.json()['status'] == 'queued'
+
+    response_pending = await auth_client_with_file.get(f'/jobs/{job_id}/result')
+    assert response_pending.status_code == HTTPStatus.CONFLICT
+
+    claimed = await job_queue.claim()
+    assert claimed['id'] == job_id
+    await job_queue.run(claimed)
+
+    response_status = await auth_client_with_file.get(f'/jobs/{job_id}')
+    assert response_status.status_code == HTTPStatus.OK
+    assert response_status.json()['status'] == 'done'
+    assert response_status.json()['progress'] > 0
+
+    response_result = await auth_client_with_file.get(f'/jobs/{job_id}/result')
+    assert response_result.status_code == HTTPStatus.OK
+    with zipfile.ZipFile(io.BytesIO(response_result.content)) as archive:
+        assert 'test_file.txt' in archive.namelist()
+
+
+@pytest.mark.asyncio
+async def test_user_status(auth_client_with_file):
+    response = await auth_client_with_file.get('/user/status')
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['files'] >= 1
+    assert response.json()['used'] > 0
+    assert response.json()['available'] == response.json()['allocated'] - response.json()['used']
+
+
+@pytest.mark.asyncio
+async def test_rate_limit(auth_client_with_file, monkeypatch):
+    monkeypatch.setitem(rate_limiter._limits, 'default', RateLimit(rate=0.1, burst=1))
+    response_first = await auth_client_with_file.get('/user/status')
+    assert response_first.status_code == HTTPStatus.OK
+
+    response_limited = await auth_client_with_file.get('/user/status')
+    assert response_limited.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(response_limited.headers['retry-after']) >= 1
+
+
+@pytest.mark.asyncio
+async def test_upload_extract_archive(auth_client_with_file):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('docs/readme.txt', b'readme')
+        archive.writestr('../escape.txt', b'escape')
+    files = {'file': ('bundle.zip', buffer.getvalue())}
+    response = await auth_client_with_file.post('/files/upload', params={'path': '/extracted', 'extract': True},
+                                                files=files)
+    assert response.status_code == HTTPStatus.CREATED
+    statuses = {entry['path']: entry['status'] for entry in response.json()['entries']}
+    assert statuses['/extracted/docs/readme.txt'] == 'created'
+    assert statuses['../escape.txt'] == 'failed'
+    assert os.path.isfile(settings.files_path + '/extracted/docs/readme.txt')
+
+
+@pytest.mark.asyncio
+async def test_bulk_upload_duplicates(auth_client):
+    files = [('files', ('dup.txt', b'first')), ('files', ('dup.txt', b'second'))]
+    response = await auth_client.post('/files/bulk', params={'path': '/bulk'}, files=files)
+    assert response.status_code == HTTPStatus.CREATED
+    assert [entry['status'] for entry in response.json()['entries']] == ['failed', 'created']
+    with open(settings.files_path + '/bulk/dup.txt', 'rb') as file:
+        assert file.read() == b'second'
+    assert not os.path.exists(get_blob_path(hashlib.sha256(b'first').hexdigest()))
+
+
+@pytest.mark.asyncio
+async def test_directory_children(auth_client_with_file):
+    response_root = await auth_client_with_file.get('/directories/root/children')
+    assert response_root.status_code == HTTPStatus.OK
+    directory = next(child for child in response_root.json()['children'] if child['path'] == '/test')
+    assert directory['type'] == 'directory'
+
+    response_children = await auth_client_with_file.get(f"/directories/{directory['id']}/children")
+    assert response_children.status_code == HTTPStatus.OK
+    children = {child['name']: child for child in response_children.json()['children']}
+    assert children['test_file.txt']['size'] > 0
+
+    etag = response_children.headers['etag']
+    response_cached = await auth_client_with_file.get(f"/directories/{directory['id']}/children",
+                                                      headers={'If-None-Match': etag})
+    assert response_cached.status_code == HTTPStatus.NOT_MODIFIED
+
+
+@pytest.mark.asyncio
+async def test_upload_foreign_path(auth_client_with_file, other_client):
+    response_status = await other_client.get('/user/status')
+    response_put = await other_client.post('/files/upload', params={'path': '/test'},
+                                           files={'file': ('test_file.txt', b'overwritten')})
+    assert response_put.status_code == HTTPStatus.FORBIDDEN
+    with open(settings.files_path + '/test/test_file.txt', 'rb') as file:
+        assert file.read() != b'overwritten'
+
+    response_create = await other_client.post('/files/uploads', json={'path': '/test/test_file.txt', 'size': 11})
+    upload_id = response_create.json()['id']
+    await other_client.put(f'/files/uploads/{upload_id}/chunks/0', content=b'overwritten')
+    response_commit = await other_client.post(f'/files/uploads/{upload_id}/commit')
+    assert response_commit.status_code == HTTPStatus.FORBIDDEN
+    assert (await other_client.get('/user/status')).json()['used'] == response_status.json()['used']
+
+
+@pytest.mark.asyncio
+async def test_quota_credit_foreign_path(auth_client_with_file, other_client, async_session, monkeypatch):
+    monkeypatch.setattr(settings, 'upload_quota_slack', 0)
+    async with async_session() as db:
+        await db.execute(update(User).where(User.username == 'test_user_2').values(quota_bytes=1000, used_bytes=500))
+        await db.commit()
+    try:
+        response = await other_client.post('/files/upload', params={'path': '/test/test_file.txt'},
+                                           files={'file': ('test_file.txt', b'x' * 600)})
+        assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    finally:
+        async with async_session() as db:
+            await db.execute(update(User).where(User.username == 'test_user_2').values(quota_bytes=None, used_bytes=0))
+            await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_job_worker_survives_errors(auth_client_with_file, monkeypatch):
+    finish = job_queue.finish
+    failed = []
+
+    async def finish_once(job, fields):
+        if not failed:
+            failed.append(job)
+            raise redis.RedisError('connection lost')
+        await finish(job, fields)
+
+    monkeypatch.setattr(job_queue, 'finish', finish_once)
+    monkeypatch.setattr(settings, 'job_poll_interval', 0.01)
+    params = {'path': '/test', 'compression_type': 'zip'}
+    job_ids = [(await auth_client_with_file.post('/jobs/archive', params=params)).json()['id'] for _ in range(2)]
+    worker = asyncio.create_task(job_queue._work())
+    try:
+        for _ in range(500):
+            response_status = await auth_client_with_file.get(f'/jobs/{job_ids[1]}')
+            if response_status.json()['status'] == 'done':
+                break
+            await asyncio.sleep(0.01)
+        assert response_status.json()['status'] == 'done'
+        assert not worker.done()
+    finally:
+        worker.cancel()
+        await finish(failed[0], {'status': 'failed', 'error': 'Job was interrupted.'})
+
+
+@pytest.mark.asyncio
+async def test_archive_admission_burst(auth_client_with_file, async_session, monkeypatch):
+    pending = compression_executor.pending
+    monkeypatch.setattr(settings, 'archive_cache_enabled', False)
+    monkeypatch.setattr(compression_executor, '_max_pending', pending + 2)
+    responses = []
+    async with async_session() as db:
+        for _ in range(2):
+            responses.append(await get_archive_response(db=db, redis_cache=None, path='/test', compression_type='zip',
+                                                        level=None, request=None))
+        with pytest.raises(HTTPException) as exc_info:
+            await get_archive_response(db=db, redis_cache=None, path='/test', compression_type='zip', level=None,
+                                       request=None)
+    assert exc_info.value.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert compression_executor.pending == pending + 2
+
+    for response in responses:
+        await response.background()
+    assert compression_executor.pending == pending
+
+
+@pytest.mark.asyncio
+async def test_upload_blob_collected_before_link(auth_client, monkeypatch):
+    content = os.urandom(1000)
+
+    async def acquire_collected_blob(db, digest, size):
+        os.remove(get_blob_path(digest))
+        await acquire_blob(db=db, digest=digest, size=size)
+
+    monkeypatch.setattr('src.utils.file.acquire_blob', acquire_collected_blob)
+    store_stream(io.BytesIO(content))
+    response_single = await auth_client.post('/files/upload', params={'path': '/collected'},
+                                             files={'file': ('single.bin', content)})
+    assert response_single.status_code == HTTPStatus.CREATED
+
+    store_stream(io.BytesIO(content))
+    response_create = await auth_client.post('/files/uploads', json={'path': '/collected/chunked.bin',
+                                                                     'size': len(content), 'chunk_size': 1000})
+    upload_id = response_create.json()['id']
+    await auth_client.put(f'/files/uploads/{upload_id}/chunks/0', content=content)
+    response_commit = await auth_client.post(f'/files/uploads/{upload_id}/commit')
+    assert response_commit.status_code == HTTPStatus.CREATED
+    assert not os.path.exists(os.path.join(settings.uploads_path, f'{upload_id}.commit'))
+    for name in ('single.bin', 'chunked.bin'):
+        with open(settings.files_path + '/collected/' + name, 'rb') as file:
+            assert file.read() == content
+
+
+@pytest.mark.asyncio
+async def test_directory_scoped_by_user(auth_client_with_file, other_client):
+    response_before = await auth_client_with_file.get('/directories/stats', params={'path': '/test'})
+    response_upload = await other_client.post('/files/upload', params={'path': '/test/other'},
+                                              files={'file': ('mine.txt', b'mine')})
+    assert response_upload.status_code == HTTPStatus.CREATED
+
+    response_own = await auth_client_with_file.get('/directories/stats', params={'path': '/test'})
+    assert response_own.json()['directory'] == response_before.json()['directory']
+    assert '/test/other' not in [child['path'] for child in response_own.json()['directories']]
+
+    response_other = await other_client.get('/directories/stats', params={'path': '/test'})
+    assert response_other.json()['directory']['total_size'] == len(b'mine')
+    assert response_other.json()['directory']['file_count'] == 1
+    assert [child['path'] for child in response_other.json()['directories']] == ['/test/other']
+
+    directory_id = response_own.json()['directory']['id']
+    response_children = await other_client.get(f'/directories/{directory_id}/children')
+    assert response_children.status_code == HTTPStatus.NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_current_user_cached(auth_client, async_session):
+    response = await auth_client.get('/user/status')
+    assert response.status_code == HTTPStatus.OK
+    backend = caches.get(CACHE_KEY)
+    cached = await resolve_user(db=None, redis_cache=backend, username='test_user_1')
+    assert cached.username == 'test_user_1'
+
+    user_cache.delete(get_user_cache_key('test_user_1'))
+    hits = redis_user_stats['hits']
+    assert await resolve_user(db=None, redis_cache=backend, username='test_user_1') == cached
+    assert redis_user_stats['hits'] == hits + 1
+
+    await invalidate_user(redis_cache=backend, username='test_user_1')
+    misses = redis_user_stats['misses']
+    async with async_session() as db:
+        assert (await resolve_user(db=db, redis_cache=backend, username='test_user_1')).id == cached.id
+    assert redis_user_stats['misses'] == misses + 1
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_bounded():
+    hasher = PasswordHasher(max_workers=1, max_pending=1)
+    hashing = asyncio.ensure_future(hasher.hash('secret'))
+    await asyncio.sleep(0)
+    assert hasher.pending == 1
+    with pytest.raises(HTTPException) as exc_info:
+        await hasher.verify('secret', 'hash')
+    assert exc_info.value.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+    hashed = await hashing
+    assert await hasher.verify('secret', hashed)
+    assert not await hasher.verify('other', hashed)
+    assert hasher.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_download_file_ranges(auth_client_with_file, monkeypatch):
+    monkeypatch.setattr(settings, 'download_mode', 'stream')
+    content = (Path(__file__).parent / 'test_file.txt').read_bytes()
+    params = {'path': '/test/test_file.txt'}
+    response = await auth_client_with_file.get('/files/download', params=params)
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == content
+    assert response.headers['accept-ranges'] == 'bytes'
+
+    response_cached = await auth_client_with_file.get('/files/download', params=params,
+                                                      headers={'If-None-Match': response.headers['etag']})
+    assert response_cached.status_code == HTTPStatus.NOT_MODIFIED
+
+    response_range = await auth_client_with_file.get('/files/download', params=params, headers={'Range': 'bytes=1-3'})
+    assert response_range.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response_range.content == content[1:4]
+    assert response_range.headers['content-range'] == 'bytes 1-3/{}'.format(len(content))
+
+    response_suffix = await auth_client_with_file.get('/files/download', params=params, headers={'Range': 'bytes=-2'})
+    assert response_suffix.content == content[-2:]
+
+    response_outside = await auth_client_with_file.get('/files/download', params=params,
+                                                       headers={'Range': 'bytes={}-'.format(len(content))})
+    assert response_outside.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
+
+@pytest.mark.asyncio
+async def test_cache_codecs_and_tiers(test_app):
+    data = {'id': 'cached', 'size': 3, 'tags': ['a', 'b'], 'nested': {'ok': True}}
+    for name, codec_class in CACHE_CODECS.items():
+        if name == 'msgpack' and msgpack is None:
+            continue
+        codec = codec_class()
+        assert codec.decode(codec.encode(data)) == data
+
+    backend = caches.get(CACHE_KEY)
+    await set_cache(redis_cache=backend, data=data, redis_key='cache_tiers')
+    await backend.delete('cache_tiers')
+    assert await get_cache(backend, 'cache_tiers') == data
+    assert await get_cache(backend, 'cache_tiers', local=False) is None
+    await delete_cache(backend, 'cache_tiers')
+    assert await get_cache(backend, 'cache_tiers') is None
+
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(username='flight')
+
+    results = await asyncio.gather(*(get_cache_or_data(redis_key='cache_flight', redis_cache=backend, db_obj=load,
+                                                       data_schema=UserSchema) for _ in range(5)))
+    assert results == [{'username': 'flight'}] * 5
+    assert len(loads) == 1
+    await delete_cache(backend, 'cache_flight')
+
+
+@pytest.mark.asyncio
+async def test_engine_pool_options(monkeypatch):
+    monkeypatch.setattr(settings, 'db_pgbouncer', True)
+    options = get_engine_options()
+    assert options['poolclass'] is NullPool
+    assert options['connect_args'] == {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+
+    monkeypatch.setattr(settings, 'db_pgbouncer', False)
+    options = get_engine_options()
+    assert options['poolclass'] is TimedQueuePool
+    assert options['pool_size'] == settings.db_pool_size
+
+    engine = create_async_engine(os.getenv('TEST_DATABASE_URL'), poolclass=TimedQueuePool, pool_size=1,
+                                 max_overflow=0)
+    waits = TimedQueuePool.wait_count
+    try:
+        for _ in range(2):
+            async with engine.connect() as connection:
+                assert (await connection.execute(text('SELECT 1'))).scalar() == 1
+        assert engine.sync_engine.pool.checkedin() == 1
+    finally:
+        await engine.dispose()
+    assert TimedQueuePool.wait_count == waits + 2
+
+
+@pytest.mark.asyncio
+async def test_metrics(auth_client):
+    response_upload = await auth_client.post('/files/upload', params={'path': '/metrics'},
+                                             files={'file': ('metrics.txt', b'metrics')})
+    assert response_upload.status_code == HTTPStatus.CREATED
+
+    response = await auth_client.get('http://127.0.0.1:8080/metrics')
+    assert response.status_code == HTTPStatus.OK
+    assert 'stage_duration_seconds_count{stage="db_commit"}' in response.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/v1/files/upload",status="201"}' in response.text
+    assert 'upload_fsyncs{state="batches"}' in response.text
+
+
+def test_log_queue_drops_and_samples():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.addFilter(SamplingFilter({'/api/v1/ping': 0.0}))
+    record_logger = logging.getLogger('test_log_queue')
+
+    def make_record(level: int, message: str) -> logging.LogRecord:
+        return record_logger.makeRecord(record_logger.name, level, __file__, 0, message, ('value',), None)
+
+    token = request_path.set('/api/v1/ping')
+    try:
+        handler.handle(make_record(logging.INFO, 'sampled %s'))
+        assert handler.queue.empty()
+        handler.handle(make_record(logging.WARNING, 'kept %s'))
+        handler.handle(make_record(logging.WARNING, 'dropped %s'))
+    finally:
+        request_path.reset(token)
+    record = handler.queue.get_nowait()
+    assert (record.msg, record.args, record.request_path) == ('kept value', None, '/api/v1/ping')
+    assert handler.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_fsync_batched(tmp_path):
+    batcher = FsyncBatcher(mode='group', window=0.01)
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    first.mkdir()
+    second.mkdir()
+    await asyncio.gather(batcher.sync(str(first)), batcher.sync(str(first)), batcher.sync(str(second)))
+    assert batcher.stats() == {'pending': 0, 'batches': 1, 'synced': 2}
+
+    with pytest.raises(FileNotFoundError):
+        await batcher.sync(str(tmp_path / 'missing'))
+    assert batcher.batches == 2